@@ -0,0 +1,243 @@
+"""
+Local MQTT broker stand-in for the benchmarks.
+
+A small MQTT 3.1.1 broker on asyncio, enough for the CLI's client paths:
+CONNECT, PUBLISH at QoS 0/1 (acknowledged with PUBACK), SUBSCRIBE and
+UNSUBSCRIBE with + and # wildcards, PINGREQ and DISCONNECT. Messages are
+forwarded to subscribers at QoS 0; there are no retained messages, sessions
+or authentication. It runs on its own thread and listens on 127.0.0.1 only.
+
+make_test_pki creates a throwaway CA with server and client certificates
+using the openssl command line tool, so MQTTOperations can connect over TLS
+exactly as it does to AWS IoT.
+"""
+import asyncio
+import shutil
+import ssl
+import subprocess
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT topic filter matching with + and # wildcards."""
+    filter_levels = topic_filter.split('/')
+    levels = topic.split('/')
+    for index, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if index >= len(levels) or (level != '+' and level != levels[index]):
+            return False
+    return len(filter_levels) == len(levels)
+
+
+class _Session:
+    __slots__ = ('client_id', 'writer', 'filters')
+
+    def __init__(self, writer):
+        self.client_id = None
+        self.writer = writer
+        self.filters: Set[str] = set()
+
+
+class LocalBroker:
+    """MQTT broker stand-in on a background thread.
+
+    Usage:
+        broker = LocalBroker(ssl_context=context)
+        port = broker.start()
+        ...
+        broker.stop()
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, ssl_context: Optional[ssl.SSLContext] = None):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.messages = 0
+        self._sessions: Dict[str, _Session] = {}
+        self._subscribers: Set[_Session] = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self) -> int:
+        """Start listening; returns the port."""
+        self._thread = threading.Thread(target=self._run, name='bench-broker', daemon=True)
+        self._thread.start()
+        self._ready.wait(10)
+        if self._server is None:
+            raise RuntimeError("Local broker did not start")
+        return self.port
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(10)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._serve, self.host, self.port, ssl=self.ssl_context, backlog=1024))
+            self.port = self._server.sockets[0].getsockname()[1]
+        finally:
+            self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = _Session(writer)
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length) if length else b''
+                if not self._handle(session, header[0], body):
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError, ssl.SSLError):
+            # Cancelled when the broker stops with clients still connected
+            pass
+        finally:
+            self._subscribers.discard(session)
+            if session.client_id is not None and self._sessions.get(session.client_id) is session:
+                del self._sessions[session.client_id]
+            writer.close()
+
+    def _handle(self, session: _Session, first: int, body: bytes) -> bool:
+        """Handle one packet; returns False to close the connection."""
+        packet_type = first >> 4
+        writer = session.writer
+        if packet_type == PUBLISH:
+            qos = (first >> 1) & 0x03
+            topic_length = int.from_bytes(body[:2], 'big')
+            topic = body[2:2 + topic_length].decode()
+            offset = 2 + topic_length
+            if qos:
+                writer.write(bytes((PUBACK << 4, 2)) + body[offset:offset + 2])
+                offset += 2
+            self.messages += 1
+            self._route(topic, body[offset:])
+        elif packet_type == PUBACK:
+            pass
+        elif packet_type == CONNECT:
+            # Protocol name, level, flags and keepalive precede the client ID
+            name_length = int.from_bytes(body[:2], 'big')
+            offset = 2 + name_length + 4
+            id_length = int.from_bytes(body[offset:offset + 2], 'big')
+            session.client_id = body[offset + 2:offset + 2 + id_length].decode()
+            previous = self._sessions.get(session.client_id)
+            if previous is not None:
+                # Like AWS IoT, a second connection with the same client ID takes over
+                previous.writer.close()
+                self._subscribers.discard(previous)
+            self._sessions[session.client_id] = session
+            writer.write(bytes((CONNACK << 4, 2, 0, 0)))
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, bytearray()
+            while offset < len(body):
+                length = int.from_bytes(body[offset:offset + 2], 'big')
+                session.filters.add(body[offset + 2:offset + 2 + length].decode())
+                granted.append(min(body[offset + 2 + length], 1))
+                offset += 3 + length
+            self._subscribers.add(session)
+            writer.write(bytes((SUBACK << 4,)) + _encode_length(2 + len(granted)) + packet_id + bytes(granted))
+        elif packet_type == UNSUBSCRIBE:
+            packet_id, offset = body[:2], 2
+            while offset < len(body):
+                length = int.from_bytes(body[offset:offset + 2], 'big')
+                session.filters.discard(body[offset + 2:offset + 2 + length].decode())
+                offset += 2 + length
+            writer.write(bytes((UNSUBACK << 4, 2)) + packet_id)
+        elif packet_type == PINGREQ:
+            writer.write(bytes((PINGRESP << 4, 0)))
+        elif packet_type == DISCONNECT:
+            return False
+        return True
+
+    def _route(self, topic: str, payload: bytes):
+        packet = None
+        for subscriber in self._subscribers:
+            if any(topic_matches(topic_filter, topic) for topic_filter in subscriber.filters):
+                if packet is None:
+                    encoded = topic.encode()
+                    variable = len(encoded).to_bytes(2, 'big') + encoded
+                    packet = (bytes((PUBLISH << 4,)) + _encode_length(len(variable) + len(payload))
+                              + variable + payload)
+                subscriber.writer.write(packet)
+
+
+def _openssl(*args, cwd):
+    subprocess.run(['openssl'] + list(args), cwd=cwd, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def make_test_pki(directory) -> Optional[Dict[str, str]]:
+    """Create a CA, a server certificate for localhost and a client certificate.
+
+    Returns:
+        dict with 'root', 'server_cert', 'server_key', 'cert' and 'key' paths,
+        or None if the openssl command is not available
+    """
+    if shutil.which('openssl') is None:
+        return None
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    key_args = ['-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1', '-nodes']
+    _openssl('req', '-x509', *key_args, '-keyout', 'root.key', '-out', 'root.pem', '-days', '2',
+             '-subj', '/CN=rmnode-bench-ca', '-addext', 'basicConstraints=critical,CA:TRUE',
+             '-addext', 'keyUsage=critical,keyCertSign,cRLSign', cwd=directory)
+    (directory / 'server.ext').write_text(
+        "subjectAltName=DNS:localhost,IP:127.0.0.1\n"
+        "authorityKeyIdentifier=keyid\n"
+        "extendedKeyUsage=serverAuth\n")
+    (directory / 'client.ext').write_text("authorityKeyIdentifier=keyid\nextendedKeyUsage=clientAuth\n")
+    for name in ('server', 'client'):
+        _openssl('req', *key_args, '-keyout', f'{name}.key', '-out', f'{name}.csr',
+                 '-subj', f'/CN=rmnode-bench-{name}', cwd=directory)
+        _openssl('x509', '-req', '-in', f'{name}.csr', '-CA', 'root.pem', '-CAkey', 'root.key',
+                 '-CAcreateserial', '-days', '2', '-extfile', f'{name}.ext', '-out', f'{name}.crt', cwd=directory)
+    return {
+        'root': str(directory / 'root.pem'),
+        'server_cert': str(directory / 'server.crt'),
+        'server_key': str(directory / 'server.key'),
+        'cert': str(directory / 'client.crt'),
+        'key': str(directory / 'client.key'),
+    }
+
+
+def server_ssl_context(pki: Dict[str, str]) -> ssl.SSLContext:
+    """Server TLS context for make_test_pki certificates; client certificates are not checked."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(pki['server_cert'], pki['server_key'])
+    return context
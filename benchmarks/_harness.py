@@ -0,0 +1,91 @@
+"""
+Shared result reporting for the benchmarks.
+
+Every benchmark script collects named measurements in a Results object,
+prints them as a table and can save them as JSON (--json). Given a
+baseline saved by an earlier release (--baseline), measurements that got
+worse by more than --tolerance are reported and the script exits with
+status 1, so the same scripts track regressions between releases.
+"""
+import json
+import platform
+import time
+from typing import Callable, Dict, Optional
+
+
+class Results:
+    """Named benchmark measurements with units and a better direction."""
+
+    def __init__(self, suite: str):
+        self.suite = suite
+        self.metrics: Dict[str, dict] = {}
+
+    def add(self, name: str, value: float, unit: str, higher_is_better: bool = True):
+        self.metrics[name] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+        print(f"{name:<48} {value:>14,.2f} {unit}", flush=True)
+
+    def to_dict(self) -> dict:
+        return {
+            'suite': self.suite,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'metrics': self.metrics,
+        }
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def regressions(self, baseline: dict, tolerance: float) -> list:
+        """(name, baseline value, value, change) for metrics worse than the baseline by over tolerance."""
+        found = []
+        for name, old in baseline.get('metrics', {}).items():
+            new = self.metrics.get(name)
+            if new is None or not old['value']:
+                continue
+            change = (new['value'] - old['value']) / old['value']
+            worse = -change if new['higher_is_better'] else change
+            if worse > tolerance:
+                found.append((name, old['value'], new['value'], change))
+        return found
+
+
+def add_report_arguments(parser):
+    parser.add_argument('--json', metavar='FILE', help='Save the results as JSON')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare with results saved by --json earlier')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative change for the worse against --baseline (default: 0.25)')
+
+
+def finish(results: Results, options) -> int:
+    """Save and compare results as requested; returns the exit status."""
+    if options.json:
+        results.save(options.json)
+    if not options.baseline:
+        return 0
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    regressions = results.regressions(baseline, options.tolerance)
+    for name, old, new, change in regressions:
+        print(f"REGRESSION {name}: {old:,.2f} -> {new:,.2f} ({change:+.0%})")
+    if not regressions:
+        print(f"No regressions over {options.tolerance:.0%} against {options.baseline}")
+    return 1 if regressions else 0
+
+
+def rate(fn: Callable[[], int], min_time: float = 1.0, max_rounds: Optional[int] = None) -> float:
+    """Operations per second of fn, which returns how many operations it did.
+
+    fn is called repeatedly until min_time has passed and the best round is
+    reported, which filters out noise from other processes.
+    """
+    best, spent, rounds = 0.0, 0.0, 0
+    while spent < min_time and (max_rounds is None or rounds < max_rounds):
+        start = time.perf_counter()
+        count = fn()
+        elapsed = time.perf_counter() - start
+        spent += elapsed
+        rounds += 1
+        best = max(best, count / elapsed if elapsed > 0 else float('inf'))
+    return best
@@ -0,0 +1,97 @@
+"""
+Certificate discovery benchmark on synthetic node_details trees.
+
+Builds admin-cli style certificate trees (batches of 1000 node folders
+under <batch>/node_details/node-<mac>-<node_id>/ holding node.crt and
+node.key) with 1k, 10k and 100k nodes, and measures for each:
+
+  * a lookup that walks the tree (get_cert_and_key_paths without an index)
+  * the first CertIndex lookup, which scans the tree and builds the index
+  * CertIndex lookups once the index exists
+
+The certificate files are empty; only the directory layout matters here.
+
+Usage:
+    python benchmarks/bench_certs.py
+    python benchmarks/bench_certs.py --sizes 1000,10000 --json certs.json
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mqtt_cli.utils.cert_finder import get_cert_and_key_paths
+from mqtt_cli.utils.cert_index import CertIndex
+
+from _harness import Results, add_report_arguments, finish, rate
+
+NODES_PER_BATCH = 1000
+
+
+def node_id(index: int) -> str:
+    return f"BenchNode{index:07d}"
+
+
+def build_tree(base: Path, count: int):
+    """Create count node folders with empty certificate and key files."""
+    for index in range(count):
+        batch = base / f"batch-{index // NODES_PER_BATCH:04d}" / 'node_details'
+        folder = batch / f"node-{index:012X}-{node_id(index)}"
+        folder.mkdir(parents=True)
+        (folder / 'node.crt').touch()
+        (folder / 'node.key').touch()
+
+
+def bench_size(results, count, lookups, work_dir: Path):
+    base = work_dir / f"certs-{count}"
+    start = time.perf_counter()
+    build_tree(base, count)
+    print(f"  built {count:,} node folders in {time.perf_counter() - start:.1f}s", flush=True)
+    label = f"{count // 1000}k nodes"
+    last = node_id(count - 1)
+
+    start = time.perf_counter()
+    get_cert_and_key_paths(str(base), last)
+    results.add(f"walk lookup, {label}", (time.perf_counter() - start) * 1000, 'ms', higher_is_better=False)
+
+    index = CertIndex(work_dir / f"config-{count}")
+    try:
+        start = time.perf_counter()
+        get_cert_and_key_paths(str(base), last, index=index)
+        results.add(f"index first lookup (build), {label}", (time.perf_counter() - start) * 1000, 'ms',
+                    higher_is_better=False)
+
+        wanted = [node_id(random.randrange(count)) for _ in range(lookups)]
+
+        def lookup_all():
+            for node in wanted:
+                get_cert_and_key_paths(str(base), node, index=index)
+            return len(wanted)
+
+        results.add(f"index lookups, {label}", rate(lookup_all, max_rounds=3), 'lookups/s')
+    finally:
+        index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma-separated tree sizes in nodes (default: 1000,10000,100000)')
+    parser.add_argument('--lookups', type=int, default=2000, help='Indexed lookups per round (default: 2000)')
+    add_report_arguments(parser)
+    options = parser.parse_args()
+
+    random.seed(0)
+    results = Results('certs')
+    with tempfile.TemporaryDirectory() as work_dir:
+        for count in (int(size) for size in options.sizes.split(',')):
+            bench_size(results, count, options.lookups, Path(work_dir))
+    return finish(results, options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
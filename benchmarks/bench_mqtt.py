@@ -0,0 +1,151 @@
+"""
+MQTT client benchmark against a local broker stand-in.
+
+Starts the broker from _broker.py with throwaway TLS certificates and
+measures MQTTOperations, i.e. the same AWS IoT SDK code path the CLI uses
+against the cloud:
+
+  * connect latency (sequential) and connect rate (concurrent clients)
+  * publish throughput at QoS 0, QoS 1 with publish() waiting for each
+    PUBACK, and QoS 1 with publish_async() + flush()
+  * end-to-end latency from publish on one client to the message callback
+    on another
+
+Everything runs on 127.0.0.1, so the numbers show client and broker
+overhead rather than network latency. Needs the openssl command to create
+the certificates.
+
+Usage:
+    python benchmarks/bench_mqtt.py
+    python benchmarks/bench_mqtt.py --connects 200 --messages 20000 --json mqtt.json
+    python benchmarks/bench_mqtt.py --baseline mqtt.json
+"""
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mqtt_cli import mqtt_operations
+from mqtt_cli.mqtt_operations import MQTTOperations
+from mqtt_cli.utils.stats import LatencyHistogram
+
+from _broker import LocalBroker, make_test_pki, server_ssl_context
+from _harness import Results, add_report_arguments, finish, rate
+
+
+def bench_connect(results, new_client, connects, concurrency):
+    latency = LatencyHistogram()
+    clients = []
+    try:
+        for index in range(connects):
+            client = new_client(f'bench-seq-{index}')
+            clients.append(client)
+            start = time.perf_counter()
+            client.connect()
+            latency.record(time.perf_counter() - start)
+        results.add('connect latency p50 (sequential)', latency.percentile(50), 'ms', higher_is_better=False)
+        results.add('connect latency p99 (sequential)', latency.percentile(99), 'ms', higher_is_better=False)
+
+        def connect_one(index):
+            client = new_client(f'bench-par-{index}')
+            clients.append(client)
+            client.connect()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(connect_one, range(connects)))
+        elapsed = time.perf_counter() - start
+        results.add(f'connect rate ({concurrency} at once)', connects / elapsed, 'connects/s')
+    finally:
+        for client in clients:
+            client.close()
+
+
+def bench_publish(results, new_client, messages, payload):
+    client = new_client('bench-pub')
+    client.connect()
+    topic = 'node/bench-pub/params/local'
+    try:
+        def sync(qos):
+            def run():
+                for _ in range(messages):
+                    client.publish(topic, payload, qos)
+                return messages
+            return run
+
+        def pipelined():
+            futures = [client.publish_async(topic, payload, qos=1) for _ in range(messages)]
+            client.flush()
+            if not all(future.result() for future in futures):
+                raise RuntimeError("QoS 1 publish was not acknowledged")
+            return messages
+
+        results.add('publish QoS 0', rate(sync(0), max_rounds=3), 'msgs/s')
+        results.add('publish QoS 1 (publish, one PUBACK at a time)', rate(sync(1), max_rounds=3), 'msgs/s')
+        results.add('publish QoS 1 (publish_async + flush)', rate(pipelined, max_rounds=3), 'msgs/s')
+    finally:
+        client.close()
+
+
+def bench_end_to_end(results, new_client, samples, payload):
+    publisher, subscriber = new_client('bench-e2e-pub'), new_client('bench-e2e-sub')
+    received = threading.Event()
+    latency = LatencyHistogram()
+    try:
+        publisher.connect()
+        subscriber.connect()
+        subscriber.subscribe('node/bench-e2e/#', 1, lambda client, userdata, message: received.set())
+        for _ in range(samples):
+            received.clear()
+            start = time.perf_counter()
+            publisher.publish('node/bench-e2e/params/local', payload, 1)
+            if not received.wait(5):
+                raise RuntimeError("Message was not delivered to the subscriber")
+            latency.record(time.perf_counter() - start)
+        results.add('end-to-end latency p50', latency.percentile(50), 'ms', higher_is_better=False)
+        results.add('end-to-end latency p99', latency.percentile(99), 'ms', higher_is_better=False)
+    finally:
+        publisher.close()
+        subscriber.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connects', type=int, default=50, help='Clients to connect per connect test (default: 50)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Clients connecting at once (default: 16)')
+    parser.add_argument('--messages', type=int, default=5000, help='Messages per publish round (default: 5000)')
+    parser.add_argument('--samples', type=int, default=1000, help='End-to-end latency samples (default: 1000)')
+    parser.add_argument('--payload-bytes', type=int, default=100, help='Payload size (default: 100)')
+    add_report_arguments(parser)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pki_dir:
+        pki = make_test_pki(pki_dir)
+        if pki is None:
+            print("openssl not found; it is needed to create the test certificates")
+            return 1
+        broker = LocalBroker(ssl_context=server_ssl_context(pki))
+        # MQTTOperations always connects to mqtt_operations.PORT
+        mqtt_operations.PORT = broker.start()
+
+        def new_client(client_id):
+            return MQTTOperations('localhost', client_id, pki['cert'], pki['key'], pki['root'])
+
+        payload = 'x' * options.payload_bytes
+        results = Results('mqtt')
+        try:
+            bench_connect(results, new_client, options.connects, options.concurrency)
+            bench_publish(results, new_client, options.messages, payload)
+            bench_end_to_end(results, new_client, options.samples, payload)
+        finally:
+            broker.stop()
+    return finish(results, options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
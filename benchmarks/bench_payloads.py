@@ -0,0 +1,88 @@
+"""
+Payload builder throughput benchmark.
+
+Measures the code that turns CLI input into MQTT payloads, without any
+network I/O:
+
+  * create_multi_param_payload (node params with several typed values)
+  * pack_records: tsdata records for many nodes and parameters packed
+    into standard tsdata messages, as ingest and stream do
+  * convert_column + pack_column: one parameter's values as a column,
+    as tsdata batch does
+
+Usage:
+    python benchmarks/bench_payloads.py
+    python benchmarks/bench_payloads.py --records 200000 --json payloads.json
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mqtt_cli.commands.node_config import create_multi_param_payload
+from mqtt_cli.core.tscolumns import convert_column, pack_column, timestamp_column
+from mqtt_cli.core.tsdata import TSRecord, pack_records
+
+from _harness import Results, add_report_arguments, finish, rate
+
+START_TIME = 1700000000
+
+
+def bench_params(results, payloads):
+    param_data = [('Power', 'true', 'bool'), ('Brightness', '75', 'int'), ('Hue', '180.5', 'float'),
+                  ('Saturation', '40', 'int'), ('Name', 'Living room', 'string')]
+
+    def build():
+        for _ in range(payloads):
+            json.dumps(create_multi_param_payload('Light', param_data))
+        return payloads
+
+    results.add('create_multi_param_payload (5 params) + json', rate(build), 'payloads/s')
+
+
+def bench_records(results, count):
+    nodes, params = 100, 10
+    records = [TSRecord(f"node{index % nodes:04d}", f"param{index // nodes % params}", 'float',
+                        round(index * 0.37, 3), START_TIME + index // (nodes * params))
+               for index in range(count)]
+    messages = pack_records(records)
+    print(f"  {count:,} records for {nodes} nodes x {params} params -> {len(messages):,} messages", flush=True)
+
+    def pack():
+        pack_records(records)
+        return count
+
+    results.add('pack_records (float, many nodes)', rate(pack), 'records/s')
+
+
+def bench_column(results, count):
+    raw = [f"{index * 0.37:.3f}" for index in range(count)]
+
+    def pack():
+        column = convert_column(raw, 'float')
+        pack_column('node0001', 'temperature', 'float', column, timestamp_column(START_TIME, count, 1))
+        return count
+
+    results.add('convert_column + pack_column (float)', rate(pack), 'points/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--payloads', type=int, default=10000,
+                        help='Params payloads per round (default: 10000)')
+    parser.add_argument('--records', type=int, default=100000,
+                        help='Time series records per round (default: 100000)')
+    add_report_arguments(parser)
+    options = parser.parse_args()
+
+    results = Results('payloads')
+    bench_params(results, options.payloads)
+    bench_records(results, options.records)
+    bench_column(results, options.records)
+    return finish(results, options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
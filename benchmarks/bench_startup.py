@@ -0,0 +1,109 @@
+"""
+CLI startup-time regression benchmark.
+
+Runs cheap commands (--help, config-only commands) in fresh interpreters and
+checks two things:
+
+  * no heavy module (MQTT SDK, paho, requests, and for config-only commands
+    asyncio and unrelated command modules) is imported, and
+  * the median wall-clock time, minus that of a bare interpreter, stays
+    within a budget.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 20 --budget-ms 150
+
+Exits with status 1 if any check fails.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modules that only commands which actually talk to a broker may import
+SDK_MODULES = ['AWSIoTPythonSDK', 'paho', 'requests']
+
+# Commands that must stay fast, and the modules they must not import
+SCENARIOS = [
+    (['--help'], SDK_MODULES + ['asyncio', 'mqtt_cli.commands.connection', 'mqtt_cli.commands.config']),
+    (['config', '--help'], SDK_MODULES + ['asyncio', 'mqtt_cli.commands.connection']),
+    (['config', 'get-broker'], SDK_MODULES + ['asyncio', 'mqtt_cli.commands.connection']),
+    (['connection', '--help'], SDK_MODULES),
+]
+
+# Runs one command in-process and reports which watched modules got imported
+_PROBE = """
+import json, sys
+from mqtt_cli.cli import cli
+try:
+    cli.main(args=sys.argv[2:], prog_name='rmnode', standalone_mode=False)
+except SystemExit:
+    pass
+watched = json.loads(sys.argv[1])
+loaded = [m for m in watched if m in sys.modules]
+sys.stdout.write('\\n' + json.dumps(loaded))
+"""
+
+
+def loaded_modules(args, watched):
+    """Return the watched modules imported while running args."""
+    result = subprocess.run([sys.executable, '-c', _PROBE, json.dumps(watched)] + args,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def time_command(args, runs):
+    """Median wall-clock time in ms for running the CLI in a fresh interpreter."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'mqtt_cli'] + args, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _time(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='Runs per command (default: 10)')
+    parser.add_argument('--budget-ms', type=float, default=200.0,
+                        help='Maximum median startup overhead per command over a bare '
+                             'interpreter in ms (default: 200)')
+    options = parser.parse_args()
+
+    # Budgets apply on top of a bare interpreter so they hold on slow machines
+    bare = statistics.median(
+        _time(lambda: subprocess.run([sys.executable, '-c', 'pass'], check=True))
+        for _ in range(options.runs))
+    print(f"{'python -c pass':<32} {bare:8.1f} ms")
+
+    failed = False
+    with tempfile.TemporaryDirectory() as config_dir:
+        for args, forbidden in SCENARIOS:
+            args = ['--config-dir', config_dir] + args
+            label = ' '.join(args[2:])
+            loaded = loaded_modules(args, forbidden)
+            median = time_command(args, options.runs)
+            status = 'ok'
+            if loaded:
+                status = f"FAIL imported {', '.join(loaded)}"
+                failed = True
+            elif median - bare > options.budget_ms:
+                status = f"FAIL over budget of {options.budget_ms:.0f} ms"
+                failed = True
+            print(f"{'rmnode ' + label:<32} {median:8.1f} ms  {status}")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Run the whole benchmark suite.
+
+Runs bench_startup, bench_payloads, bench_certs and bench_mqtt one after
+another in fresh interpreters. With --save-dir each suite's results are
+written to <dir>/<suite>.json; with --baseline-dir they are compared with
+the files saved there by an earlier release.
+
+Usage:
+    python benchmarks/run_all.py --save-dir bench-results/1.2.0
+    python benchmarks/run_all.py --baseline-dir bench-results/1.2.0
+
+Exits with status 1 if any benchmark fails or regresses.
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+
+# Script and suite name; bench_startup checks fixed budgets and saves no results
+SUITES = [
+    ('bench_startup.py', None),
+    ('bench_payloads.py', 'payloads'),
+    ('bench_certs.py', 'certs'),
+    ('bench_mqtt.py', 'mqtt'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--save-dir', help='Directory to save <suite>.json results in')
+    parser.add_argument('--baseline-dir', help='Directory with <suite>.json results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative change for the worse against the baseline (default: 0.25)')
+    options = parser.parse_args()
+
+    if options.save_dir:
+        Path(options.save_dir).mkdir(parents=True, exist_ok=True)
+    failed = []
+    for script, suite in SUITES:
+        args = [sys.executable, str(BENCH_DIR / script)]
+        if suite and options.save_dir:
+            args += ['--json', str(Path(options.save_dir) / f"{suite}.json")]
+        if suite and options.baseline_dir:
+            baseline = Path(options.baseline_dir) / f"{suite}.json"
+            if baseline.exists():
+                args += ['--baseline', str(baseline), '--tolerance', str(options.tolerance)]
+        print(f"\n== {script}", flush=True)
+        if subprocess.run(args).returncode != 0:
+            failed.append(script)
+
+    if failed:
+        print(f"\nFailed or regressed: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,26 +2,63 @@
 MQTT CLI Main Module
 """
 import click
-import os
+import importlib
+import json
 import logging
 import sys
 from pathlib import Path
 
-# Import command groups
-from .commands.connection import connection
-from .commands.messaging import messaging
-from .commands.device import device
-from .commands.node_config import node
-from .commands.time_series import tsdata
-from .commands.ota import ota
-from .commands.user_mapping import user
-from .commands.config import config
-
 # Import utilities
 from .utils.config_manager import ConfigManager
 from .utils.connection_manager import ConnectionManager
 
-@click.group()
+class LazyGroup(click.Group):
+    """Click group that imports a subcommand's module only when it is invoked.
+    
+    Subcommands are declared as name -> (import path, short help). The short
+    help is shown by --help so listing commands imports nothing.
+    """
+    def __init__(self, *args, lazy_subcommands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_subcommands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands and cmd_name not in self.commands:
+            import_path = self.lazy_subcommands[cmd_name][0]
+            module_name, attr = import_path.rsplit(':', 1)
+            command = getattr(importlib.import_module(module_name, __package__), attr)
+            self.add_command(command, cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        rows = []
+        for name in self.list_commands(ctx):
+            if name in self.lazy_subcommands and name not in self.commands:
+                rows.append((name, self.lazy_subcommands[name][1]))
+                continue
+            command = self.get_command(ctx, name)
+            if command is not None and not command.hidden:
+                rows.append((name, command.get_short_help_str(formatter.width - 6 - len(name))))
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+@click.group(cls=LazyGroup, lazy_subcommands={
+    'agent': ('.commands.agent:agent', 'Manage the local connection agent.'),
+    'config': ('.commands.config:config', 'Manage configuration settings.'),
+    'connection': ('.commands.connection:connection', 'Manage MQTT connections.'),
+    'device': ('.commands.device:device', 'Manage device operations.'),
+    'messaging': ('.commands.messaging:messaging', 'Manage MQTT messaging operations.'),
+    'node': ('.commands.node_config:node', 'Node configuration and parameters management commands.'),
+    'ota': ('.commands.ota:ota', 'OTA update management commands.'),
+    'simulate': ('.commands.simulate:simulate', 'Run virtual nodes from one process for load tests.'),
+    'stats': ('.commands.stats:stats', 'Show MQTT connect, publish and subscribe latency stats.'),
+    'tsdata': ('.commands.time_series:tsdata', 'Manage time series data operations.'),
+    'user': ('.commands.user_mapping:user', 'Manage user-node mappings.'),
+})
 @click.option('--config-dir',
               type=click.Path(file_okay=False, dir_okay=True),
               default=click.get_app_dir('mqtt_cli'),
@@ -36,8 +73,14 @@ from .utils.connection_manager import ConnectionManager
               help='Direct certificate path to use instead of stored configuration')
 @click.option('--mac',
               help='12-digit alphanumeric MAC address to find certificates')
+@click.option('--no-agent',
+              is_flag=True,
+              help='Connect directly even if a connection agent is running')
+@click.option('--stats', 'show_stats',
+              is_flag=True,
+              help='Print MQTT latency stats as JSON to stderr on exit')
 @click.pass_context
-def cli(ctx, config_dir, debug, broker, cert_path, mac):
+def cli(ctx, config_dir, debug, broker, cert_path, mac, no_agent, show_stats):
     """MQTT CLI - A command-line interface for MQTT operations."""
     try:
         # Initialize context object
@@ -48,10 +91,10 @@ def cli(ctx, config_dir, debug, broker, cert_path, mac):
         config_dir.mkdir(parents=True, exist_ok=True)
         ctx.obj['CONFIG_DIR'] = config_dir
         
-        # Set up debug logging if requested
+        # Configure logging, with debug output if requested
+        logging.basicConfig(level=logging.DEBUG if debug else logging.INFO,
+                            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         if debug:
-            logging.basicConfig(level=logging.DEBUG, 
-                              format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
             click.echo("Debug mode enabled - detailed logging activated")
             
         # Initialize config manager
@@ -65,6 +108,12 @@ def cli(ctx, config_dir, debug, broker, cert_path, mac):
         # Store debug flag in context
         ctx.obj['DEBUG'] = debug
         
+        # Route node connections through a running agent unless disabled
+        ctx.obj['USE_AGENT'] = not no_agent
+        
+        if show_stats:
+            ctx.call_on_close(lambda: dump_stats(config_dir))
+        
         # Set up broker URL
         if broker:
             # Use broker from command line
@@ -91,15 +140,18 @@ def cli(ctx, config_dir, debug, broker, cert_path, mac):
         click.echo(click.style(f"✗ Initialization error: {str(e)}", fg='red'), err=True)
         sys.exit(1)
 
-# Add command groups
-cli.add_command(connection)
-cli.add_command(messaging)
-cli.add_command(device)
-cli.add_command(node)
-cli.add_command(tsdata)
-cli.add_command(ota)
-cli.add_command(user)
-cli.add_command(config)
+def dump_stats(config_dir):
+    """Print the stats of this run as JSON and keep them for `rmnode stats --last`."""
+    from .utils.stats import collect_stats, save_stats
+    stats = collect_stats()
+    click.echo(json.dumps(stats, indent=2), err=True)
+    if not stats['nodes']:
+        # Keep the previous dump rather than replacing it with nothing
+        return
+    try:
+        save_stats(stats, config_dir)
+    except OSError as e:
+        click.echo(click.style(f"✗ Could not save stats: {str(e)}", fg='red'), err=True)
 
 if __name__ == '__main__':
     cli()
\ No newline at end of file
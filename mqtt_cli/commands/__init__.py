@@ -1,22 +1,26 @@
 """
 MQTT CLI command modules.
 This package contains all the command modules for the MQTT CLI.
-"""
 
-from . import connection    # Connection management
-from . import messaging    # Basic MQTT operations
-from . import device       # Device management
-from . import ota         # OTA update operations
-from . import node_config  # Node configuration and presence
-from . import user_mapping # User-node mapping
-from . import time_series # Time series data operations
+Modules are imported on first access so that running one command does not
+load the others.
+"""
+import importlib
 
 __all__ = [
-    'connection',
-    'messaging',
-    'device',
-    'ota',
-    'node_config',
-    'user_mapping',
-    'time_series'
-] 
\ No newline at end of file
+    'connection',   # Connection management
+    'messaging',    # Basic MQTT operations
+    'device',       # Device management
+    'ota',          # OTA update operations
+    'node_config',  # Node configuration and presence
+    'user_mapping', # User-node mapping
+    'time_series',  # Time series data operations
+    'simulate',     # Virtual node simulator
+    'config',       # Configuration management
+    'agent'         # Connection agent
+]
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,143 @@
+"""
+Connection agent commands for MQTT CLI.
+"""
+import click
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from ..core.agent import (ConnectionAgent, get_agent_client, get_agent_pid_path,
+                          AGENT_LOG_NAME)
+from ..utils.debug_logger import debug_log
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+@click.group()
+def agent():
+    """Manage the local connection agent.
+
+    While the agent is running, commands reuse its live MQTT connections
+    instead of connecting from scratch on every invocation.
+    """
+    pass
+
+@agent.command('start')
+@click.option('--background', is_flag=True, help='Detach and run the agent in the background')
+@click.option('--wait', type=float, default=5.0, help='Seconds to wait for a background agent to come up')
+@click.pass_context
+@debug_log
+def start(ctx, background, wait):
+    """Start the connection agent.
+
+    Examples:
+    rm-node agent start
+    rm-node agent start --background
+    """
+    config_dir = ctx.obj['CONFIG_DIR']
+    if get_agent_client(config_dir):
+        click.echo(click.style("ℹ Agent is already running", fg='yellow'))
+        return 0
+
+    if background:
+        command = [sys.executable, '-m', 'mqtt_cli', '--config-dir', str(config_dir)]
+        if ctx.obj.get('DEBUG'):
+            command.append('--debug')
+        command += ['agent', 'start']
+        logger.debug(f"Spawning background agent: {command}")
+        with open(config_dir / AGENT_LOG_NAME, 'ab') as log_file:
+            subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log_file,
+                             stderr=subprocess.STDOUT, start_new_session=True)
+
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            agent_client = get_agent_client(config_dir)
+            if agent_client:
+                pid = agent_client.ping()['pid']
+                click.echo(click.style(f"✓ Agent started in background (pid {pid})", fg='green'))
+                return 0
+            time.sleep(0.1)
+        click.echo(click.style(f"✗ Agent did not start within {wait} seconds, see {config_dir / AGENT_LOG_NAME}", fg='red'), err=True)
+        sys.exit(1)
+
+    connection_agent = ConnectionAgent(config_dir)
+    # The handler runs on the main thread, which is inside serve_forever; stop()
+    # waits for serve_forever to return, so it has to run on another thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(
+        target=connection_agent.stop, name='agent-stop', daemon=True).start())
+    click.echo(click.style(f"✓ Agent listening on {connection_agent.socket_path}", fg='green'))
+    click.echo("Press Ctrl+C to stop...")
+    try:
+        connection_agent.serve_forever()
+    except KeyboardInterrupt:
+        click.echo("\nAgent stopped")
+    except Exception as e:
+        logger.debug(f"Agent failed: {str(e)}")
+        click.echo(click.style(f"✗ Agent failed: {str(e)}", fg='red'), err=True)
+        sys.exit(1)
+
+@agent.command('stop')
+@click.pass_context
+@debug_log
+def stop(ctx):
+    """Stop the connection agent and close its connections.
+
+    Example: rm-node agent stop
+    """
+    config_dir = ctx.obj['CONFIG_DIR']
+    agent_client = get_agent_client(config_dir)
+    if agent_client:
+        agent_client.shutdown()
+        click.echo(click.style("✓ Agent stopped", fg='green'))
+        return 0
+
+    # Fall back to the PID file if the socket is unresponsive
+    pid_path = get_agent_pid_path(config_dir)
+    if pid_path.exists():
+        try:
+            os.kill(int(pid_path.read_text()), signal.SIGTERM)
+            click.echo(click.style("✓ Sent stop signal to agent", fg='green'))
+            return 0
+        except (ValueError, ProcessLookupError):
+            pid_path.unlink()
+    click.echo(click.style("ℹ Agent is not running", fg='yellow'))
+
+@agent.command('status')
+@click.pass_context
+@debug_log
+def status(ctx):
+    """Show agent status and the connections it holds.
+
+    Example: rm-node agent status
+    """
+    agent_client = get_agent_client(ctx.obj['CONFIG_DIR'])
+    if not agent_client:
+        click.echo(click.style("ℹ Agent is not running", fg='yellow'))
+        return 0
+
+    info = agent_client.ping()
+    nodes = agent_client.status()
+    click.echo(click.style(f"✓ Agent running (pid {info['pid']}, uptime {int(info['uptime'])}s)", fg='green'))
+    if not nodes:
+        click.echo("No connections held by agent")
+        return 0
+
+    now = time.time()
+    click.echo("\nAgent Connections:")
+    click.echo("-" * 80)
+    click.echo(f"{'Status':<10} {'Node ID':<40} {'Up':>12} {'Last RX':>14}")
+    click.echo("-" * 80)
+    for node_id, node in nodes.items():
+        status_color = 'green' if node['connected'] else ('yellow' if node.get('reconnecting') else 'red')
+        mark = "✓" if node['connected'] else ("…" if node.get('reconnecting') else "✗")
+        since = node.get('connected_since')
+        last_rx = node.get('last_rx')
+        up = f"{int(now - since)}s" if since else "-"
+        rx = f"{now - last_rx:.1f}s ago" if last_rx else "-"
+        # Pad before styling so escape codes don't break the column
+        click.echo(f"{click.style(f'{mark:<10}', fg=status_color)} {node_id:<40} {up:>12} {rx:>14}")
+    click.echo("-" * 80)
+    return 0
@@ -5,7 +5,8 @@ import click
 import os
 import logging
 from pathlib import Path
-from ..utils.cert_finder import find_node_cert_key_pairs
+from ..utils.cert_index import CertIndex
+from ..core.spool import DROP_POLICIES, SPOOL_DIR_NAME, PublishSpool, SpoolBusyError
 from ..utils.config_manager import ConfigManager
 from ..utils.debug_logger import debug_log, debug_step
 from ..utils.connection_manager import ConnectionManager
@@ -80,9 +81,10 @@ def set_admin_cli(ctx, path, update):
         config_manager.set_admin_cli_path(str(path))
         logger.debug("Successfully set certificates path")
         
-        # Auto-discover nodes using node_details structure
+        # Rebuild the certificate index so later lookups skip the directory walk;
+        # the rebuild's walk also discovers the nodes to register
         logger.debug("Starting node auto-discovery")
-        nodes = find_node_cert_key_pairs(path)
+        nodes = CertIndex(ctx.obj['CONFIG_DIR']).rebuild(path)
         if not nodes:
             logger.debug("No nodes found in certificates directory")
             click.echo(click.style("No nodes found in certificates directory.", fg='yellow'))
@@ -97,18 +99,20 @@ def set_admin_cli(ctx, path, update):
         broker_url = config_manager.get_broker() or ctx.obj.get('BROKER')
         logger.debug(f"Using broker URL: {broker_url}")
         
-        for node_id, cert_path, key_path in nodes:
-            logger.debug(f"Processing node {node_id}")
-            existing = config_manager.get_node_paths(node_id)
-            if existing:
-                if update:
-                    logger.debug(f"Updating existing node {node_id}")
+        # Register all nodes in one transaction instead of rewriting the config per node
+        with config_manager.batch():
+            for node_id, cert_path, key_path in nodes:
+                logger.debug(f"Processing node {node_id}")
+                existing = config_manager.get_node_paths(node_id)
+                if existing:
+                    if update:
+                        logger.debug(f"Updating existing node {node_id}")
+                        config_manager.add_node(node_id, cert_path, key_path)
+                        updated_nodes.append(node_id)
+                else:
+                    logger.debug(f"Adding new node {node_id}")
                     config_manager.add_node(node_id, cert_path, key_path)
-                    updated_nodes.append(node_id)
-            else:
-                logger.debug(f"Adding new node {node_id}")
-                config_manager.add_node(node_id, cert_path, key_path)
-                new_nodes.append(node_id)
+                    new_nodes.append(node_id)
             
         # Print results
         click.echo(click.style(f"✓ Certificates path set to: {path}", fg='green'))
@@ -233,6 +237,116 @@ def remove_node(ctx, node_id):
         click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
         raise click.Abort()
 
+@config.command('set-node-store')
+@click.option('--backend', required=True, type=click.Choice(['json', 'sqlite']),
+              help='Storage for node certificate paths: json (in config.json) or sqlite (nodes.db)')
+@click.pass_context
+@debug_log
+def set_node_store(ctx, backend):
+    """Move node configurations to another storage backend.
+    
+    The sqlite backend updates one row per node instead of rewriting
+    config.json, and is recommended for large fleets.
+    
+    Example: rm-node config set-node-store --backend sqlite
+    """
+    try:
+        logger.debug(f"Switching node store to {backend}")
+        config_manager = ConfigManager(ctx.obj['CONFIG_DIR'])
+        previous = config_manager.get_node_store()
+        if previous == backend:
+            click.echo(click.style(f"ℹ Node store is already {backend}", fg='yellow'))
+            return
+        count = config_manager.set_node_store(backend)
+        logger.debug(f"Migrated {count} nodes from {previous} to {backend}")
+        click.echo(click.style(f"✓ Migrated {count} node(s) from {previous} to {backend}", fg='green'))
+    except Exception as e:
+        logger.debug(f"Error switching node store: {str(e)}")
+        click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
+        raise click.Abort()
+
+@config.command('set-spool')
+@click.option('--enable/--disable', 'enabled', default=None,
+              help='Spool publishes to disk while a node is offline')
+@click.option('--max-messages', type=click.IntRange(min=1), help='Maximum messages kept per node')
+@click.option('--max-bytes', type=click.IntRange(min=1), help='Maximum spool size per node in bytes')
+@click.option('--drop-policy', type=click.Choice(DROP_POLICIES),
+              help='Message dropped when the spool is full: oldest or newest')
+@click.option('--drain-rate', type=click.FloatRange(min=0, min_open=True),
+              help='Messages per second replayed after reconnecting')
+@click.pass_context
+@debug_log
+def set_spool(ctx, enabled, max_messages, max_bytes, drop_policy, drain_rate):
+    """Configure the offline publish spool.
+    
+    Publishes made while a node is disconnected are written to a per-node
+    log under the config directory and replayed after it reconnects.
+    
+    Example: rm-node config set-spool --max-messages 50000 --drop-policy oldest --drain-rate 50
+    """
+    try:
+        config_manager = ConfigManager(ctx.obj['CONFIG_DIR'])
+        config_manager.set_spool_settings(enabled=enabled, max_messages=max_messages, max_bytes=max_bytes,
+                                          drop_policy=drop_policy, drain_rate=drain_rate)
+        settings = config_manager.get_spool_settings()
+        logger.debug(f"Spool settings updated: {settings}")
+        click.echo(click.style("✓ Spool settings updated", fg='green'))
+        print_spool_settings(settings)
+    except Exception as e:
+        logger.debug(f"Error updating spool settings: {str(e)}")
+        click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
+        raise click.Abort()
+
+@config.command('get-spool')
+@click.pass_context
+@debug_log
+def get_spool(ctx):
+    """Show offline publish spool settings and pending messages per node.
+    
+    Example: rm-node config get-spool
+    """
+    try:
+        config_manager = ConfigManager(ctx.obj['CONFIG_DIR'])
+        settings = config_manager.get_spool_settings()
+        print_spool_settings(settings)
+
+        spool_dir = Path(ctx.obj['CONFIG_DIR']) / SPOOL_DIR_NAME
+        wal_files = sorted(spool_dir.glob('*.wal')) if spool_dir.exists() else []
+        if not wal_files:
+            click.echo(click.style("ℹ No spooled messages", fg='yellow'))
+            return
+
+        click.echo("\nSpooled Messages:")
+        click.echo("-" * 60)
+        click.echo(f"{'Node ID':<36} {'Pending':>10} {'Bytes':>12}")
+        click.echo("-" * 60)
+        for wal_file in wal_files:
+            node_id = wal_file.stem
+            try:
+                spool = PublishSpool(spool_dir, node_id, max_messages=settings['max_messages'],
+                                     max_bytes=settings['max_bytes'], drop_policy=settings['drop_policy'])
+            except SpoolBusyError:
+                click.echo(f"{node_id:<36} {'in use':>10} {wal_file.stat().st_size:>12}")
+                continue
+            try:
+                if len(spool):
+                    click.echo(f"{node_id:<36} {len(spool):>10} {spool.size_bytes:>12}")
+            finally:
+                spool.close()
+        click.echo("-" * 60)
+    except Exception as e:
+        logger.debug(f"Error reading spool: {str(e)}")
+        click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
+        raise click.Abort()
+
+def print_spool_settings(settings):
+    """Print offline publish spool settings."""
+    click.echo(f"Enabled:      {'yes' if settings['enabled'] else 'no'}")
+    click.echo(f"Max messages: {settings['max_messages']}")
+    click.echo(f"Max bytes:    {settings['max_bytes']}")
+    click.echo(f"Drop policy:  {settings['drop_policy']}")
+    click.echo(f"Drain rate:   {settings['drain_rate']:g} msg/s")
+
 @config.command('reset')
 @click.confirmation_option(prompt='Are you sure you want to reset all configuration?')
 @click.pass_context
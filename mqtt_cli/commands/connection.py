@@ -7,9 +7,12 @@ import sys
 import logging
 import json
 import os
+import threading
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
 from ..core.mqtt_client import connect_single_node, get_active_mqtt_client
+from ..core.fanout import DEFAULT_CONNECT_CONCURRENCY, connect_nodes, summarize_latencies
 from ..mqtt_operations import MQTTOperations
 from ..utils.validators import validate_broker_url, validate_node_id
 from ..utils.exceptions import MQTTConnectionError
@@ -60,6 +63,20 @@ class SharedConnectionManager:
         }
         self._save_state(state)
 
+    def register_connections(self, node_ids, broker_url):
+        """Register several connections with a single state write"""
+        if not node_ids:
+            return
+        state = self._load_state()
+        timestamp = datetime.now().isoformat()
+        for node_id in node_ids:
+            state[node_id] = {
+                'broker': broker_url,
+                'timestamp': timestamp,
+                'pid': os.getpid()
+            }
+        self._save_state(state)
+
     def unregister_connection(self, node_id):
         """Remove a connection registration"""
         state = self._load_state()
@@ -69,6 +86,13 @@ class SharedConnectionManager:
             return True
         return False
 
+    def unregister_connections(self, node_ids):
+        """Remove several connection registrations with a single state write"""
+        state = self._load_state()
+        for node_id in node_ids:
+            state.pop(node_id, None)
+        self._save_state(state)
+
     def is_connected(self, node_id):
         """Check if a node is registered as connected"""
         state = self._load_state()
@@ -146,25 +170,23 @@ async def connect_node(ctx, node_id, broker=None, timeout=None):
 @click.option('--node-id', required=True, help='Node ID to connect to')
 @click.option('--timeout', type=int, default=30, help='Connection timeout in seconds')
 @click.option('--persistent', is_flag=True, help='Keep connection alive until terminal is closed or interrupted')
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONNECT_CONCURRENCY,
+              help=f'Maximum number of nodes to connect at once (default: {DEFAULT_CONNECT_CONCURRENCY})')
 @click.pass_context
 @debug_log
-def connect(ctx, node_id, timeout, persistent):
+def connect(ctx, node_id, timeout, persistent, concurrency):
     """Connect to a node or multiple nodes.
     
     Examples:
     rm-node connection connect --node-id node123
     rm-node connection connect --node-id "node123,node456,node789"
+    rm-node connection connect --node-id "node123,node456,node789" --concurrency 100
     rm-node connection connect --node-id node123 --timeout 3600
     rm-node connection connect --node-id node123 --persistent
     """
     try:
-        # Create event loop for async operations
-        logger.debug("Creating event loop for async operations")
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
         # Split node_id if it contains commas
-        node_ids = [n.strip() for n in node_id.split(',')]
+        node_ids = [n.strip() for n in node_id.split(',') if n.strip()]
         logger.debug(f"Processing connection for nodes: {node_ids}")
         
         if timeout and not persistent:
@@ -178,58 +200,67 @@ def connect(ctx, node_id, timeout, persistent):
                 click.echo(click.style("Note: Persistent mode will be applied to all connections", fg='yellow'))
             # Override timeout to None for persistent connections
             timeout = None
-        
-        # Create tasks for each node connection
-        tasks = [connect_node(ctx, n, timeout=timeout) for n in node_ids]
-        
-        # Run all connections in parallel
-        logger.debug("Starting parallel connection tasks")
-        results = loop.run_until_complete(asyncio.gather(*tasks))
-        
-        # Keep the event loop running if we have a timeout or persistent mode
-        if (timeout and any(results)) or (persistent and any(results)):
+
+        def report(result):
+            if result.ok:
+                click.echo(click.style(f"✓ Connected to {result.node_id} ({result.elapsed_ms:.0f} ms)", fg='green'))
+            else:
+                click.echo(click.style(f"✗ Failed to connect to {result.node_id}: {result.error}", fg='red'), err=True)
+
+        # Connect all nodes on a bounded worker pool
+        logger.debug(f"Connecting {len(node_ids)} nodes with concurrency {concurrency}")
+        start = time.perf_counter()
+        results = connect_nodes(ctx, node_ids, concurrency=concurrency, on_result=report)
+        elapsed = time.perf_counter() - start
+
+        connected = [r.node_id for r in results.values() if r.ok]
+        shared_manager = SharedConnectionManager(ctx.obj['CONFIG_DIR'])
+        shared_manager.register_connections(connected, ctx.obj['BROKER'])
+
+        if len(node_ids) > 1:
+            stats = summarize_latencies(results.values())
+            click.echo(f"\nConnected {len(connected)}/{len(node_ids)} nodes in {elapsed:.2f}s")
+            if stats:
+                click.echo(f"Connect latency: min {stats['min']:.0f} ms, p50 {stats['p50']:.0f} ms, "
+                           f"p95 {stats['p95']:.0f} ms, max {stats['max']:.0f} ms")
+
+        if not connected:
+            sys.exit(1)
+
+        # Keep the connections open if we have a timeout or persistent mode
+        if timeout or persistent:
             if persistent:
                 click.echo(click.style("\nKeeping connection alive in persistent mode. Press Ctrl+C to disconnect and exit.", fg='green'))
             else:
+                disconnect_time = datetime.now() + timedelta(seconds=timeout)
+                click.echo(click.style(f"Connection will automatically close at {disconnect_time.strftime('%H:%M:%S')}", fg='yellow'))
                 click.echo(click.style("\nKeeping connection alive until timeout...", fg='yellow'))
-            
+
+            stop_event = threading.Event()
             try:
-                if persistent:
-                    # Keep running indefinitely until interrupted
-                    async def keep_alive():
-                        while True:
-                            await asyncio.sleep(1)
-                    loop.run_until_complete(keep_alive())
-                else:
-                    # Create a future to stop the event loop after timeout
-                    stop_future = loop.create_future()
-                    loop.call_later(timeout, stop_future.set_result, None)
-                    loop.run_until_complete(stop_future)
+                # Wake periodically so Ctrl+C is handled promptly
+                deadline = None if persistent else time.monotonic() + timeout
+                while not stop_event.is_set():
+                    remaining = 1.0 if deadline is None else deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    stop_event.wait(min(remaining, 1.0))
+                message = f"Auto-disconnected from {{}} after {timeout} seconds"
             except KeyboardInterrupt:
-                if persistent:
-                    click.echo("\nPersistent connection terminated by user")
-                    # Clean up connections
-                    shared_manager = SharedConnectionManager(ctx.obj['CONFIG_DIR'])
-                    connection_manager = ctx.obj['CONNECTION_MANAGER']
-                    for node in node_ids:
-                        if connection_manager.get_connection(node):
-                            connection_manager.remove_connection(node)
-                            shared_manager.unregister_connection(node)
-                            click.echo(click.style(f"✓ Disconnected from {node}", fg='green'))
-                else:
-                    click.echo("\nConnection terminated by user")
-            finally:
-                loop.stop()
-                loop.close()
-                sys.exit(0)
-        else:
-            loop.close()
-            
-        logger.debug("Event loop closed")
-        
-        # For single node, return appropriate exit code
-        if len(node_ids) == 1:
-            return 0 if results[0] else sys.exit(1)
+                click.echo("\nPersistent connection terminated by user" if persistent else "\nConnection terminated by user")
+                message = "Disconnected from {}"
+
+            connection_manager = ctx.obj['CONNECTION_MANAGER']
+            for node in connected:
+                connection_manager.remove_connection(node)
+                click.echo(click.style(f"✓ {message.format(node)}", fg='green'))
+            shared_manager.unregister_connections(connected)
+            if ctx.obj.get('NODE_ID') in connected:
+                ctx.obj['MQTT'] = None
+                ctx.obj['NODE_ID'] = None
+            sys.exit(0)
+
+        return 0
             
     except Exception as e:
         logger.debug(f"Connection error: {str(e)}")
@@ -5,7 +5,13 @@ import click
 import json
 import sys
 import logging
+import threading
+import time
+from ..core.capture import CaptureReader, CaptureWriter, replay as replay_records
+from ..core.dispatcher import topic_matches
+from ..core.mqtt_client import PublishTally, get_active_mqtt_client, get_agent
 from ..utils.exceptions import MQTTConnectionError
+from ..utils.output import DEFAULT_QUEUE_SIZE, OUTPUT_FORMATS, MessageWriter, format_message
 from ..utils.debug_logger import debug_log, debug_step
 from ..utils.connection_manager import ConnectionManager
 
@@ -72,57 +78,304 @@ def publish(ctx, topic, message, qos):
 @messaging.command('monitor')
 @click.option('--topic', required=True, help='Topic to monitor')
 @click.option('--qos', default=1, type=int, help='QoS level (0,1)')
+@click.option('--node-id', help='Node ID to monitor as (connects if needed)')
+@click.option('--format', 'output_format', type=click.Choice(OUTPUT_FORMATS), default='pretty',
+              help='Output format: pretty (indented JSON), raw (topic and payload per line) '
+                   'or ndjson (one JSON object per message, payload embedded as-is)')
+@click.option('--stats-interval', type=float, default=0,
+              help='Print message rate and write delay to stderr every N seconds (0 to disable)')
+@click.option('--queue-size', type=click.IntRange(min=1), default=DEFAULT_QUEUE_SIZE,
+              help=f'Messages buffered for output before new ones are dropped (default: {DEFAULT_QUEUE_SIZE})')
 @click.pass_context
 @debug_log
-def monitor(ctx, topic, qos):
+def monitor(ctx, topic, qos, node_id, output_format, stats_interval, queue_size):
     """Monitor messages on an MQTT topic.
     
-    Example: rm-node messaging monitor --topic my/topic/# --qos 1
+    Examples:
+    rm-node messaging monitor --topic my/topic/# --qos 1
+    rm-node messaging monitor --node-id node123 --topic "node/+/params/local" --format ndjson > messages.ndjson
+    rm-node messaging monitor --node-id node123 --topic "node/#" --stats-interval 10
     """
+    mqtt_client = None
+    writer = None
     try:
-        if 'MQTT' not in ctx.obj:
+        if node_id:
+            mqtt_client = get_active_mqtt_client(ctx, auto_connect=True, node_id=node_id)
+        else:
+            mqtt_client = ctx.obj.get('MQTT')
+        if not mqtt_client:
             logger.debug("No MQTT connection found")
-            raise Exception("Not connected. Use 'connect' first")
+            raise Exception("Not connected. Use --node-id or 'connect' first")
             
         logger.debug(f"Starting monitoring for topic pattern '{topic}' with QoS {qos}")
-        click.echo(f"Monitoring topic: {topic}")
-        click.echo("Press Ctrl+C to stop...")
+        # Status lines go to stderr so they never mix with ndjson/raw output
+        click.echo(f"Monitoring topic: {topic}", err=True)
+        click.echo("Press Ctrl+C to stop...", err=True)
+        
+        writer = MessageWriter(click.get_text_stream('stdout'), output_format, queue_size).start()
         
         def callback(client, userdata, message):
-            try:
-                logger.debug(f"Received message on topic: {message.topic}")
-                payload = message.payload.decode()
-                try:
-                    # Try to parse and pretty print JSON
-                    data = json.loads(payload)
-                    payload = json.dumps(data, indent=2)
-                    logger.debug("Message payload is valid JSON")
-                except json.JSONDecodeError:
-                    # Not JSON, use raw payload
-                    logger.debug("Message payload is not JSON format")
-                    pass
-                click.echo(f"\nTopic: {message.topic}")
-                click.echo(f"Message: {payload}")
-            except Exception as e:
-                logger.debug(f"Error processing message: {str(e)}")
-                click.echo(f"Error processing message: {str(e)}")
+            # Runs on the MQTT network thread: only hand the message over
+            writer.submit(message.topic, message.payload)
         
         logger.debug("Setting up subscription with callback")
-        ctx.obj['MQTT'].subscribe(topic=topic, qos=qos, callback=callback)
+        mqtt_client.subscribe(topic=topic, qos=qos, callback=callback)
         logger.debug("Monitoring started successfully")
         
-        # Keep the main thread alive
-        while True:
-            pass
+        # Sleep until interrupted, waking only to print stats
+        stop_event = threading.Event()
+        while not stop_event.is_set():
+            stop_event.wait(stats_interval if stats_interval > 0 else 1.0)
+            if stats_interval > 0:
+                print_monitor_stats(writer.take_stats())
             
     except KeyboardInterrupt:
         logger.debug("Monitoring stopped by user (Ctrl+C)")
-        click.echo("\nMonitoring stopped")
+        click.echo("\nMonitoring stopped", err=True)
         return 0
     except Exception as e:
         logger.debug(f"Monitor failed: {str(e)}")
         click.echo(click.style(f"✗ Monitor failed: {str(e)}", fg='red'), err=True)
         sys.exit(1)
+    finally:
+        if mqtt_client and writer:
+            try:
+                mqtt_client.unsubscribe(topic)
+            except Exception as e:
+                logger.debug(f"Unsubscribe failed: {str(e)}")
+        if writer:
+            writer.close()
+            elapsed = time.monotonic() - writer.started
+            click.echo(f"Received {writer.received} message(s) in {elapsed:.1f}s, "
+                       f"dropped {writer.dropped}", err=True)
+
+def print_monitor_stats(stats):
+    """Print one monitor stats line to stderr."""
+    line = (f"[stats] {stats['rate']:.1f} msg/s, {stats['received']} received, "
+            f"{stats['dropped']} dropped, {stats['queued']} queued")
+    if 'delay_p50_ms' in stats:
+        line += (f", write delay p50 {stats['delay_p50_ms']:.1f} ms, "
+                 f"p95 {stats['delay_p95_ms']:.1f} ms, max {stats['delay_max_ms']:.1f} ms")
+    click.echo(click.style(line, fg='yellow' if stats['dropped'] else 'blue'), err=True)
+
+@messaging.command('history')
+@click.option('--topic', default='#', help='Topic filter to show messages for (default: all topics)')
+@click.option('--last', type=click.IntRange(min=1), default=20, help='Number of most recent messages to show')
+@click.option('--since', type=float, help='Only show messages received in the last N seconds')
+@click.option('--format', 'output_format', type=click.Choice(OUTPUT_FORMATS), default='pretty',
+              help='Output format: pretty, raw or ndjson (as for monitor)')
+@click.pass_context
+@debug_log
+def history(ctx, topic, last, since, output_format):
+    """Show recently received messages.
+    
+    Messages are kept by the connection agent for every node it holds a
+    connection for, a bounded number per topic, so this needs a running
+    agent (or a connection made earlier in the same session).
+    
+    Examples:
+    rm-node messaging history --topic "node/node123/#"
+    rm-node messaging history --topic "node/+/params/remote" --last 5 --format ndjson
+    rm-node messaging history --since 60
+    """
+    try:
+        since_time = time.time() - since if since is not None else None
+        agent = get_agent(ctx)
+        if agent:
+            messages = agent.history(topic, last=last, since=since_time)
+        elif ctx.obj.get('MQTT'):
+            messages = ctx.obj['MQTT'].recent_messages(topic, last=last, since=since_time)
+        else:
+            click.echo(click.style("ℹ No message history: received messages are kept by the connection agent "
+                                   "('rm-node agent start')", fg='yellow'))
+            return 0
+        logger.debug(f"Found {len(messages)} message(s) for '{topic}'")
+        
+        if not messages:
+            click.echo(f"No messages received on {topic}", err=True)
+            return 0
+        stream = click.get_text_stream('stdout')
+        stream.write(''.join(format_message(output_format, message.timestamp, message.topic, message.payload)
+                             for message in messages))
+        stream.flush()
+        return 0
+    except Exception as e:
+        logger.debug(f"History failed: {str(e)}")
+        click.echo(click.style(f"✗ History failed: {str(e)}", fg='red'), err=True)
+        sys.exit(1)
+
+@messaging.command('record')
+@click.option('--topic', 'topics', required=True, multiple=True, help='Topic to record (repeat for several)')
+@click.option('--out', 'out_file', required=True, type=click.Path(dir_okay=False),
+              help='Capture file to append to (.rml)')
+@click.option('--qos', default=1, type=int, help='QoS level (0,1)')
+@click.option('--node-id', help='Node ID to record as (connects if needed)')
+@click.option('--duration', type=float, default=0, help='Stop after N seconds (0 to record until Ctrl+C)')
+@click.option('--max-messages', type=click.IntRange(min=1), help='Stop after N messages')
+@click.pass_context
+@debug_log
+def record(ctx, topics, out_file, qos, node_id, duration, max_messages):
+    """Record messages to a capture file for replay.
+    
+    Messages are appended with their receive time, topic, QoS and payload
+    as received to a compact binary log with a time index.
+    
+    Examples:
+    rm-node messaging record --node-id node123 --topic "node/+/params/local" --out capture.rml
+    rm-node messaging record --node-id node123 --topic "node/#" --out burst.rml --duration 300
+    """
+    mqtt_client = None
+    writer = None
+    handlers = []
+    stop_event = threading.Event()
+    try:
+        if node_id:
+            mqtt_client = get_active_mqtt_client(ctx, auto_connect=True, node_id=node_id)
+        else:
+            mqtt_client = ctx.obj.get('MQTT')
+        if not mqtt_client:
+            logger.debug("No MQTT connection found")
+            raise Exception("Not connected. Use --node-id or 'connect' first")
+        
+        writer = CaptureWriter(out_file)
+        
+        def make_callback(earlier):
+            def callback(client, userdata, message):
+                # A message matching several filters is recorded by the first one only
+                if any(topic_matches(topic_filter, message.topic) for topic_filter in earlier):
+                    return
+                # Runs on the MQTT network thread: only buffers the record
+                writer.append(message.topic, message.payload, getattr(message, 'qos', 0))
+                if max_messages and writer.count >= max_messages:
+                    stop_event.set()
+            return callback
+        
+        for index, topic in enumerate(topics):
+            logger.debug(f"Recording topic pattern '{topic}' with QoS {qos}")
+            callback = make_callback(topics[:index])
+            if not mqtt_client.add_handler(topic, callback, qos):
+                raise Exception(f"Failed to subscribe to {topic}")
+            handlers.append((topic, callback))
+        click.echo(f"Recording {', '.join(topics)} to {out_file}", err=True)
+        click.echo("Press Ctrl+C to stop...", err=True)
+        
+        deadline = time.monotonic() + duration if duration > 0 else None
+        while not stop_event.is_set():
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            stop_event.wait(1.0 if deadline is None else max(0.0, min(1.0, deadline - time.monotonic())))
+            writer.flush()
+        
+    except KeyboardInterrupt:
+        logger.debug("Recording stopped by user (Ctrl+C)")
+        click.echo("\nRecording stopped", err=True)
+    except Exception as e:
+        logger.debug(f"Record failed: {str(e)}")
+        click.echo(click.style(f"✗ Record failed: {str(e)}", fg='red'), err=True)
+        sys.exit(1)
+    finally:
+        for topic, callback in handlers:
+            try:
+                mqtt_client.remove_handler(topic, callback)
+            except Exception as e:
+                logger.debug(f"Unsubscribe failed: {str(e)}")
+        if writer:
+            writer.close()
+            click.echo(f"Recorded {writer.count} message(s), {writer.bytes} payload bytes to {out_file}", err=True)
+    return 0
+
+def parse_speed(value):
+    """Parse a replay speed such as 10x, 0.5 or max (as fast as possible, 0)."""
+    text = str(value).strip().lower()
+    if text == 'max':
+        return 0.0
+    try:
+        speed = float(text[:-1] if text.endswith('x') else text)
+    except ValueError:
+        raise click.BadParameter(f"'{value}' is not a speed like 10x, 0.5 or max")
+    if speed <= 0:
+        raise click.BadParameter("Speed must be positive (use 'max' for as fast as possible)")
+    return speed
+
+@messaging.command('replay')
+@click.argument('capture_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--node-id', help='Node ID to publish as (connects if needed)')
+@click.option('--speed', default='1x', show_default=True,
+              callback=lambda ctx, param, value: parse_speed(value),
+              help='Replay speed relative to the recording, e.g. 10x, or max for as fast as possible')
+@click.option('--topic', 'topic_filter', help='Only replay messages on topics matching this filter')
+@click.option('--start', type=float, help='Start N seconds into the capture')
+@click.option('--end', type=float, help='Stop N seconds into the capture')
+@click.pass_context
+@debug_log
+def replay(ctx, capture_file, node_id, speed, topic_filter, start, end):
+    """Publish the messages of a capture file again.
+    
+    Messages go out on their recorded topics with their recorded QoS, spaced
+    as they were received (divided by --speed).
+    
+    Examples:
+    rm-node messaging replay capture.rml --node-id node123
+    rm-node messaging replay capture.rml --node-id node123 --speed 10x
+    rm-node messaging replay burst.rml --node-id node123 --speed max --start 60 --end 120
+    """
+    try:
+        if node_id:
+            mqtt_client = get_active_mqtt_client(ctx, auto_connect=True, node_id=node_id)
+        else:
+            mqtt_client = ctx.obj.get('MQTT')
+        if not mqtt_client:
+            logger.debug("No MQTT connection found")
+            raise Exception("Not connected. Use --node-id or 'connect' first")
+        
+        tally = PublishTally()
+        
+        def publish(topic, payload, qos):
+            tally.publish(mqtt_client, topic, payload, qos=qos)
+        
+        with CaptureReader(capture_file) as reader:
+            first = reader.first_timestamp()
+            if first is None:
+                click.echo(click.style(f"ℹ {capture_file} has no messages", fg='yellow'))
+                return 0
+            records = reader.records(start=first + start if start is not None else None,
+                                     end=first + end if end is not None else None,
+                                     topic_filter=topic_filter)
+            click.echo(f"Replaying {capture_file} at {'maximum speed' if not speed else f'{speed:g}x'}", err=True)
+            click.echo("Press Ctrl+C to stop...", err=True)
+            started = time.perf_counter()
+            stopped = False
+            try:
+                replay_records(records, publish, speed)
+            except KeyboardInterrupt:
+                logger.debug("Replay stopped by user (Ctrl+C)")
+                click.echo("\nReplay stopped", err=True)
+                stopped = True
+        
+        logger.debug(f"Waiting for {tally.messages} messages to complete")
+        mqtt_client.flush()
+        elapsed = time.perf_counter() - started
+        
+        click.echo("\nReplay Summary:")
+        click.echo("-" * 60)
+        click.echo(f"{'Messages published':<30} {tally.messages:>12}")
+        click.echo(f"{'Payload bytes':<30} {tally.bytes:>12}")
+        click.echo(f"{'Elapsed':<30} {elapsed:>11.2f}s")
+        if elapsed:
+            click.echo(f"{'Throughput':<30} {tally.messages / elapsed:>8.0f} msg/s")
+        click.echo("-" * 60)
+        
+        if tally.errors:
+            click.echo(click.style(f"✗ {tally.errors} message(s) failed", fg='red'), err=True)
+            sys.exit(1)
+        if stopped:
+            sys.exit(1)
+        click.echo(click.style(f"✓ Replayed {tally.acked} messages", fg='green'))
+        return 0
+    except Exception as e:
+        logger.debug(f"Replay failed: {str(e)}")
+        click.echo(click.style(f"✗ Replay failed: {str(e)}", fg='red'), err=True)
+        sys.exit(1)
 
 @messaging.command('unsubscribe')
 @click.option('--topic', required=True, help='Topic to unsubscribe from')
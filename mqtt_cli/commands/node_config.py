@@ -13,8 +13,6 @@ import asyncio
 import uuid
 import os
 import logging
-import shutil
-import requests
 from pathlib import Path
 from ..utils.exceptions import MQTTError
 from ..utils.validators import validate_node_id
@@ -24,6 +22,8 @@ from ..utils.config_manager import ConfigManager
 from ..mqtt_operations import MQTTOperations
 from ..utils.debug_logger import debug_log, debug_step
 from ..core.mqtt_client import get_active_mqtt_client
+from ..core.fanout import DEFAULT_CONNECT_CONCURRENCY, load_node_ids, run_on_nodes, summarize_latencies
+from ..utils.shadow import open_shadow
 
 # Get logger for this module
 logger = logging.getLogger(__name__)
@@ -395,9 +395,10 @@ def set_config(ctx, node_id, device_type, config_file, project_name):
 @click.option('--params-file', type=click.Path(exists=True), help='JSON file containing parameters')
 @click.option('--remote', is_flag=True, help='Use remote parameters topic instead of local')
 @click.option('--params', multiple=True, help='Parameters in format "name:value:type" (type optional, defaults to string)')
+@click.option('--delta', is_flag=True, help='Only publish parameters that differ from the local shadow')
 @click.pass_context
 @debug_log
-def set_params(ctx, node_id: str, device_name: str, params_file: str, remote: bool, params: tuple):
+def set_params(ctx, node_id: str, device_name: str, params_file: str, remote: bool, params: tuple, delta: bool):
     """Set parameters for a specific device on a node.
     
     SWAGGER COMPLIANT: Uses device name -> parameter format as per MQTT specification.
@@ -411,24 +412,11 @@ def set_params(ctx, node_id: str, device_name: str, params_file: str, remote: bo
         
         # Use remote topic
         mqtt-cli node params --node-id node123 --device-name "Light" --params "brightness:165:int" --remote
+        
+        # Only publish what changed since the last publish
+        mqtt-cli node params --node-id node123 --device-name "Light" --params-file params.json --delta
     """
     try:
-        # Create event loop for async operations
-        logger.debug("Creating event loop for async operations")
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Ensure connection
-        logger.debug(f"Ensuring connection to node {node_id}")
-        if not loop.run_until_complete(ensure_node_connection(ctx, node_id)):
-            sys.exit(1)
-            
-        mqtt_client = ctx.obj.get('MQTT')
-        if not mqtt_client:
-            logger.debug("No active MQTT connection found")
-            click.echo(click.style("✗ No active MQTT connection", fg='red'), err=True)
-            sys.exit(1)
-        
         # Determine parameter source and create payload
         payload = None
         
@@ -488,12 +476,37 @@ def set_params(ctx, node_id: str, device_name: str, params_file: str, remote: bo
             click.echo("  - From file: --params-file FILE")
             sys.exit(1)
 
+        shadow = open_shadow(ctx)
+        if delta:
+            payload = shadow.delta(node_id, payload)
+            if not payload:
+                click.echo(click.style(f"ℹ No parameter changes for node {node_id}, nothing published", fg='yellow'))
+                return 0
+            logger.debug(f"Changed parameters: {payload}")
+        
+        # Create event loop for async operations
+        logger.debug("Creating event loop for async operations")
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        
+        # Ensure connection
+        logger.debug(f"Ensuring connection to node {node_id}")
+        if not loop.run_until_complete(ensure_node_connection(ctx, node_id)):
+            sys.exit(1)
+            
+        mqtt_client = ctx.obj.get('MQTT')
+        if not mqtt_client:
+            logger.debug("No active MQTT connection found")
+            click.echo(click.style("✗ No active MQTT connection", fg='red'), err=True)
+            sys.exit(1)
+
         # Topic structure based on remote/local
         topic = f"node/{node_id}/params/local"
         logger.debug(f"Publishing to topic: {topic}")
 
         # Publish parameters
         if mqtt_client.publish(topic, json.dumps(payload), qos=1):
+            shadow.record_published(node_id, payload)
             click.echo(click.style(f"Set {'remote' if remote else 'local'} parameters for device {device_name} on node {node_id}", fg='green'))
             click.echo("\nSwagger-compliant payload:")
             click.echo(json.dumps(payload, indent=2))
@@ -533,9 +546,18 @@ def monitor_node(ctx, node_id: str, timeout: int):
             
         # Only monitor remote parameters topic
         topic = f"node/{node_id}/params/remote"
+        shadow = open_shadow(ctx)
             
         def on_message(client, userdata, message):
-            click.echo(message.payload.decode())
+            text = message.payload.decode()
+            click.echo(text)
+            # Values set from the cloud become the shadow's current values
+            try:
+                remote_params = json.loads(text)
+            except json.JSONDecodeError:
+                return
+            if isinstance(remote_params, dict):
+                shadow.record_reported(node_id, remote_params)
                 
         # Subscribe to remote parameters topic
         if not mqtt_client.subscribe(topic=topic, callback=on_message):
@@ -822,6 +844,7 @@ def init_params(ctx, node_id: str, device_name: str, params_file: str, params: t
         # Publish parameters
         if mqtt_client.publish(topic, json.dumps(payload), qos=1):
             logger.debug("Parameters published successfully")
+            open_shadow(ctx).record_published(node_id, payload)
             click.echo(click.style(f"Initialized parameters for device {device_name} on node {node_id}", fg='green'))
             click.echo("\nSwagger-compliant payload:")
             click.echo(json.dumps(payload, indent=2))
@@ -837,33 +860,52 @@ def init_params(ctx, node_id: str, device_name: str, params_file: str, params: t
         sys.exit(1)
 
 @node.command('group-params')
-@click.option('--node-ids', required=True, help='Comma-separated list of node IDs')
+@click.option('--node-ids', help='Comma-separated list of node IDs')
+@click.option('--node-file', type=click.File('r'),
+              help="File with node IDs, one per line ('-' to read from stdin)")
 @click.option('--device-name', required=True, help='Name of the device to set parameters for')
 @click.option('--params-file', type=click.Path(exists=True), help='JSON file containing parameters')
 @click.option('--params', multiple=True, help='Parameters in format "name:value:type" (type optional, defaults to string)')
 @click.option('--group-id', required=True, help='Group ID for the parameter update')
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONNECT_CONCURRENCY,
+              help=f'Maximum number of nodes updated at once (default: {DEFAULT_CONNECT_CONCURRENCY})')
+@click.option('--delta', is_flag=True,
+              help='Only publish parameters that differ from the local shadow, skipping unchanged nodes')
 @click.pass_context
 @debug_log
-def group_params(ctx, node_ids: str, device_name: str, params_file: str, params: tuple, group_id: str):
+def group_params(ctx, node_ids: str, node_file, device_name: str, params_file: str, params: tuple,
+                 group_id: str, concurrency: int, delta: bool):
     """Set parameters for a specific device across multiple nodes.
     
     SWAGGER COMPLIANT: Uses device name -> parameter format as per MQTT specification.
     
+    Nodes are connected and updated concurrently; a per-node table with
+    connect time, PUBACK time and errors is printed at the end. With
+    --delta each node only gets the parameters that differ from its local
+    shadow, and nodes without changes are not contacted at all.
+    
     Examples:
         # Set multiple parameters across multiple nodes
         mqtt-cli node group-params --node-ids "node1,node2,node3" --device-name "Light" --params "brightness:75:int" --params "power:true:bool" --group-id "group1"
         
         # From file (for complex configurations)
         mqtt-cli node group-params --node-ids "node1,node2,node3" --device-name "Light" --params-file group_params.json --group-id "group1"
+        
+        # Node IDs from a file, 100 nodes at a time
+        mqtt-cli node group-params --node-file nodes.txt --device-name "Light" --params "power:true:bool" --group-id "group1" --concurrency 100
+        
+        # Node IDs from stdin
+        cat nodes.txt | mqtt-cli node group-params --node-file - --device-name "Light" --params "power:true:bool" --group-id "group1"
+        
+        # Only nodes whose parameters differ
+        mqtt-cli node group-params --node-file nodes.txt --device-name "Light" --params-file group_params.json --group-id "group1" --delta
     """
     try:
-        # Split node IDs
-        node_list = [n.strip() for n in node_ids.split(',')]
-        logger.debug(f"Processing group parameters for nodes: {node_list}")
-        
-        # Create event loop for async operations
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        node_list = load_node_ids(node_ids, node_file)
+        if not node_list:
+            click.echo(click.style("No node IDs given. Use --node-ids or --node-file", fg='red'), err=True)
+            sys.exit(1)
+        logger.debug(f"Processing group parameters for {len(node_list)} nodes")
         
         # Determine parameter source and create payload
         payload = None
@@ -922,52 +964,56 @@ def group_params(ctx, node_ids: str, device_name: str, params_file: str, params:
         click.echo(json.dumps(payload, indent=2))
         click.echo()
         
-        success_count = 0
-        failed_nodes = []
+        topic_payload = json.dumps(payload)
+        shadow = open_shadow(ctx)
+        node_payloads = {}
+        if delta:
+            for node_id in node_list:
+                changed = shadow.delta(node_id, payload)
+                if changed:
+                    node_payloads[node_id] = changed
+            unchanged = len(node_list) - len(node_payloads)
+            click.echo(f"{len(node_payloads)} node(s) with changes, {unchanged} unchanged node(s) skipped\n")
+            node_list = [node_id for node_id in node_list if node_id in node_payloads]
+            if not node_list:
+                click.echo(click.style("ℹ No parameter changes, nothing published", fg='yellow'))
+                return
         
-        # Process each node
-        for node_id in node_list:
-            logger.debug(f"Processing node: {node_id}")
-            try:
-                # Ensure connection to this node
-                logger.debug(f"Ensuring connection to node {node_id}")
-                if not loop.run_until_complete(ensure_node_connection(ctx, node_id)):
-                    logger.debug(f"Skipping node {node_id} due to connection failure")
-                    failed_nodes.append(f"{node_id} (connection failed)")
-                    continue
-                    
-                mqtt_client = ctx.obj.get('MQTT')
-                if not mqtt_client:
-                    logger.debug(f"No active MQTT connection for node {node_id}")
-                    failed_nodes.append(f"{node_id} (no MQTT connection)")
-                    continue
-                    
-                # Topic for group parameters with group ID
-                topic = f"node/{node_id}/params/local/{group_id}"
-                logger.debug(f"Publishing to topic: {topic}")
-                
-                # Publish parameters
-                if mqtt_client.publish(topic, json.dumps(payload), qos=1):
-                    logger.debug(f"Parameters published successfully for node {node_id}")
-                    click.echo(click.style(f"Updated parameters for device {device_name} on node {node_id}", fg='green'))
-                    success_count += 1
-                else:
-                    logger.debug(f"Failed to publish parameters for node {node_id}")
-                    failed_nodes.append(f"{node_id} (publish failed)")
-                    
-            except Exception as e:
-                logger.debug(f"Error processing node {node_id}: {str(e)}")
-                failed_nodes.append(f"{node_id} ({str(e)})")
-                continue
+        def publish_params(mqtt_client, node_id):
+            # Topic for group parameters with group ID
+            topic = f"node/{node_id}/params/local/{group_id}"
+            logger.debug(f"Publishing to topic: {topic}")
+            node_payload = node_payloads.get(node_id, payload)
+            # QoS 1 publish blocks until the PUBACK arrives
+            if not mqtt_client.publish(topic, json.dumps(node_payload) if delta else topic_payload, qos=1):
+                raise MQTTError("publish failed")
+            shadow.record_published(node_id, node_payload)
         
-        # Summary
-        click.echo("\n" + "="*50)
-        click.echo(click.style(f"Successfully updated: {success_count}/{len(node_list)} nodes", fg='green'))
+        start = time.perf_counter()
+        # Each publish waits for its PUBACK, so a connection is done with once it returns
+        results = run_on_nodes(ctx, node_list, publish_params, concurrency=concurrency, keep_connections=False)
+        elapsed = time.perf_counter() - start
         
-        if failed_nodes:
-            click.echo(click.style(f"Failed nodes:", fg='red'))
-            for failed in failed_nodes:
-                click.echo(f"  - {failed}")
+        # Per-node results
+        click.echo(f"{'Node ID':<40} {'Connect ms':>10} {'PUBACK ms':>10}  Result")
+        click.echo("-" * 80)
+        for result in results.values():
+            connect_ms = f"{result.connect.elapsed_ms:.0f}" if result.connect.ok else "-"
+            puback_ms = f"{result.elapsed_ms:.0f}" if result.connect.ok else "-"
+            status = click.style("✓ updated", fg='green') if result.ok else click.style(f"✗ {result.error}", fg='red')
+            click.echo(f"{result.node_id:<40} {connect_ms:>10} {puback_ms:>10}  {status}")
+        click.echo("-" * 80)
+        
+        # Summary
+        success_count = sum(1 for result in results.values() if result.ok)
+        click.echo(click.style(f"Successfully updated: {success_count}/{len(node_list)} nodes in {elapsed:.2f}s",
+                               fg='green' if success_count == len(node_list) else 'yellow'))
+        connect_stats = summarize_latencies([r.connect for r in results.values()])
+        puback_stats = summarize_latencies(results.values())
+        if connect_stats:
+            click.echo(f"Connect: p50 {connect_stats['p50']:.0f} ms, p95 {connect_stats['p95']:.0f} ms, max {connect_stats['max']:.0f} ms")
+        if puback_stats:
+            click.echo(f"PUBACK:  p50 {puback_stats['p50']:.0f} ms, p95 {puback_stats['p95']:.0f} ms, max {puback_stats['max']:.0f} ms")
         
         if success_count == 0:
             sys.exit(1)
@@ -975,4 +1021,49 @@ def group_params(ctx, node_ids: str, device_name: str, params_file: str, params:
     except Exception as e:
         logger.debug(f"Error in group_params: {str(e)}")
         click.echo(click.style(f"Error: {str(e)}", fg='red'), err=True)
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
+
+@node.command('shadow')
+@click.option('--node-id', required=True, help='Node ID to show the parameter shadow for')
+@click.option('--clear', is_flag=True, help='Forget the shadow of the node, so the next --delta publish sends everything')
+@click.pass_context
+@debug_log
+def show_shadow(ctx, node_id: str, clear: bool):
+    """Show the local parameter shadow used by --delta.
+    
+    The shadow keeps the last value published for each parameter and the
+    last value received on params/remote while monitoring; the newer one
+    is the current value.
+    
+    Examples:
+        mqtt-cli node shadow --node-id node123
+        mqtt-cli node shadow --node-id node123 --clear
+    """
+    try:
+        shadow = open_shadow(ctx)
+        if clear:
+            removed = shadow.clear(node_id)
+            click.echo(click.style(f"✓ Removed {removed} shadow parameter(s) for node {node_id}", fg='green'))
+            return
+        entries = shadow.entries(node_id)
+        if not entries:
+            click.echo(click.style(f"ℹ No shadow for node {node_id}", fg='yellow'))
+            return
+        
+        def when(at):
+            return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(at)) if at is not None else '-'
+        
+        click.echo(f"{'Parameter':<30} {'Published':<20} {'Reported':<20} Updated")
+        click.echo("-" * 80)
+        for entry in entries:
+            published = json.dumps(entry['published']) if entry['published_at'] is not None else '-'
+            reported = json.dumps(entry['reported']) if entry['reported_at'] is not None else '-'
+            updated = max(at for at in (entry['published_at'], entry['reported_at']) if at is not None)
+            name = f"{entry['device']}.{entry['param']}"
+            click.echo(f"{name:<30} {published:<20} {reported:<20} {when(updated)}")
+        click.echo("-" * 80)
+        
+    except Exception as e:
+        logger.debug(f"Error in show_shadow: {str(e)}")
+        click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
+        sys.exit(1)
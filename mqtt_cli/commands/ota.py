@@ -3,6 +3,9 @@ OTA (Over-The-Air) update commands for MQTT CLI.
 """
 import click
 import json
+import queue
+import sys
+import threading
 import time
 import os
 import logging
@@ -17,10 +20,20 @@ from ..mqtt_operations import MQTTOperations
 from ..utils.config_manager import ConfigManager
 from ..utils.debug_logger import debug_log, debug_step
 from ..core.mqtt_client import get_active_mqtt_client
+from ..core.fanout import DEFAULT_CONNECT_CONCURRENCY, load_node_ids, run_on_nodes, summarize_latencies
+from ..core.ota_policy import (DEFAULT_RESPONDER_WORKERS, DEFAULT_STATUS_INFO, OTAPolicy, OTAResponder,
+                               publish_ota_status, publish_ota_status_async)
+from ..core.ota_campaign import (DEFAULT_MIN_SUCCESS_RATE, DEFAULT_URL_TIMEOUT, DEFAULT_WAVES, FAILED,
+                                 PROGRESS_FILE_NAME, SUCCEEDED, TIMED_OUT, CampaignProgress, OTACampaign)
 
 # Get logger for this module
 logger = logging.getLogger(__name__)
 
+# Seconds between connection checks while waiting for OTA responses
+HEALTH_CHECK_INTERVAL = 5
+# Per-node results are printed up to this many nodes; beyond it only failures
+MAX_LISTED_NODES = 10
+
 @click.group()
 def ota():
     """OTA update management commands."""
@@ -71,7 +84,9 @@ def fetch_ota(ctx, node_id: str, fw_version: str, network_id: Optional[str]):
         raise click.Abort()
 
 @ota.command('status')
-@click.option('--node-id', required=True, help='Node ID(s) to update status for. Can be single ID or comma-separated list')
+@click.option('--node-id', help='Node ID(s) to update status for. Can be single ID or comma-separated list')
+@click.option('--node-file', type=click.File('r'),
+              help="File with node IDs, one per line ('-' to read from stdin)")
 @click.option('--status', 
               type=click.Choice(['in-progress', 'success', 'rejected', 'failed', 'delayed']), 
               required=True, 
@@ -79,108 +94,157 @@ def fetch_ota(ctx, node_id: str, fw_version: str, network_id: Optional[str]):
 @click.option('--job-id', required=True, help='OTA job ID')
 @click.option('--network-id', help='Network ID')
 @click.option('--info', help='Additional information about the OTA status')
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONNECT_CONCURRENCY,
+              help=f'Maximum number of nodes connecting at once (default: {DEFAULT_CONNECT_CONCURRENCY})')
 @click.pass_context
 @debug_log
-def update_status(ctx, node_id: str, status: str, job_id: str, network_id: str, info: Optional[str]):
+def update_status(ctx, node_id: Optional[str], node_file, status: str, job_id: str, network_id: str,
+                  info: Optional[str], concurrency: int):
     """Update OTA status for one or more nodes.
     
+    Nodes are connected concurrently, reusing live connections from this
+    process or the agent. Statuses are published at QoS 0, and each node's
+    connection is closed once its status has been sent, so at most
+    --concurrency connections are open at once.
+    
     Examples:
         mqtt-cli ota status --node-id node123 --status in-progress --job-id job123 --info "25% complete"
         mqtt-cli ota status --node-id "node123,node456" --status in-progress --job-id job123
+        mqtt-cli ota status --node-file nodes.txt --status success --job-id job123 --concurrency 128
     """
     try:
-        # Split node_id if it contains commas
-        logger.debug(f"Processing node IDs: {node_id}")
-        node_ids = [n.strip() for n in node_id.split(',')]
-        logger.debug(f"Split into {len(node_ids)} node IDs: {node_ids}")
+        node_ids = load_node_ids(node_id, node_file)
+        if not node_ids:
+            click.echo(click.style("✗ No node IDs given. Use --node-id or --node-file", fg='red'), err=True)
+            sys.exit(1)
+        logger.debug(f"Sending OTA status {status} to {len(node_ids)} nodes")
         
-        # Process each node in parallel
-        for node_id in node_ids:
-            try:
-                # Get or establish connection using centralized function
-                logger.debug(f"Getting or establishing connection for node {node_id}")
-                mqtt_client = get_active_mqtt_client(ctx, auto_connect=True, node_id=node_id)
-                if not mqtt_client:
-                    logger.debug(f"Failed to get MQTT client for node {node_id}")
-                    click.echo(click.style(f"✗ Failed to connect to node {node_id}", fg='red'), err=True)
-                    continue
-                
-                # Prepare payload
-                logger.debug("Preparing OTA status payload")
-                payload = {
-                    "status": status,
-                    "ota_job_id": job_id
-                }
-                if network_id:
-                    logger.debug(f"Adding network_id {network_id} to payload")
-                    payload["network_id"] = network_id
-                if info:
-                    logger.debug(f"Adding additional info to payload: {info}")
-                    payload["additional_info"] = info
-                    
-                # Publish to OTA status topic
-                topic = f"node/{node_id}/otastatus"
-                logger.debug(f"Publishing to topic: {topic}")
-                if mqtt_client.publish(topic, json.dumps(payload), qos=1):
-                    logger.debug(f"Successfully published OTA status for node {node_id}")
-                    click.echo(click.style(f"✓ OTA status updated for node {node_id}", fg='green'))
-                else:
-                    logger.debug(f"Failed to publish OTA status for node {node_id}")
-                    click.echo(click.style(f"✗ Failed to update OTA status for node {node_id}", fg='red'), err=True)
-                    
-            except Exception as e:
-                logger.debug(f"Error processing node {node_id}: {str(e)}")
-                click.echo(click.style(f"✗ Error for node {node_id}: {str(e)}", fg='red'), err=True)
+        futures = {}
+        
+        def send_status(mqtt_client, node_id):
+            futures[node_id] = publish_ota_status_async(mqtt_client, node_id, job_id, status, network_id, info)
+            # Agent publishes complete asynchronously; wait for them before the connection is closed
+            mqtt_client.flush()
+            return True
+        
+        start = time.perf_counter()
+        results = run_on_nodes(ctx, node_ids, send_status, concurrency=concurrency, keep_connections=False)
+        elapsed = time.perf_counter() - start
+        
+        failures = {}
+        for result in results.values():
+            if not result.connect.ok:
+                failures[result.node_id] = f"connect failed: {result.connect.error}"
+            elif result.error:
+                failures[result.node_id] = result.error
+            else:
+                future = futures[result.node_id]
+                error = future.exception() if future.done() else "no completion"
+                if error or not future.result():
+                    failures[result.node_id] = str(error or "publish failed")
+        
+        for result in results.values():
+            if result.node_id in failures:
+                click.echo(click.style(f"✗ Failed to update OTA status for node {result.node_id}: "
+                                       f"{failures[result.node_id]}", fg='red'), err=True)
+            elif len(node_ids) <= MAX_LISTED_NODES:
+                click.echo(click.style(f"✓ OTA status updated for node {result.node_id}", fg='green'))
+        
+        if len(node_ids) > 1:
+            sent = len(node_ids) - len(failures)
+            click.echo(click.style(f"\nOTA status '{status}' sent to {sent}/{len(node_ids)} nodes in {elapsed:.2f}s "
+                                   f"({sent / elapsed if elapsed else 0:.0f} nodes/s)",
+                                   fg='green' if not failures else 'yellow'))
+            connect_stats = summarize_latencies([r.connect for r in results.values() if not r.connect.reused])
+            if connect_stats:
+                click.echo(f"Connect: p50 {connect_stats['p50']:.0f} ms, p95 {connect_stats['p95']:.0f} ms, "
+                           f"max {connect_stats['max']:.0f} ms")
+            reused = sum(1 for r in results.values() if r.connect.reused)
+            if reused:
+                click.echo(f"Reused connections: {reused}")
+        
+        if failures:
+            sys.exit(1)
             
     except Exception as e:
         logger.debug(f"Error in update_status: {str(e)}")
         click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
-        raise click.Abort()
+        sys.exit(1)
 
 @ota.command('request')
-@click.option('--node-id', required=True, help='Node ID(s) to request OTA update for. Can be single ID or comma-separated list')
+@click.option('--node-id', help='Node ID(s) to request OTA update for. Can be single ID or comma-separated list')
+@click.option('--node-file', type=click.File('r'),
+              help="File with node IDs, one per line ('-' to read from stdin)")
 @click.option('--timeout', default=60, type=int, help='Timeout in seconds (default: 60)')
+@click.option('--auto-status',
+              help='Report statuses without prompting, e.g. "in-progress,success:5" '
+                   '(each entry is status[:seconds to wait before sending it])')
+@click.option('--rules', type=click.Path(exists=True, dir_okay=False),
+              help='JSON rules file choosing the status sequence per node ID or firmware version')
+@click.option('--workers', type=click.IntRange(min=1), default=DEFAULT_RESPONDER_WORKERS,
+              help=f'Threads publishing automatic status updates (default: {DEFAULT_RESPONDER_WORKERS})')
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONNECT_CONCURRENCY,
+              help=f'Maximum number of nodes connected at once (default: {DEFAULT_CONNECT_CONCURRENCY})')
 @click.pass_context
 @debug_log
-def request(ctx, node_id: str, timeout: int):
+def request(ctx, node_id: str, node_file, timeout: int, auto_status: Optional[str], rules: Optional[str],
+            workers: int, concurrency: int):
     """Listen for OTA URL responses from one or more nodes and update status.
     
+    By default you are asked which status to report for each response. With
+    --auto-status and/or --rules the statuses are reported automatically, so
+    large fleets can run through an OTA cycle unattended.
+    
     Examples:
         mqtt-cli ota request --node-id node123 --timeout 120
         mqtt-cli ota request --node-id "node123,node456" --timeout 120
+        mqtt-cli ota request --node-file nodes.txt --auto-status "in-progress,success:5" --timeout 300
+        mqtt-cli ota request --node-file nodes.txt --rules ota_rules.json --workers 32
     """
+    responder = None
     try:
         logger.debug(f"Validating timeout value: {timeout}")
         validate_timeout(timeout)
         
-        # Split node_id if it contains commas
-        logger.debug(f"Processing node IDs: {node_id}")
-        node_ids = [n.strip() for n in node_id.split(',')]
-        logger.debug(f"Split into {len(node_ids)} node IDs: {node_ids}")
+        node_ids = load_node_ids(node_id, node_file)
+        if not node_ids:
+            click.echo(click.style("✗ No node IDs given. Use --node-id or --node-file", fg='red'), err=True)
+            raise click.Abort()
+        logger.debug(f"Requesting OTA for {len(node_ids)} nodes")
+        
+        auto = bool(auto_status or rules)
+        policy = None
+        if auto:
+            try:
+                policy = OTAPolicy.load(auto_status, rules)
+            except ValueError as e:
+                click.echo(click.style(f"✗ Invalid OTA policy: {str(e)}", fg='red'), err=True)
+                raise click.Abort()
         
         # Track responses and MQTT clients for each node
         responses_received = {node_id: False for node_id in node_ids}
         mqtt_clients = {}
-        logger.debug(f"Initialized response tracking for nodes: {list(responses_received.keys())}")
+        # Interactive mode: responses wait here so prompts never block the MQTT receive thread
+        pending_responses = queue.Queue()
+        logger.debug(f"Initialized response tracking for {len(responses_received)} nodes")
 
         @debug_step("Publishing status update")
         def publish_status_update(node_id, job_id, status, network_id=None, info=None):
             """Helper function to publish status updates with improved retry logic"""
             status_map = {
-                "1": {"status": "success", "info": "Update completed successfully"},
-                "2": {"status": "failed", "info": "Update failed"},
-                "3": {"status": "in-progress", "info": "Update in progress"},
-                "4": {"status": "rejected", "info": "Update rejected"},
-                "5": {"status": "delayed", "info": "Update delayed"}
+                "1": "success",
+                "2": "failed",
+                "3": "in-progress",
+                "4": "rejected",
+                "5": "delayed"
             }
             
             # Get the status and info from the map
             logger.debug(f"Processing status update for node {node_id} with status code {status}")
             if status in status_map:
-                status_info = status_map[status]
-                status = status_info["status"]
-                info = status_info["info"]
-                logger.debug(f"Mapped status code {status} to: {status_info}")
+                status = status_map[status]
+                info = DEFAULT_STATUS_INFO[status]
+                logger.debug(f"Mapped status code to: {status}")
 
             try:
                 mqtt_client = mqtt_clients.get(node_id)
@@ -189,24 +253,10 @@ def request(ctx, node_id: str, timeout: int):
                     click.echo(click.style(f"✗ No MQTT client found for node {node_id}", fg='red'), err=True)
                     return False
 
-                # Prepare payload
-                logger.debug("Preparing status update payload")
-                payload = {
-                    "status": status,
-                    "ota_job_id": job_id
-                }
-                if network_id:
-                    logger.debug(f"Adding network_id {network_id} to payload")
-                    payload["network_id"] = network_id
-                if info:
-                    logger.debug(f"Adding additional info to payload: {info}")
-                    payload["additional_info"] = info
-
                 # Publish to OTA status topic with enhanced retry logic
-                topic = f"node/{node_id}/otastatus"
                 max_retries = 3
                 retry_delay = 2  # seconds between retries
-                logger.debug(f"Publishing to topic {topic} with {max_retries} retries")
+                logger.debug(f"Publishing status for {node_id} with {max_retries} retries")
 
                 for attempt in range(max_retries):
                     try:
@@ -226,7 +276,7 @@ def request(ctx, node_id: str, timeout: int):
 
                         # Try to publish
                         logger.debug(f"Attempting to publish (attempt {attempt + 1}/{max_retries})")
-                        if mqtt_client.publish(topic, json.dumps(payload), qos=1):
+                        if publish_ota_status(mqtt_client, node_id, job_id, status, network_id, info):
                             logger.debug("Successfully published status update")
                             click.echo(click.style(f"\nStatus Update Details:"))
                             click.echo(click.style(f"Node ID: {node_id}"))
@@ -258,122 +308,144 @@ def request(ctx, node_id: str, timeout: int):
                 click.echo(click.style(f"✗ Error updating status: {str(e)}", fg='red'), err=True)
                 return False
 
+        def prompt_status_update(current_node, response):
+            """Ask which status to report for a response; runs on the main thread."""
+            click.echo("\n" + "="*50)
+            click.echo(f"Received OTA response from node {current_node}")
+            click.echo("="*50)
+            click.echo(json.dumps(response, indent=2))
+            click.echo("-"*50)
+            
+            if not response.get('ota_job_id'):
+                logger.debug("No OTA job ID found in response")
+                click.echo(click.style("No OTA job ID in response", fg='yellow'))
+                return
+                
+            # Prompt for status update
+            logger.debug("Prompting for status update")
+            while True:
+                click.echo("\nSelect OTA status to send:")
+                click.echo("1. success")
+                click.echo("2. failed")
+                click.echo("3. in-progress")
+                click.echo("4. rejected")
+                click.echo("5. delayed")
+                click.echo("0. Skip status update")
+                
+                try:
+                    choice = input("\nEnter your choice (0-5): ").strip()
+                    logger.debug(f"User selected choice: {choice}")
+                    
+                    if choice == "0":
+                        logger.debug("User chose to skip status update")
+                        click.echo("Skipping status update")
+                        break
+                        
+                    if choice in ["1", "2", "3", "4", "5"]:
+                        logger.debug(f"Publishing status update with choice {choice}")
+                        if publish_status_update(current_node, response['ota_job_id'], choice,
+                                                 response.get('network_id')):
+                            logger.debug(f"Status update successful for node {current_node}")
+                            responses_received[current_node] = True
+                            break
+                    else:
+                        logger.debug(f"Invalid choice entered: {choice}")
+                        click.echo(click.style("Invalid choice. Please select 0-5", fg='red'))
+                        
+                except KeyboardInterrupt:
+                    logger.debug("Status update cancelled by user")
+                    click.echo("\nStatus update cancelled")
+                    break
+                except Exception as e:
+                    logger.debug(f"Error during status update prompt: {str(e)}")
+                    click.echo(click.style(f"Error: {str(e)}", fg='red'))
+                    break
+
+        def on_status_sent(outcome, step):
+            logger.debug(f"Reported {step.status} for node {outcome.node_id}")
+
+        def on_sequence_done(outcome):
+            responses_received[outcome.node_id] = True
+            if outcome.error:
+                click.echo(click.style(f"✗ {outcome.node_id}: {outcome.error}", fg='red'), err=True)
+            elif outcome.steps:
+                click.echo(click.style(f"✓ {outcome.node_id}: {' → '.join(outcome.sent)} "
+                                       f"({outcome.elapsed:.1f}s)", fg='green'))
+            else:
+                click.echo(click.style(f"ℹ {outcome.node_id}: skipped by policy", fg='yellow'))
+
+        if auto:
+            responder = OTAResponder(mqtt_clients, policy, workers=workers,
+                                     on_status=on_status_sent, on_done=on_sequence_done)
+
         @debug_step("Processing OTA response")
         def on_ota_response(client, userdata, message):
+            # Runs on the MQTT receive thread: decode and hand off only
             try:
                 topic_parts = message.topic.split('/')
-                if len(topic_parts) >= 2:
-                    current_node = topic_parts[1]
-                    if current_node not in node_ids:
-                        logger.debug(f"Received response for unknown node {current_node}, ignoring")
-                        return
-                        
+                current_node = topic_parts[1] if len(topic_parts) >= 2 else None
+                if current_node not in responses_received:
+                    logger.debug(f"Received response for unknown node {current_node}, ignoring")
+                    return
                 logger.debug(f"Received OTA response from node {current_node}")
-                click.echo("\n" + "="*50)
-                click.echo(f"Received OTA response from node {current_node}")
-                click.echo("="*50)
                 
                 try:
-                    logger.debug("Parsing response payload")
                     response = json.loads(message.payload.decode())
-                    click.echo(json.dumps(response, indent=2))
-                    click.echo("-"*50)
-                    
-                    if not response.get('ota_job_id'):
-                        logger.debug("No OTA job ID found in response")
-                        click.echo(click.style("No OTA job ID in response", fg='yellow'))
-                        return
-                        
-                    # Prompt for status update
-                    logger.debug("Prompting for status update")
-                    while True:
-                        click.echo("\nSelect OTA status to send:")
-                        click.echo("1. success")
-                        click.echo("2. failed")
-                        click.echo("3. in-progress")
-                        click.echo("4. rejected")
-                        click.echo("5. delayed")
-                        click.echo("0. Skip status update")
-                        
-                        try:
-                            choice = input("\nEnter your choice (0-5): ").strip()
-                            logger.debug(f"User selected choice: {choice}")
-                            
-                            if choice == "0":
-                                logger.debug("User chose to skip status update")
-                                click.echo("Skipping status update")
-                                break
-                                
-                            if choice in ["1", "2", "3", "4", "5"]:
-                                logger.debug(f"Publishing status update with choice {choice}")
-                                if publish_status_update(current_node, response['ota_job_id'], choice):
-                                    logger.debug(f"Status update successful for node {current_node}")
-                                    responses_received[current_node] = True
-                                    break
-                            else:
-                                logger.debug(f"Invalid choice entered: {choice}")
-                                click.echo(click.style("Invalid choice. Please select 0-5", fg='red'))
-                                
-                        except KeyboardInterrupt:
-                            logger.debug("Status update cancelled by user")
-                            click.echo("\nStatus update cancelled")
-                            break
-                        except Exception as e:
-                            logger.debug(f"Error during status update prompt: {str(e)}")
-                            click.echo(click.style(f"Error: {str(e)}", fg='red'))
-                            break
-                            
                 except json.JSONDecodeError:
                     logger.debug("Failed to parse JSON response")
-                    click.echo(click.style("Invalid JSON in response", fg='red'))
+                    click.echo(click.style(f"Invalid JSON in response from {current_node}", fg='red'))
                     click.echo("Raw payload: " + message.payload.decode())
+                    return
+                
+                if responder:
+                    if responder.handle(current_node, response):
+                        return
+                    if responder.stopped:
+                        logger.debug(f"OTA responder stopped, ignoring response from {current_node}")
+                    else:
+                        click.echo(click.style(f"No OTA job ID in response from {current_node}", fg='yellow'))
+                else:
+                    pending_responses.put((current_node, response))
                     
             except Exception as e:
                 logger.debug(f"Error processing OTA response: {str(e)}")
                 click.echo(click.style(f"Error processing response: {str(e)}", fg='red'))
- 
-        # Process each node
-        logger.debug("Getting connection manager")
-        connection_manager = ctx.obj.get('CONNECTION_MANAGER')
-        if not connection_manager:
-            logger.debug("Connection manager not initialized")
-            click.echo(click.style("✗ Connection manager not initialized", fg='red'), err=True)
-            raise click.Abort()
 
-        for node_id in node_ids:
-            try:
-                logger.debug(f"Processing node {node_id}")
-                # Use get_active_mqtt_client for consistent certificate handling
-                mqtt_client = get_active_mqtt_client(ctx, auto_connect=True, node_id=node_id)
-                if not mqtt_client:
-                    logger.debug(f"Failed to get MQTT client for node {node_id}")
-                    click.echo(click.style(f"✗ Failed to connect to node {node_id}", fg='red'), err=True)
-                    continue
+        def subscribe_node(mqtt_client, node_id):
+            # Store the client first so an immediate response finds it
+            mqtt_clients[node_id] = mqtt_client
+            response_topic = f"node/{node_id}/otaurl"
+            logger.debug(f"Subscribing to topic: {response_topic}")
+            if not mqtt_client.add_handler(response_topic, on_ota_response, qos=1):
+                mqtt_clients.pop(node_id, None)
+                raise MQTTOTAError("subscribe failed")
+            return True
 
-                # Store MQTT client reference
-                mqtt_clients[node_id] = mqtt_client
-                logger.debug(f"Stored MQTT client for node {node_id}")
- 
-                # Subscribe to response topic
-                response_topic = f"node/{node_id}/otaurl"
-                logger.debug(f"Subscribing to topic: {response_topic}")
-                if not mqtt_client.subscribe(response_topic, qos=1, callback=on_ota_response):
-                    logger.debug(f"Failed to subscribe to topic {response_topic}")
-                    click.echo(click.style(f"✗ Failed to subscribe to response topic for node {node_id}", fg='red'), err=True)
-                    continue
-                    
-                click.echo(f"Listening for OTA updates on {response_topic}...")
-                
-            except Exception as e:
-                logger.debug(f"Error setting up node {node_id}: {str(e)}")
-                click.echo(click.style(f"✗ Error for node {node_id}: {str(e)}", fg='red'), err=True)
+        def on_subscribed(result):
+            if result.ok:
+                if not auto or len(node_ids) <= 10:
+                    click.echo(f"Listening for OTA updates on node/{result.node_id}/otaurl...")
+            else:
+                click.echo(click.style(f"✗ Error for node {result.node_id}: {result.error}", fg='red'), err=True)
+
+        # Connect and subscribe all nodes on a bounded worker pool
+        results = run_on_nodes(ctx, node_ids, subscribe_node, concurrency=concurrency, on_result=on_subscribed)
+        subscribed = [node_id for node_id, result in results.items() if result.ok]
+        if not subscribed:
+            click.echo(click.style("✗ No nodes could be subscribed", fg='red'), err=True)
+            raise click.Abort()
+        for node_id, result in results.items():
+            if not result.ok:
+                # Nothing to wait for on nodes that never subscribed
+                responses_received.pop(node_id, None)
 
-        click.echo("\nMonitoring all nodes. Press Ctrl+C to stop...")
+        click.echo(f"\nMonitoring {len(subscribed)} node(s). Press Ctrl+C to stop...")
         logger.debug("Starting monitoring loop")
  
         try:
             # Keep the MQTT loop running
             start_time = time.time()
+            next_health_check = time.monotonic() + HEALTH_CHECK_INTERVAL
             while True:
                 if all(responses_received.values()):
                     logger.debug("All nodes have responded and status updates completed")
@@ -388,29 +460,194 @@ def request(ctx, node_id: str, timeout: int):
                     break
 
                 # Check connection health for each client
-                for node_id, mqtt_client in mqtt_clients.items():
-                    if not mqtt_client.ping():
-                        logger.debug(f"Connection lost for node {node_id}, attempting to reconnect")
-                        click.echo(click.style(f"\nConnection lost for node {node_id}, attempting to reconnect...", fg='yellow'))
-                        mqtt_client.reconnect()
-                    
-                time.sleep(0.1)
+                if time.monotonic() >= next_health_check:
+                    for node_id, mqtt_client in list(mqtt_clients.items()):
+                        if not mqtt_client.ping():
+                            logger.debug(f"Connection lost for node {node_id}, attempting to reconnect")
+                            click.echo(click.style(f"\nConnection lost for node {node_id}, attempting to reconnect...", fg='yellow'))
+                            mqtt_client.reconnect()
+                    next_health_check = time.monotonic() + HEALTH_CHECK_INTERVAL
+                
+                try:
+                    current_node, response = pending_responses.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                prompt_status_update(current_node, response)
                 
         except KeyboardInterrupt:
             logger.debug("Monitoring stopped by user")
             click.echo("\nStopping OTA listener...")
         finally:
+            if responder:
+                responder.close()
             # Cleanup: Unsubscribe and disconnect clients
             logger.debug("Cleaning up MQTT connections")
             for node_id, mqtt_client in mqtt_clients.items():
                 try:
                     logger.debug(f"Unsubscribing node {node_id} from OTA updates")
-                    mqtt_client.unsubscribe(f"node/{node_id}/otaurl")
+                    mqtt_client.remove_handler(f"node/{node_id}/otaurl", on_ota_response)
                 except:
                     logger.debug(f"Error unsubscribing node {node_id}")
                     pass
+
+        if responder:
+            print_responder_summary(responder, responses_received)
+            if not all(outcome.ok for outcome in responder.outcomes.values()) or not all(responses_received.values()):
+                sys.exit(1)
         
+    except click.Abort:
+        raise
     except Exception as e:
         logger.debug(f"Error in request command: {str(e)}")
         click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
-        raise click.Abort()
\ No newline at end of file
+        raise click.Abort()
+
+def print_responder_summary(responder, responses_received):
+    """Print final statuses of an automatic OTA run."""
+    final = {}
+    for outcome in responder.outcomes.values():
+        key = outcome.final_status or ('failed to report' if outcome.error else 'skipped')
+        if outcome.error and outcome.final_status:
+            key = f"{outcome.final_status} (then failed)"
+        final[key] = final.get(key, 0) + 1
+    no_response = sum(1 for received in responses_received.values() if not received)
+    
+    click.echo("\nOTA Summary:")
+    click.echo("-" * 60)
+    for status, count in sorted(final.items()):
+        click.echo(f"{status:<40} {count:>8}")
+    if no_response:
+        click.echo(f"{'no response':<40} {no_response:>8}")
+    click.echo("-" * 60)
+
+@ota.command('campaign')
+@click.option('--node-id', help='Comma-separated node IDs to update')
+@click.option('--node-file', type=click.File('r'),
+              help="File with node IDs, one per line ('-' to read from stdin)")
+@click.option('--fw-version', required=True, help='Current firmware version sent in otafetch')
+@click.option('--network-id', help='Network ID for Thread-based OTA')
+@click.option('--waves', default=DEFAULT_WAVES, show_default=True,
+              help='Cumulative wave sizes as percentages or node counts')
+@click.option('--min-success-rate', type=click.FloatRange(0, 100), default=DEFAULT_MIN_SUCCESS_RATE,
+              show_default=True, help='Percentage of a wave that must succeed before the next wave starts')
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONNECT_CONCURRENCY,
+              help=f'Maximum number of nodes updating at once (default: {DEFAULT_CONNECT_CONCURRENCY})')
+@click.option('--url-timeout', type=click.IntRange(min=1), default=DEFAULT_URL_TIMEOUT,
+              help=f'Seconds to wait for each node\'s otaurl response (default: {DEFAULT_URL_TIMEOUT})')
+@click.option('--auto-status', default='in-progress,success', show_default=True,
+              help='Statuses to report for each node, e.g. "in-progress,success:5"')
+@click.option('--rules', type=click.Path(exists=True, dir_okay=False),
+              help='JSON rules file choosing the status sequence per node ID or firmware version')
+@click.option('--progress-file', type=click.Path(dir_okay=False),
+              help=f'Progress file used to resume (default: <config-dir>/{PROGRESS_FILE_NAME})')
+@click.option('--retry-failed', is_flag=True, help='Run failed and timed-out nodes again when resuming')
+@click.option('--restart', is_flag=True, help='Discard earlier progress and start from the first wave')
+@click.pass_context
+@debug_log
+def campaign(ctx, node_id: Optional[str], node_file, fw_version: str, network_id: Optional[str], waves: str,
+             min_success_rate: float, concurrency: int, url_timeout: int, auto_status: str,
+             rules: Optional[str], progress_file: Optional[str], retry_failed: bool, restart: bool):
+    """Run OTA for a fleet in staged waves.
+    
+    Each node sends otafetch, waits for its otaurl response and reports the
+    status sequence from --auto-status/--rules. A wave must reach
+    --min-success-rate before the next wave starts. Progress is saved after
+    every node, so running the same command again resumes the campaign.
+    
+    Examples:
+        mqtt-cli ota campaign --node-file nodes.txt --fw-version 1.0.0
+        mqtt-cli ota campaign --node-file nodes.txt --fw-version 1.0.0 --waves "100,1000,100%" --concurrency 128
+        mqtt-cli ota campaign --node-file nodes.txt --fw-version 1.0.0 --retry-failed
+    """
+    try:
+        node_ids = load_node_ids(node_id, node_file)
+        if not node_ids:
+            click.echo(click.style("✗ No node IDs given. Use --node-id or --node-file", fg='red'), err=True)
+            raise click.Abort()
+        
+        progress = CampaignProgress(progress_file or Path(ctx.obj['CONFIG_DIR']) / PROGRESS_FILE_NAME)
+        if restart and progress.path.exists():
+            logger.debug(f"Discarding progress file {progress.path}")
+            progress.path.unlink()
+        try:
+            policy = OTAPolicy.load(auto_status, rules)
+            progress.load()
+            ota_campaign = OTACampaign(ctx, node_ids, fw_version, policy, progress, waves=waves,
+                                       concurrency=concurrency, min_success_rate=min_success_rate,
+                                       url_timeout=url_timeout, network_id=network_id,
+                                       retry_failed=retry_failed, on_node=on_node_state,
+                                       on_wave=print_wave_summary)
+            ota_campaign.check_resume()
+        except ValueError as e:
+            click.echo(click.style(f"✗ {str(e)}", fg='red'), err=True)
+            raise click.Abort()
+
+        if progress.header:
+            click.echo(click.style(f"ℹ Resuming campaign from {progress.path}", fg='yellow'))
+        click.echo(f"OTA campaign for {len(node_ids)} nodes in {len(ota_campaign.bounds)} wave(s), "
+                   f"gate {min_success_rate:g}%")
+
+        # Run on a worker thread so Ctrl+C can stop the campaign cleanly
+        outcome = {}
+        def run_campaign():
+            try:
+                outcome['summaries'] = ota_campaign.run()
+            except Exception as e:
+                outcome['error'] = e
+        runner = threading.Thread(target=run_campaign, name='ota-campaign', daemon=True)
+        runner.start()
+        try:
+            while runner.is_alive():
+                runner.join(0.5)
+        except KeyboardInterrupt:
+            click.echo("\nStopping campaign, waiting for in-flight nodes...")
+            ota_campaign.stop()
+            runner.join()
+        if 'error' in outcome:
+            raise outcome['error']
+
+        summaries = outcome.get('summaries', [])
+        print_campaign_summary(ota_campaign)
+        if ota_campaign.stop_event.is_set():
+            click.echo(click.style("ℹ Campaign stopped; run the same command again to resume", fg='yellow'))
+            sys.exit(1)
+        last = summaries[-1] if summaries else None
+        if last and last.success_rate < min_success_rate:
+            click.echo(click.style(f"✗ Wave {last.index} success rate {last.success_rate:.1f}% is below "
+                                   f"{min_success_rate:g}%, campaign halted", fg='red'), err=True)
+            sys.exit(1)
+        if len(summaries) == len(ota_campaign.bounds):
+            click.echo(click.style("✓ Campaign complete", fg='green'))
+        
+    except click.Abort:
+        raise
+    except Exception as e:
+        logger.debug(f"Error in campaign command: {str(e)}")
+        click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
+        raise click.Abort()
+
+def on_node_state(node_id, record):
+    """Report nodes that end in a failed state as they finish."""
+    if record['state'] in (FAILED, TIMED_OUT):
+        click.echo(click.style(f"✗ {node_id}: {record['state']} ({record.get('error', 'unknown error')})",
+                               fg='red'), err=True)
+
+def print_wave_summary(summary, ran):
+    """Print one line per finished wave."""
+    counts = ', '.join(f"{state}: {count}" for state, count in sorted(summary.counts.items()))
+    color = 'green' if summary.counts.get(SUCCEEDED, 0) == summary.size else 'yellow'
+    click.echo(click.style(f"Wave {summary.index}: {summary.size} nodes ({len(ran)} run) - "
+                           f"success {summary.success_rate:.1f}% - {counts}", fg=color))
+
+def print_campaign_summary(ota_campaign):
+    """Print final node states over the whole campaign."""
+    counts = {}
+    for node_id in ota_campaign.node_ids:
+        state = ota_campaign.progress.state(node_id)
+        counts[state] = counts.get(state, 0) + 1
+    
+    click.echo("\nCampaign Summary:")
+    click.echo("-" * 60)
+    for state, count in sorted(counts.items()):
+        click.echo(f"{state:<40} {count:>8}")
+    click.echo("-" * 60)
@@ -0,0 +1,198 @@
+"""
+Virtual node simulator command for MQTT CLI.
+"""
+import click
+import copy
+import json
+import sys
+import time
+import logging
+from pathlib import Path
+from ..utils.debug_logger import debug_log
+from ..utils.cert_finder import get_root_cert_path
+from ..core.mqtt_client import find_node_cert_paths
+from ..core.fanout import DEFAULT_CONNECT_CONCURRENCY, load_node_ids
+from ..core.ota_policy import OTAPolicy
+from ..core.simulator import DEFAULT_OTA_SEQUENCE, Simulator, make_tls_context, timeseries_params
+from ..mqtt_operations import PORT
+from .node_config import CONFIGS_DIR, DEVICE_TEMPLATES
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+# Open files needed besides one socket per node (selector, waker, certificates, logs)
+_SPARE_FILES = 256
+
+
+def _raise_open_file_limit(needed: int) -> int:
+    """Raise the soft open-file limit towards `needed`; returns the limit in effect."""
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return needed
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY or soft >= needed:
+        return needed
+    target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    except (ValueError, OSError) as e:
+        logger.debug(f"Could not raise open file limit: {str(e)}")
+        return soft
+    return target
+
+
+def _load_json(path: Path) -> dict:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+@click.command()
+@click.option('--node-id', help='Node ID(s) to simulate. Can be single ID or comma-separated list')
+@click.option('--node-file', type=click.File('r'),
+              help="File with node IDs, one per line ('-' to read from stdin)")
+@click.option('--device-type', type=click.Choice(list(DEVICE_TEMPLATES)), default='light',
+              help='Template for the node configuration and initial params (default: light)')
+@click.option('--config-file', type=click.Path(exists=True, dir_okay=False),
+              help='Custom JSON node configuration to use instead of the template')
+@click.option('--params-file', type=click.Path(exists=True, dir_okay=False),
+              help='Custom JSON initial params to use instead of the template')
+@click.option('--duration', type=click.FloatRange(min=0, min_open=True), help='Seconds to run (default: until Ctrl+C)')
+@click.option('--tsdata-rate', type=click.FloatRange(min=0), default=0.0,
+              help='Points per second for each time series parameter, 0 to disable (default: 0)')
+@click.option('--basic-ingest', is_flag=True, help='Use basic ingest topic ($aws/rules/esp_ts_ingest/...) for tsdata')
+@click.option('--ota-fetch', is_flag=True, help='Publish otafetch after the first connect')
+@click.option('--ota-status', default=DEFAULT_OTA_SEQUENCE,
+              help=f'Statuses reported for each OTA URL, status[:seconds] entries (default: "{DEFAULT_OTA_SEQUENCE}")')
+@click.option('--ota-rules', type=click.Path(exists=True, dir_okay=False),
+              help='JSON rules file choosing the status sequence per node ID or firmware version')
+@click.option('--port', type=click.IntRange(min=1, max=65535), default=PORT, help=f'Broker port (default: {PORT})')
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONNECT_CONCURRENCY,
+              help=f'Maximum number of nodes connecting at once (default: {DEFAULT_CONNECT_CONCURRENCY})')
+@click.option('--report-interval', type=click.FloatRange(min=0), default=10.0,
+              help='Seconds between progress lines, 0 to disable (default: 10)')
+@click.pass_context
+@debug_log
+def simulate(ctx, node_id, node_file, device_type, config_file, params_file, duration, tsdata_rate, basic_ingest,
+             ota_fetch, ota_status, ota_rules, port, concurrency, report_interval):
+    """Run many virtual nodes from one process for load tests.
+
+    Each node connects with its own certificate and behaves like the
+    firmware: it publishes its config and initial params, applies and
+    reports params/remote updates, acknowledges to-node commands, answers
+    OTA URLs with otastatus reports and, with --tsdata-rate, emits time
+    series data for parameters with the time_series property. All nodes
+    share one network loop, so thousands of nodes need only a few threads.
+
+    Examples:
+    rm-node simulate --node-file nodes.txt --duration 600
+    rm-node simulate --node-file nodes.txt --device-type light --tsdata-rate 0.1
+    rm-node simulate --node-id node123 --ota-fetch --ota-status "in-progress,failed:10"
+    """
+    simulator = None
+    try:
+        node_ids = load_node_ids(node_id, node_file)
+        if not node_ids:
+            click.echo(click.style("✗ No node IDs given. Use --node-id or --node-file", fg='red'), err=True)
+            sys.exit(1)
+        try:
+            policy = OTAPolicy.load(ota_status, ota_rules)
+        except ValueError as e:
+            click.echo(click.style(f"✗ Invalid OTA policy: {str(e)}", fg='red'), err=True)
+            sys.exit(1)
+
+        config_template = _load_json(Path(config_file) if config_file else CONFIGS_DIR / DEVICE_TEMPLATES[device_type])
+        params_template = _load_json(Path(params_file) if params_file else CONFIGS_DIR / f"{device_type}_params.json")
+        root_path = get_root_cert_path(Path(ctx.obj['CONFIG_DIR']))
+        if tsdata_rate and not timeseries_params(config_template):
+            click.echo(click.style("ℹ The node config has no numeric or bool time series parameters; "
+                                   "--tsdata-rate sends nothing", fg='yellow'))
+
+        limit = _raise_open_file_limit(len(node_ids) + _SPARE_FILES)
+        if limit < len(node_ids) + _SPARE_FILES:
+            click.echo(click.style(f"ℹ Open file limit is {limit}; some of the {len(node_ids)} nodes "
+                                   f"may fail to connect", fg='yellow'))
+
+        simulator = Simulator(ctx.obj['BROKER'], port, connect_concurrency=concurrency, ota_policy=policy,
+                              ota_fetch=ota_fetch, tsdata_rate=tsdata_rate, basic_ingest=basic_ingest)
+        skipped = 0
+        for node in node_ids:
+            try:
+                cert_path, key_path, _ = find_node_cert_paths(ctx, node)
+            except FileNotFoundError as e:
+                click.echo(click.style(f"✗ {str(e)}", fg='red'), err=True)
+                skipped += 1
+                continue
+            config = copy.deepcopy(config_template)
+            config['node_id'] = node
+            simulator.add_node(node, config, copy.deepcopy(params_template),
+                               make_tls_context(root_path, cert_path, key_path, alpn=port == 443))
+        if not simulator.nodes:
+            sys.exit(1)
+
+        click.echo(f"Simulating {len(simulator.nodes)} node(s) on {ctx.obj['BROKER']}:{port}"
+                   f"{f' for {duration:g}s' if duration else ', Ctrl+C to stop'}")
+        simulator.start()
+        started = time.monotonic()
+        end = started + duration if duration else None
+        next_report = started + report_interval if report_interval else None
+        interrupted = False
+        try:
+            while end is None or time.monotonic() < end:
+                time.sleep(0.2)
+                now = time.monotonic()
+                if next_report is not None and now >= next_report:
+                    counts = simulator.counts
+                    click.echo(f"[{now - started:7.1f}s] connected {counts['connected']}/{len(simulator.nodes)}  "
+                               f"published {counts['published']}  acked {counts['acked']}  "
+                               f"commands {counts['commands']}  ota {counts['ota_jobs']}  "
+                               f"errors {counts['errors'] + counts['connect_failed']}")
+                    next_report = now + report_interval
+        except KeyboardInterrupt:
+            interrupted = True
+            click.echo(click.style("\nℹ Stopping, disconnecting nodes...", fg='yellow'))
+
+        elapsed = time.monotonic() - started
+        summary = simulator.snapshot()
+        simulator.close()
+        simulator = None
+
+        click.echo("\nSimulation Summary:")
+        click.echo("-" * 60)
+        click.echo(f"{'Nodes':<30} {summary['nodes']:>12}")
+        click.echo(f"{'Connected (now / peak)':<30} {summary['connected']:>12} / {summary['peak_connected']}")
+        click.echo(f"{'Connect failures':<30} {summary['connect_failed']:>12}")
+        click.echo(f"{'Disconnects':<30} {summary['disconnects']:>12}")
+        click.echo(f"{'Connect p50 / p99':<30} {summary['connect_p50_ms']:>10.1f}ms / {summary['connect_p99_ms']:.1f}ms")
+        click.echo(f"{'Params updates applied':<30} {summary['params_remote']:>12}")
+        click.echo(f"{'Commands answered':<30} {summary['commands']:>12}")
+        click.echo(f"{'OTA jobs / status reports':<30} {summary['ota_jobs']:>12} / {summary['ota_status']}")
+        if 'ticks' in summary:
+            click.echo(f"{'Tsdata messages':<30} {summary['tsdata_messages']:>12}")
+            click.echo(f"{'Tsdata missed deadlines':<30} {summary['missed']:>12}")
+            click.echo(f"{'Tsdata jitter p99':<30} {summary['jitter_p99_ms']:>10.2f}ms")
+        click.echo(f"{'Published (acked)':<30} {summary['published']:>12} ({summary['acked']})")
+        click.echo(f"{'Dropped while offline':<30} {summary['dropped']:>12}")
+        click.echo(f"{'Publish errors':<30} {summary['errors']:>12}")
+        click.echo(f"{'Elapsed':<30} {elapsed:>11.2f}s")
+        click.echo("-" * 60)
+
+        if not summary['peak_connected']:
+            message = "✗ No node could connect"
+            if summary.get('last_error'):
+                message += f": {summary['last_error']}"
+            click.echo(click.style(message, fg='red'), err=True)
+            sys.exit(1)
+        if skipped:
+            click.echo(click.style(f"✗ {skipped} node(s) skipped, certificates not found", fg='red'), err=True)
+            sys.exit(1)
+        if not interrupted:
+            click.echo(click.style(f"✓ Simulated {summary['nodes']} node(s) for {elapsed:.0f}s", fg='green'))
+
+    except Exception as e:
+        logger.debug(f"Error in simulate: {str(e)}")
+        click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
+        sys.exit(1)
+    finally:
+        if simulator is not None:
+            simulator.close()
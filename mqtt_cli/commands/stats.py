@@ -0,0 +1,87 @@
+"""
+MQTT latency stats commands.
+"""
+import click
+import json
+import logging
+import sys
+from datetime import datetime
+from ..core.agent import get_agent_client
+from ..utils.stats import load_stats
+from ..utils.debug_logger import debug_log
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+@click.command('stats')
+@click.option('--node-id', help='Only show stats for this node')
+@click.option('--last', is_flag=True, help='Show the stats saved by the last run with --stats, even if an agent is running')
+@click.option('--json', 'as_json', is_flag=True, help='Print the raw stats as JSON')
+@click.pass_context
+@debug_log
+def stats(ctx, node_id, last, as_json):
+    """Show MQTT connect, publish and subscribe latency stats.
+
+    Stats come from the running connection agent, or else from the last
+    command run with --stats. Publish times are publish-to-PUBACK for QoS1,
+    so a slow broker shows up there, while slow message handling shows up
+    as callback time.
+
+    Examples:
+    rm-node stats
+    rm-node --stats tsdata send --node-id node123 --param-name temperature --value 25.5
+    rm-node stats --last --node-id node123
+    """
+    try:
+        data, source = None, None
+        agent_client = None if last else get_agent_client(ctx.obj['CONFIG_DIR'])
+        if agent_client:
+            logger.debug("Reading stats from the connection agent")
+            data, source = agent_client.stats(), 'connection agent'
+        else:
+            data = load_stats(ctx.obj['CONFIG_DIR'])
+            if data:
+                collected = datetime.fromtimestamp(data['collected_at']).strftime('%Y-%m-%d %H:%M:%S')
+                source = f"last --stats run ({collected})"
+
+        if not data:
+            click.echo(click.style("ℹ No stats available. Start the agent or run a command with --stats", fg='yellow'))
+            return 0
+
+        nodes = data.get('nodes', {})
+        if node_id:
+            nodes = {node_id: nodes[node_id]} if node_id in nodes else {}
+        if as_json:
+            click.echo(json.dumps({**data, 'nodes': nodes}, indent=2))
+            return 0
+        if not nodes:
+            click.echo(click.style("ℹ No stats recorded for the selected nodes", fg='yellow'))
+            return 0
+
+        click.echo(f"Stats from {source}")
+        for nid, node_stats in nodes.items():
+            print_node_stats(nid, node_stats)
+        return 0
+    except Exception as e:
+        logger.debug(f"Error reading stats: {str(e)}")
+        click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
+        sys.exit(1)
+
+def print_node_stats(node_id, node_stats):
+    """Print one node's histograms and counters as a table."""
+    rows = [('connect', node_stats['connect']), ('subscribe', node_stats['subscribe']),
+            ('callback', node_stats['callback']), ('keepalive', node_stats.get('keepalive', {'count': 0}))]
+    rows += [(f"publish {topic}", histogram) for topic, histogram in node_stats['publish'].items()]
+
+    click.echo(f"\nNode: {node_id}")
+    click.echo("-" * 80)
+    click.echo(f"{'Operation':<36} {'Count':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'Max ms':>8}")
+    click.echo("-" * 80)
+    for name, histogram in rows:
+        if not histogram['count']:
+            continue
+        click.echo(f"{name[:36]:<36} {histogram['count']:>7} {histogram['p50_ms']:>8.1f} "
+                   f"{histogram['p90_ms']:>8.1f} {histogram['p99_ms']:>8.1f} {histogram['max_ms']:>8.1f}")
+    click.echo("-" * 80)
+    counters = ', '.join(f"{name.replace('_', ' ')}: {value}" for name, value in node_stats['counters'].items())
+    click.echo(counters)
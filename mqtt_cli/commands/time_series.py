@@ -16,7 +16,14 @@ from ..utils.config_manager import ConfigManager
 from ..mqtt_operations import MQTTOperations
 from ..utils.debug_logger import debug_log, debug_step
 from ..utils.connection_manager import ConnectionManager
-from ..core.mqtt_client import get_active_mqtt_client
+from ..core.mqtt_client import PublishTally, get_active_mqtt_client
+from ..core.fanout import DEFAULT_CONNECT_CONCURRENCY, NodeConnector, connect_nodes, load_node_ids
+from ..core.scheduler import RateScheduler
+from ..core.tsdata import (DATA_TYPES, INPUT_FORMATS, MAX_PAYLOAD_BYTES, VALUE_PATTERNS, RecordChunker, TSRecord,
+                           convert_value, make_value_generator, pack_records, parse_param_spec, read_rows,
+                           row_to_record, tsdata_topic)
+from ..core.tscolumns import convert_column, pack_column, timestamp_column
+from ..core.tspipeline import AGGREGATE_FUNCTIONS, build_pipeline
 
 # Get logger for this module
 logger = logging.getLogger(__name__)
@@ -42,23 +49,39 @@ async def ensure_node_connection(ctx, node_id: str) -> bool:
 
 @tsdata.command()
 @click.option('--node-id', required=True, help='Node ID to send data for')
-@click.option('--param-name', required=True, help='Parameter name')
-@click.option('--value', required=True, help='Parameter value')
+@click.option('--param-name', help='Parameter name')
+@click.option('--value', help='Parameter value')
+@click.option('--params', multiple=True,
+              help="Parameters as 'name:value[:type]'; repeat to send several in one message (standard format only)")
 @click.option('--data-type', type=click.Choice(['string', 'int', 'float', 'bool', 'object']), default='string', help='Data type')
 @click.option('--simple', is_flag=True, help='Use simple format')
 @click.option('--expiry-days', '-d', type=int, help='Optional expiration days for data retention (simple format only)')
 @click.option('--basic-ingest', is_flag=True, help='Use basic ingest topic ($aws/rules/esp_*_ts_ingest/...) to save costs')
 @click.pass_context
 @debug_log
-def send(ctx, node_id, param_name, value, data_type, simple, expiry_days, basic_ingest):
+def send(ctx, node_id, param_name, value, params, data_type, simple, expiry_days, basic_ingest):
     """Send time series data point.
     
+    With --params, all parameters are packed into one standard-format
+    message (split only if it would exceed the payload limit).
+    
     Examples:
     rm-node tsdata send --node-id node123 --param-name temperature --value 25.5
     rm-node tsdata send --node-id node123 --param-name status --value true --data-type bool
+    rm-node tsdata send --node-id node123 --params temperature:25.5:float --params humidity:48:int
     rm-node tsdata batch --node-id node123 --param-name humidity --values 45 48 52 --interval 60
     """
     try:
+        if params and (param_name or value is not None):
+            click.echo(click.style("✗ Use either --params or --param-name/--value", fg='red'), err=True)
+            sys.exit(1)
+        if not params and (not param_name or value is None):
+            click.echo(click.style("✗ --param-name and --value are required unless --params is given", fg='red'), err=True)
+            sys.exit(1)
+        if params and simple:
+            click.echo(click.style("✗ The simple format carries one parameter; drop --simple to use --params", fg='red'), err=True)
+            sys.exit(1)
+        
         # Create event loop for async operations
         logger.debug("Creating event loop for async operations")
         loop = asyncio.new_event_loop()
@@ -78,27 +101,20 @@ def send(ctx, node_id, param_name, value, data_type, simple, expiry_days, basic_
         logger.debug(f"Validating node ID: {node_id}")
         validate_node_id(node_id)
         
-        # Convert value to the correct type
+        # Convert values to the correct type
         try:
-            logger.debug(f"Converting value to type {data_type}")
-            if data_type == 'bool':
-                value = value.lower() in ('true', '1', 'yes', 'on')
-            elif data_type == 'int':
-                value = int(value)
-            elif data_type == 'float':
-                value = float(value)
-            elif data_type == 'array':
-                value = json.loads(value)
-                if not isinstance(value, list):
-                    raise ValueError("Value must be a valid JSON array")
-            elif data_type == 'object':
-                value = json.loads(value)
-                if not isinstance(value, dict):
-                    raise ValueError("Value must be a valid JSON object")
-            logger.debug(f"Value converted successfully: {value}")
+            if params:
+                logger.debug(f"Parsing {len(params)} parameters")
+                param_values = [parse_param_spec(spec, data_type) for spec in params]
+            else:
+                logger.debug(f"Converting value to type {data_type}")
+                value = convert_value(value, data_type)
+                param_values = [(param_name, value, data_type)]
+            logger.debug(f"Values converted successfully: {param_values}")
         except (ValueError, json.JSONDecodeError) as e:
             logger.debug(f"Value conversion failed: {str(e)}")
-            click.echo(click.style(f"✗ Invalid value for type {data_type}: {str(e)}", fg='red'), err=True)
+            click.echo(click.style(f"✗ Invalid value for type {data_type}: {str(e)}" if not params else f"✗ {str(e)}",
+                                   fg='red'), err=True)
             sys.exit(1)
         
         timestamp = int(time.time())
@@ -117,39 +133,37 @@ def send(ctx, node_id, param_name, value, data_type, simple, expiry_days, basic_
                 
             topic = "$aws/rules/esp_simple_ts_ingest/node/" if basic_ingest else "node/"
             topic += f"{node_id}/simple_tsdata"
+            payloads = [json.dumps(payload)]
         else:
             logger.debug("Using standard time series format")
-            payload = {
-                "ts_data_version": "2021-09-13",
-                "ts_data": [{
-                    "name": param_name,
-                    "dt": data_type,
-                    "ow": False,
-                    "records": [{
-                        "v": {"value": value},
-                        "t": timestamp
-                    }]
-                }]
-            }
-            topic = "$aws/rules/esp_ts_ingest/node/" if basic_ingest else "node/"
-            topic += f"{node_id}/tsdata"
+            messages = pack_records(TSRecord(node_id, name, dt, val, timestamp) for name, val, dt in param_values)
+            payloads = [message.payload for message in messages]
+            topic = tsdata_topic(node_id, basic_ingest)
 
-        logger.debug(f"Publishing to topic: {topic}")
-        if mqtt_client.publish(topic, json.dumps(payload), qos=1):
-            logger.debug("Time series data published successfully")
-            click.echo(click.style(f"✓ Sent time series data for node {node_id}", fg='green'))
-            click.echo(json.dumps(payload, indent=2))
-            return 0
-        else:
+        if not publish_payloads(mqtt_client, topic, payloads):
             logger.debug("Failed to publish time series data")
             click.echo(click.style("✗ Failed to publish time series data", fg='red'), err=True)
             sys.exit(1)
+        logger.debug("Time series data published successfully")
+        click.echo(click.style(f"✓ Sent time series data for node {node_id}", fg='green'))
+        for payload in payloads:
+            click.echo(json.dumps(json.loads(payload), indent=2))
+        return 0
         
     except Exception as e:
         logger.debug(f"Error in send: {str(e)}")
         click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
         sys.exit(1)
 
+def publish_payloads(mqtt_client, topic, payloads):
+    """Publish messages for one topic back to back and wait for all PUBACKs."""
+    if len(payloads) == 1:
+        return mqtt_client.publish(topic, payloads[0], qos=1)
+    logger.debug(f"Publishing {len(payloads)} messages to {topic}")
+    futures = [mqtt_client.publish_async(topic, payload, qos=1) for payload in payloads]
+    mqtt_client.flush()
+    return all(future.done() and not future.exception() and future.result() for future in futures)
+
 @tsdata.command()
 @click.option('--node-id', required=True, help='Node ID to send data for')
 @click.option('--param-name', required=True, help='Parameter name')
@@ -187,60 +201,33 @@ def batch(ctx, node_id, param_name, values, data_type, interval, basic_ingest):
         logger.debug(f"Validating node ID: {node_id}")
         validate_node_id(node_id)
         
-        # Convert values to the correct type
-        converted_values = []
+        # Convert values to the correct type as one column
         try:
             logger.debug(f"Converting {len(values)} values to type {data_type}")
-            for val in values:
-                if data_type == 'bool':
-                    val = val.lower() in ('true', '1', 'yes', 'on')
-                elif data_type == 'int':
-                    val = int(val)
-                elif data_type == 'float':
-                    val = float(val)
-                elif data_type == 'array':
-                    val = json.loads(val)
-                    if not isinstance(val, list):
-                        raise ValueError("Value must be a valid JSON array")
-                elif data_type == 'object':
-                    val = json.loads(val)
-                    if not isinstance(val, dict):
-                        raise ValueError("Value must be a valid JSON object")
-                converted_values.append(val)
+            column = convert_column(values, data_type)
             logger.debug("Values converted successfully")
         except (ValueError, json.JSONDecodeError) as e:
             logger.debug(f"Value conversion failed: {str(e)}")
             click.echo(click.style(f"✗ Invalid value for type {data_type}: {str(e)}", fg='red'), err=True)
             sys.exit(1)
             
-        # Create records with timestamps
+        # Create records with timestamps; large batches are split under the payload limit
         logger.debug("Creating records with timestamps")
-        base_timestamp = int(time.time())
-        records = []
-        for i, val in enumerate(converted_values):
-            records.append({
-                "v": {"value": val},
-                "t": base_timestamp + (i * interval)
-            })
-            
-        payload = {
-            "ts_data_version": "2021-09-13",
-            "ts_data": [{
-                "name": param_name,
-                "dt": data_type,
-                "ow": False,
-                "records": records
-            }]
-        }
+        timestamps = timestamp_column(int(time.time()), len(column), interval)
+        messages = pack_column(node_id, param_name, data_type, column, timestamps)
+        payloads = [message.payload for message in messages]
         
         topic = "$aws/rules/esp_ts_ingest/node/" if basic_ingest else "node/"
         topic += f"{node_id}/tsdata"
         
         logger.debug(f"Publishing batch data to topic: {topic}")
-        if mqtt_client.publish(topic, json.dumps(payload), qos=1):
+        if publish_payloads(mqtt_client, topic, payloads):
             logger.debug("Batch time series data published successfully")
             click.echo(click.style(f"✓ Sent batch time series data for node {node_id}", fg='green'))
-            click.echo(json.dumps(payload, indent=2))
+            if len(payloads) == 1:
+                click.echo(json.dumps(json.loads(payloads[0]), indent=2))
+            else:
+                click.echo(f"{len(column)} records in {len(payloads)} messages")
             return 0
         else:
             logger.debug("Failed to publish batch time series data")
@@ -288,60 +275,33 @@ def batch_send(ctx, node_id, param_name, values, data_type, interval):
         logger.debug(f"Validating node ID: {node_id}")
         validate_node_id(node_id)
         
-        # Convert values to the correct type
-        converted_values = []
+        # Convert values to the correct type as one column
         try:
             logger.debug(f"Converting {len(values)} values to type {data_type}")
-            for val in values:
-                if data_type == 'bool':
-                    val = val.lower() in ('true', '1', 'yes', 'on')
-                elif data_type == 'int':
-                    val = int(val)
-                elif data_type == 'float':
-                    val = float(val)
-                elif data_type == 'array':
-                    val = json.loads(val)
-                    if not isinstance(val, list):
-                        raise ValueError("Value must be a valid JSON array")
-                elif data_type == 'object':
-                    val = json.loads(val)
-                    if not isinstance(val, dict):
-                        raise ValueError("Value must be a valid JSON object")
-                converted_values.append(val)
+            column = convert_column(values, data_type)
             logger.debug("Values converted successfully")
         except (ValueError, json.JSONDecodeError) as e:
             logger.debug(f"Value conversion failed: {str(e)}")
             click.echo(click.style(f"✗ Invalid value for type {data_type}: {str(e)}", fg='red'), err=True)
             sys.exit(1)
             
-        # Create records with timestamps
+        # Create records with timestamps; large batches are split under the payload limit
         logger.debug("Creating records with timestamps")
-        base_timestamp = int(time.time())
-        records = []
-        for i, val in enumerate(converted_values):
-            records.append({
-                "v": {"value": val},
-                "t": base_timestamp + (i * interval)
-            })
-            
-        payload = {
-            "ts_data_version": "2021-09-13",
-            "ts_data": [{
-                "name": param_name,
-                "dt": data_type,
-                "ow": False,
-                "records": records
-            }]
-        }
+        timestamps = timestamp_column(int(time.time()), len(column), interval)
+        messages = pack_column(node_id, param_name, data_type, column, timestamps)
+        payloads = [message.payload for message in messages]
         
         topic = "$aws/rules/esp_ts_ingest/node/"
         topic += f"{node_id}/tsdata"
         
         logger.debug(f"Publishing batch data to topic: {topic}")
-        if mqtt_client.publish(topic, json.dumps(payload), qos=1):
+        if publish_payloads(mqtt_client, topic, payloads):
             logger.debug("Batch time series data published successfully")
             click.echo(click.style(f"✓ Sent batch time series data for node {node_id}", fg='green'))
-            click.echo(json.dumps(payload, indent=2))
+            if len(payloads) == 1:
+                click.echo(json.dumps(json.loads(payloads[0]), indent=2))
+            else:
+                click.echo(f"{len(column)} records in {len(payloads)} messages")
             return 0
         else:
             logger.debug("Failed to publish batch time series data")
@@ -351,4 +311,335 @@ def batch_send(ctx, node_id, param_name, values, data_type, interval):
     except Exception as e:
         logger.debug(f"Error in batch_send: {str(e)}")
         click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1) 
+
+# Invalid rows reported individually before only counting them
+MAX_REPORTED_ROW_ERRORS = 10
+
+@tsdata.command()
+@click.option('--file', 'input_file', type=click.File('r'), required=True,
+              help="CSV or NDJSON file with one data point per row ('-' for stdin)")
+@click.option('--format', 'input_format', type=click.Choice(INPUT_FORMATS),
+              help='Input format (default: ndjson for .ndjson/.jsonl files, else csv)')
+@click.option('--node-id', help='Node ID for rows without a node_id column')
+@click.option('--param-name', help='Parameter name for rows without a param column')
+@click.option('--data-type', type=click.Choice(DATA_TYPES), default='string', help='Data type for rows without a dt column')
+@click.option('--basic-ingest', is_flag=True, help='Use basic ingest topic ($aws/rules/esp_ts_ingest/...) to save costs')
+@click.option('--max-payload', type=click.IntRange(1024, MAX_PAYLOAD_BYTES), default=MAX_PAYLOAD_BYTES,
+              help=f'Maximum message size in bytes (default: {MAX_PAYLOAD_BYTES})')
+@click.option('--skip-invalid', is_flag=True, help='Skip rows that cannot be parsed instead of stopping')
+@click.option('--aggregate', help=f"Aggregate points per window: {', '.join(AGGREGATE_FUNCTIONS)} or a comma-separated list")
+@click.option('--aggregate-window', type=click.IntRange(min=1), help='Aggregation window in seconds')
+@click.option('--deadband', type=click.FloatRange(min=0), help='Skip values within +/- this much of the last value sent')
+@click.option('--deadband-max-interval', type=click.IntRange(min=1),
+              help='Send a value at least this often (seconds) even inside the dead-band')
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONNECT_CONCURRENCY,
+              help=f'Maximum number of nodes connecting at once (default: {DEFAULT_CONNECT_CONCURRENCY})')
+@click.pass_context
+@debug_log
+def ingest(ctx, input_file, input_format, node_id, param_name, data_type, basic_ingest, max_payload, skip_invalid,
+           aggregate, aggregate_window, deadband, deadband_max_interval, concurrency):
+    """Stream time series data from a CSV or NDJSON file.
+    
+    Each row is one data point with node_id, param, value and optionally t
+    (epoch seconds or ISO 8601) and dt columns; --node-id, --param-name and
+    --data-type fill in missing ones. Points are grouped per node and
+    parameter into messages under the payload limit and published without
+    waiting for each PUBACK, so files of any size stream in constant memory.
+    
+    --aggregate/--aggregate-window and --deadband thin the points out per
+    node parameter before they are packed. Nodes are connected in the
+    background as they first appear, at most --concurrency at once, while
+    reading continues. Messages held for nodes still connecting are capped
+    like the packer's buffer; past it, reading waits for the oldest connect.
+    Every node's connection stays open until the file is done, so a file
+    covering N nodes holds N connections at the end.
+    
+    Examples:
+    rm-node tsdata ingest --file data.csv
+    rm-node tsdata ingest --file readings.ndjson --node-id node123 --data-type float
+    cat data.csv | rm-node tsdata ingest --file - --param-name temperature --data-type float --basic-ingest
+    rm-node tsdata ingest --file data.csv --data-type float --aggregate avg --aggregate-window 60 --deadband 0.2
+    """
+    try:
+        try:
+            pipeline = build_pipeline(aggregate, aggregate_window, deadband, deadband_max_interval)
+        except ValueError as e:
+            click.echo(click.style(f"✗ {str(e)}", fg='red'), err=True)
+            sys.exit(1)
+        if input_format is None:
+            name = getattr(input_file, 'name', '')
+            input_format = 'ndjson' if name.endswith(('.ndjson', '.jsonl')) else 'csv'
+        logger.debug(f"Ingesting {input_format} from {getattr(input_file, 'name', 'stream')}")
+        
+        chunker = RecordChunker(max_payload_bytes=max_payload)
+        connector = NodeConnector(ctx, concurrency)
+        clients = {}
+        failed_nodes = {}
+        # Messages held for nodes whose connection is still being made, oldest node first
+        waiting = {}
+        held = {'bytes': 0}
+        counts = {'rows': 0, 'invalid': 0}
+        tally = PublishTally()
+        
+        def send(message):
+            tally.publish(clients[message.node_id], tsdata_topic(message.node_id, basic_ingest),
+                          message.payload, records=message.records)
+        
+        def release(node):
+            # Wait for a node's connection attempt, then send or fail its held messages
+            result = connector.connect(node).result()
+            messages = waiting.pop(node)
+            held['bytes'] -= sum(len(message.payload) for message in messages)
+            if result.ok:
+                clients[node] = result.client
+                for message in messages:
+                    send(message)
+            else:
+                failed_nodes[node] = result.error
+                click.echo(click.style(f"✗ Failed to connect to node {node}: {result.error}", fg='red'), err=True)
+                tally.fail(len(messages))
+        
+        def settle(block=False):
+            # Release the nodes whose connection attempt has finished, or all of them
+            for node in list(waiting):
+                if block or connector.connect(node).done():
+                    release(node)
+            # Backpressure: a slow handshake must not let held messages grow without bound
+            while held['bytes'] > chunker.max_buffered_bytes:
+                release(next(iter(waiting)))
+        
+        def publish(messages):
+            for message in messages:
+                node = message.node_id
+                if node in clients:
+                    send(message)
+                elif node in failed_nodes:
+                    tally.fail()
+                else:
+                    connector.connect(node)
+                    waiting.setdefault(node, []).append(message)
+                    held['bytes'] += len(message.payload)
+            if waiting:
+                settle()
+        
+        start = time.perf_counter()
+        stopped = False
+        for line_number, row in read_rows(input_file, input_format):
+            counts['rows'] += 1
+            try:
+                record = row_to_record(row, node_id, param_name, data_type)
+            except ValueError as e:
+                if not skip_invalid:
+                    # Rows before the bad one are still sent below
+                    click.echo(click.style(f"✗ Invalid row at line {line_number}: {str(e)}", fg='red'), err=True)
+                    stopped = True
+                    break
+                counts['invalid'] += 1
+                if counts['invalid'] <= MAX_REPORTED_ROW_ERRORS:
+                    click.echo(click.style(f"ℹ Skipping line {line_number}: {str(e)}", fg='yellow'), err=True)
+                continue
+            for reduced in pipeline.process(record):
+                publish(chunker.add(reduced))
+        for reduced in pipeline.flush():
+            publish(chunker.add(reduced))
+        publish(chunker.flush())
+        settle(block=True)
+        
+        logger.debug(f"Waiting for {tally.messages} messages to complete")
+        for mqtt_client in clients.values():
+            mqtt_client.flush()
+        connector.close()
+        elapsed = time.perf_counter() - start
+        
+        click.echo("\nIngest Summary:")
+        click.echo("-" * 60)
+        click.echo(f"{'Rows read':<30} {counts['rows']:>12}")
+        if counts['invalid']:
+            click.echo(f"{'Rows skipped':<30} {counts['invalid']:>12}")
+        if pipeline.stages:
+            share = 100.0 * pipeline.records_out / pipeline.records_in if pipeline.records_in else 0.0
+            click.echo(f"{'Points after reduction':<30} {pipeline.records_out:>12} ({share:.1f}% of input)")
+        click.echo(f"{'Records published':<30} {tally.records:>12}")
+        click.echo(f"{'Messages':<30} {tally.messages:>12}")
+        click.echo(f"{'Payload bytes':<30} {tally.bytes:>12}")
+        click.echo(f"{'Nodes':<30} {len(clients):>12}")
+        click.echo(f"{'Elapsed':<30} {elapsed:>11.2f}s")
+        if elapsed:
+            click.echo(f"{'Throughput':<30} {counts['rows'] / elapsed:>8.0f} rows/s")
+        click.echo("-" * 60)
+        
+        if stopped:
+            sys.exit(1)
+        if tally.errors or failed_nodes:
+            click.echo(click.style(f"✗ {tally.errors} message(s) failed"
+                                   + (f", {len(failed_nodes)} node(s) could not connect" if failed_nodes else ""),
+                                   fg='red'), err=True)
+            sys.exit(1)
+        click.echo(click.style(f"✓ Ingested {tally.records} records in {tally.acked} messages", fg='green'))
+        
+    except Exception as e:
+        logger.debug(f"Error in ingest: {str(e)}")
+        click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
+        sys.exit(1)
+
+
+@tsdata.command()
+@click.option('--node-id', help='Node ID(s) to stream for. Can be single ID or comma-separated list')
+@click.option('--node-file', type=click.File('r'),
+              help="File with node IDs, one per line ('-' to read from stdin)")
+@click.option('--param-name', required=True, multiple=True, help='Parameter name (repeat for several parameters)')
+@click.option('--rate', type=click.FloatRange(min=0, min_open=True), default=1.0,
+              help='Points per second for each node parameter (default: 1)')
+@click.option('--duration', type=click.FloatRange(min=0, min_open=True), help='Seconds to run (default: until Ctrl+C)')
+@click.option('--pattern', type=click.Choice(VALUE_PATTERNS), default='sine', help='Shape of the generated values')
+@click.option('--min', 'low', type=float, default=0.0, help='Lowest generated value (default: 0)')
+@click.option('--max', 'high', type=float, default=100.0, help='Highest generated value (default: 100)')
+@click.option('--data-type', type=click.Choice(['float', 'int']), default='float', help='Data type')
+@click.option('--batch-interval', type=click.FloatRange(min=0), default=0.0,
+              help='Collect points per node for this many seconds before publishing (default: publish every tick)')
+@click.option('--basic-ingest', is_flag=True, help='Use basic ingest topic ($aws/rules/esp_ts_ingest/...) to save costs')
+@click.option('--aggregate', help=f"Aggregate points per window: {', '.join(AGGREGATE_FUNCTIONS)} or a comma-separated list")
+@click.option('--aggregate-window', type=click.IntRange(min=1), help='Aggregation window in seconds')
+@click.option('--deadband', type=click.FloatRange(min=0), help='Skip values within +/- this much of the last value sent')
+@click.option('--deadband-max-interval', type=click.IntRange(min=1),
+              help='Send a value at least this often (seconds) even inside the dead-band')
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONNECT_CONCURRENCY,
+              help=f'Maximum number of nodes connecting at once (default: {DEFAULT_CONNECT_CONCURRENCY})')
+@click.option('--report-interval', type=click.FloatRange(min=0), default=10.0,
+              help='Seconds between progress lines, 0 to disable (default: 10)')
+@click.pass_context
+@debug_log
+def stream(ctx, node_id, node_file, param_name, rate, duration, pattern, low, high, data_type, batch_interval,
+           basic_ingest, aggregate, aggregate_window, deadband, deadband_max_interval, concurrency, report_interval):
+    """Generate time series data at a fixed rate for one or more nodes.
+    
+    Every node ticks --rate times per second and produces one value per
+    parameter on each tick. Ticks are scheduled against the monotonic
+    clock, so the achieved rate does not drift over long runs, and nodes
+    are spread evenly over the period instead of all firing at once.
+    Progress lines report the achieved rate, how late ticks ran (jitter)
+    and ticks missed because publishing could not keep up.
+    
+    Examples:
+    rm-node tsdata stream --node-id node123 --param-name temperature --rate 1 --duration 60
+    rm-node tsdata stream --node-file nodes.txt --param-name temperature --param-name humidity --rate 50
+    rm-node tsdata stream --node-id node123 --param-name power --rate 10 --batch-interval 5 --pattern walk
+    """
+    try:
+        node_ids = load_node_ids(node_id, node_file)
+        if not node_ids:
+            click.echo(click.style("✗ No node IDs given. Use --node-id or --node-file", fg='red'), err=True)
+            sys.exit(1)
+        if low > high:
+            click.echo(click.style("✗ --min must not be greater than --max", fg='red'), err=True)
+            sys.exit(1)
+        try:
+            pipeline = build_pipeline(aggregate, aggregate_window, deadband, deadband_max_interval)
+        except ValueError as e:
+            click.echo(click.style(f"✗ {str(e)}", fg='red'), err=True)
+            sys.exit(1)
+        param_names = list(dict.fromkeys(param_name))
+        
+        click.echo(f"Connecting {len(node_ids)} node(s)...")
+        results = connect_nodes(ctx, node_ids, concurrency)
+        clients = {node: result.client for node, result in results.items() if result.ok}
+        for node, result in results.items():
+            if not result.ok:
+                click.echo(click.style(f"✗ Failed to connect to node {node}: {result.error}", fg='red'), err=True)
+        if not clients:
+            sys.exit(1)
+        
+        counts = {'points': 0}
+        tally = PublishTally()
+        
+        def publish(records):
+            for message in pack_records(records):
+                tally.publish(clients[message.node_id], tsdata_topic(message.node_id, basic_ingest),
+                              message.payload, records=message.records)
+        
+        scheduler = RateScheduler()
+        # Points are stamped with the wall-clock time of their scheduled tick
+        wall_offset = time.time() - time.monotonic()
+        ticks_per_batch = max(1, round(batch_interval * rate))
+        pending = {node: [] for node in clients}
+        
+        def make_tick(node, generators):
+            def tick(number, deadline):
+                t = int(wall_offset + deadline)
+                elapsed = number / rate
+                for name, generate in generators:
+                    value = generate(elapsed)
+                    value = round(value) if data_type == 'int' else round(value, 3)
+                    counts['points'] += 1
+                    pending[node].extend(pipeline.process(TSRecord(node, name, data_type, value, t)))
+                if (number + 1) % ticks_per_batch == 0 and pending[node]:
+                    publish(pending[node])
+                    pending[node] = []
+            return tick
+        
+        for index, node in enumerate(clients):
+            generators = [(name, make_value_generator(pattern, low, high)) for name in param_names]
+            scheduler.add(rate, make_tick(node, generators), phase=index / len(clients))
+        
+        last_report = {'at': time.monotonic(), 'ticks': 0}
+        
+        def report(now):
+            if not report_interval or now - last_report['at'] < report_interval:
+                return
+            stats = scheduler.stats
+            achieved = (stats.ticks - last_report['ticks']) / (now - last_report['at'])
+            click.echo(f"[{now - stats.started:7.1f}s] {achieved:8.1f} ticks/s  "
+                       f"jitter p50 {stats.lateness.percentile(50):.2f}ms p99 {stats.lateness.percentile(99):.2f}ms  "
+                       f"missed {stats.missed}  messages {tally.messages}  errors {tally.errors}")
+            last_report.update(at=now, ticks=stats.ticks)
+        
+        target = rate * len(clients)
+        click.echo(f"Streaming {len(param_names)} parameter(s) for {len(clients)} node(s) at {rate:g} Hz "
+                   f"({target:g} ticks/s){f' for {duration:g}s' if duration else ', Ctrl+C to stop'}")
+        interrupted = False
+        try:
+            stats = scheduler.run(duration, on_wakeup=report)
+        except KeyboardInterrupt:
+            interrupted = True
+            stats = scheduler.stats
+            click.echo(click.style("\nℹ Stopping, sending remaining data...", fg='yellow'))
+        
+        leftover = [record for records in pending.values() for record in records] + pipeline.flush()
+        if leftover:
+            publish(leftover)
+        logger.debug(f"Waiting for {tally.messages} messages to complete")
+        for mqtt_client in clients.values():
+            mqtt_client.flush()
+        summary = stats.to_dict()
+        
+        click.echo("\nStream Summary:")
+        click.echo("-" * 60)
+        click.echo(f"{'Nodes':<30} {len(clients):>12}")
+        click.echo(f"{'Ticks':<30} {summary['ticks']:>12}")
+        click.echo(f"{'Missed deadlines':<30} {summary['missed']:>12}")
+        click.echo(f"{'Rate (target / achieved)':<30} {target:>12.1f} / {summary['rate']:.1f} ticks/s")
+        click.echo(f"{'Jitter p50 / p99 / max':<30} {summary['jitter_p50_ms']:>10.2f}ms / "
+                   f"{summary['jitter_p99_ms']:.2f}ms / {summary['jitter_max_ms']:.2f}ms")
+        click.echo(f"{'Points generated':<30} {counts['points']:>12}")
+        if pipeline.stages:
+            share = 100.0 * pipeline.records_out / pipeline.records_in if pipeline.records_in else 0.0
+            click.echo(f"{'Points after reduction':<30} {pipeline.records_out:>12} ({share:.1f}% of input)")
+        click.echo(f"{'Records published':<30} {tally.records:>12}")
+        click.echo(f"{'Messages':<30} {tally.messages:>12}")
+        click.echo(f"{'Elapsed':<30} {summary['elapsed']:>11.2f}s")
+        click.echo("-" * 60)
+        
+        failed_nodes = len(results) - len(clients)
+        if tally.errors or failed_nodes:
+            click.echo(click.style(f"✗ {tally.errors} message(s) failed"
+                                   + (f", {failed_nodes} node(s) could not connect" if failed_nodes else ""),
+                                   fg='red'), err=True)
+            sys.exit(1)
+        if not interrupted:
+            click.echo(click.style(f"✓ Streamed {tally.records} records in {tally.acked} messages", fg='green'))
+        
+    except Exception as e:
+        logger.debug(f"Error in stream: {str(e)}")
+        click.echo(click.style(f"✗ Error: {str(e)}", fg='red'), err=True)
+        sys.exit(1)
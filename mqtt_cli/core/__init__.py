@@ -1,11 +1,27 @@
 """
 Core functionality for MQTT CLI.
 """
-from .connection import ConnectionManager
-from .mqtt_client import connect_single_node, get_active_mqtt_client
+import importlib
 
 __all__ = [
     'ConnectionManager',
     'connect_single_node',
-    'get_active_mqtt_client'
-] 
\ No newline at end of file
+    'get_active_mqtt_client',
+    'ConnectionAgent',
+    'get_agent_client'
+]
+
+# Exports are resolved on first access so importing a single core module
+# does not load the others
+_LAZY_EXPORTS = {
+    'ConnectionManager': '.connection',
+    'connect_single_node': '.mqtt_client',
+    'get_active_mqtt_client': '.mqtt_client',
+    'ConnectionAgent': '.agent',
+    'get_agent_client': '.agent',
+}
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        return getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
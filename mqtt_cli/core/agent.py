@@ -0,0 +1,567 @@
+"""
+Connection agent for MQTT CLI.
+
+The agent is a long-running local process that owns live MQTT connections.
+CLI invocations talk to it over a Unix domain socket in the configuration
+directory, so repeated commands against the same node reuse one TLS/MQTT
+session instead of performing a full handshake every time.
+
+The wire protocol is newline-delimited JSON: every request is a single JSON
+object with an ``op`` field, every response is a single JSON object with an
+``ok`` field. A ``subscribe`` request turns its socket into a message stream
+that stays open until the client closes it. Message payloads are carried
+base64-encoded in both directions, so binary payloads pass unchanged.
+"""
+import base64
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from ..utils.exceptions import MQTTConnectionError
+from .dispatcher import MessageDispatcher
+from .history import HistoryEntry, MessageHistory
+
+AGENT_SOCKET_NAME = 'agent.sock'
+AGENT_PID_NAME = 'agent.pid'
+AGENT_LOG_NAME = 'agent.log'
+AGENT_RPC_TIMEOUT = 60
+# Concurrent publish requests per node for AgentMQTTClient.publish_async
+AGENT_INFLIGHT_WINDOW = 16
+
+logger = logging.getLogger(__name__)
+
+
+def get_agent_socket_path(config_dir) -> Path:
+    """Get the agent socket path for a configuration directory."""
+    return Path(config_dir) / AGENT_SOCKET_NAME
+
+
+def get_agent_pid_path(config_dir) -> Path:
+    """Get the agent PID file path for a configuration directory."""
+    return Path(config_dir) / AGENT_PID_NAME
+
+
+class AgentMessage:
+    """Message delivered through an agent subscription.
+
+    Mirrors the attributes of the SDK message object so existing
+    ``callback(client, userdata, message)`` handlers work unchanged.
+    """
+    def __init__(self, topic: str, payload: bytes, qos: int = 0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+
+
+class AgentClient:
+    """Client side of the agent RPC protocol."""
+    def __init__(self, socket_path):
+        self.socket_path = str(socket_path)
+
+    def _open(self, timeout=AGENT_RPC_TIMEOUT) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def request(self, op: str, timeout=AGENT_RPC_TIMEOUT, **params) -> dict:
+        """Send a single request and return the decoded response.
+
+        Raises:
+            MQTTConnectionError: If the agent is unreachable or reports an error
+        """
+        params['op'] = op
+        try:
+            with self._open(timeout) as sock:
+                sock.sendall(json.dumps(params).encode() + b'\n')
+                with sock.makefile('rb') as reader:
+                    line = reader.readline()
+        except OSError as e:
+            raise MQTTConnectionError(f"Agent unavailable: {str(e)}")
+
+        if not line:
+            raise MQTTConnectionError("Agent closed the connection")
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise MQTTConnectionError(response.get('error', 'Agent request failed'))
+        return response
+
+    def ping(self) -> dict:
+        """Check that the agent is alive."""
+        return self.request('ping', timeout=2)
+
+    def status(self, node_id: Optional[str] = None) -> dict:
+        """Get connection status for one node or all nodes."""
+        return self.request('status', node_id=node_id)['nodes']
+
+    def connect(self, node_id: str, broker: str, cert_path: str, key_path: str) -> bool:
+        """Ask the agent to open (or reuse) a connection for a node."""
+        return self.request('connect', node_id=node_id, broker=broker,
+                            cert_path=str(cert_path), key_path=str(key_path))['connected']
+
+    def disconnect(self, node_id: str) -> bool:
+        """Ask the agent to close a node connection."""
+        return self.request('disconnect', node_id=node_id)['result']
+
+    def publish(self, node_id: str, topic: str, payload, qos: int = 1) -> bool:
+        """Publish through a connection owned by the agent; the payload is sent byte for byte."""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        return self.request('publish', node_id=node_id, topic=topic,
+                            payload=base64.b64encode(payload).decode(), qos=qos)['result']
+
+    def stats(self) -> dict:
+        """Get latency stats for the connections owned by the agent."""
+        return self.request('stats')['stats']
+
+    def history(self, topic: str = '#', last: Optional[int] = None,
+                since: Optional[float] = None) -> List[HistoryEntry]:
+        """Recent messages received on any agent connection, oldest first."""
+        messages = self.request('history', topic=topic, last=last, since=since)['messages']
+        return [HistoryEntry(item['topic'], item['timestamp'], base64.b64decode(item['payload']))
+                for item in messages]
+
+    def shutdown(self):
+        """Stop the agent process."""
+        return self.request('shutdown', timeout=5)
+
+    def open_subscription(self, node_id: str, topic: str, qos: int, callback) -> 'AgentSubscription':
+        """Open a streaming subscription and dispatch messages to callback."""
+        try:
+            sock = self._open(timeout=None)
+            sock.sendall(json.dumps({'op': 'subscribe', 'node_id': node_id,
+                                     'topic': topic, 'qos': qos}).encode() + b'\n')
+            reader = sock.makefile('rb')
+            response = json.loads(reader.readline() or b'{}')
+        except OSError as e:
+            raise MQTTConnectionError(f"Agent unavailable: {str(e)}")
+        if not response.get('ok'):
+            sock.close()
+            raise MQTTConnectionError(response.get('error', 'Agent subscribe failed'))
+        return AgentSubscription(sock, reader, callback)
+
+
+class AgentSubscription:
+    """Reader thread for a streaming agent subscription."""
+    def __init__(self, sock, reader, callback):
+        self._sock = sock
+        self._reader = reader
+        self._callback = callback
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for line in self._reader:
+                data = json.loads(line)
+                message = AgentMessage(data['topic'], base64.b64decode(data['payload']), data.get('qos', 0))
+                try:
+                    self._callback(None, None, message)
+                except Exception as e:
+                    logger.debug(f"Subscription callback failed: {str(e)}")
+        except (OSError, ValueError):
+            pass
+
+    def close(self):
+        """Close the stream; the agent drops the subscription when the last stream closes."""
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+
+class AgentMQTTClient:
+    """MQTTOperations-compatible proxy for a connection owned by the agent."""
+    def __init__(self, agent: AgentClient, node_id: str, broker: Optional[str] = None,
+                 inflight_window: int = AGENT_INFLIGHT_WINDOW):
+        self.agent = agent
+        self.node_id = node_id
+        self.broker = broker
+        # Agent streams by topic filter; handlers sharing a stream are routed by the dispatcher
+        self.subscriptions: Dict[str, AgentSubscription] = {}
+        self.dispatcher = MessageDispatcher()
+        self.logger = logging.getLogger("mqtt_cli")
+        self.inflight_window = inflight_window
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(inflight_window)
+        self._futures = set()
+
+    def connect(self):
+        return self.is_connected()
+
+    def disconnect(self):
+        """Detach from the agent; the agent keeps the connection alive."""
+        for subscription in self.subscriptions.values():
+            subscription.close()
+        self.subscriptions.clear()
+        self.dispatcher = MessageDispatcher()
+        return True
+
+    def is_connected(self):
+        try:
+            return self.agent.status(self.node_id).get(self.node_id, {}).get('connected', False)
+        except MQTTConnectionError:
+            return False
+
+    def reconnect(self) -> bool:
+        return self.is_connected()
+
+    def ping(self) -> bool:
+        return self.is_connected()
+
+    def publish(self, topic, payload, qos=1):
+        """Publish through the agent."""
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
+        result = self.agent.publish(self.node_id, topic, payload, int(qos))
+        if result:
+            self.logger.debug(f"Published to {topic} via agent: {payload}")
+        return result
+
+    def publish_async(self, topic, payload, qos=1):
+        """Publish through the agent without waiting for the PUBACK.
+
+        Each publish is a separate agent request; up to inflight_window of
+        them are outstanding at once, so the agent keeps that many PUBACKs
+        in flight on the node connection.
+
+        Returns:
+            concurrent.futures.Future resolving to the publish result
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.inflight_window,
+                                                thread_name_prefix=f"agent-publish-{self.node_id}")
+        # Block the caller rather than queueing without bound
+        self._slots.acquire()
+        future = self._executor.submit(self.publish, topic, payload, qos)
+        self._futures.add(future)
+        future.add_done_callback(self._publish_done)
+        return future
+
+    def _publish_done(self, future):
+        self._futures.discard(future)
+        self._slots.release()
+
+    def flush(self, timeout=None):
+        """Wait for every outstanding publish_async to complete."""
+        _, not_done = wait(list(self._futures), timeout=timeout)
+        return not not_done
+
+    def subscribe(self, topic, qos=1, callback=None):
+        """Subscribe through the agent; messages are delivered on a reader thread."""
+        if callback is None:
+            raise MQTTConnectionError("Agent subscriptions require a callback")
+        return self._add_handler(topic, callback, qos, replace=True, own=True)
+
+    def add_handler(self, topic_filter, handler, qos=1):
+        """Add a handler, sharing an open agent stream whose filter covers topic_filter."""
+        return self._add_handler(topic_filter, handler, qos)
+
+    def _add_handler(self, topic_filter, handler, qos, replace=False, own=False):
+        broker_filter = self.dispatcher.add(topic_filter, handler, int(qos), replace=replace, own=own)
+        if broker_filter is None:
+            return True
+        if broker_filter in self.subscriptions:
+            self.subscriptions.pop(broker_filter).close()
+        try:
+            self.subscriptions[broker_filter] = self.agent.open_subscription(
+                self.node_id, broker_filter, int(qos), self.dispatcher.callback_for(broker_filter))
+        except MQTTConnectionError:
+            self.dispatcher.remove(topic_filter, handler)
+            raise
+        return True
+
+    def remove_handler(self, topic_filter, handler):
+        return self._remove_handler(topic_filter, handler)
+
+    def unsubscribe(self, topic):
+        return self._remove_handler(topic)
+
+    def recent_messages(self, topic_filter='#', last=None, since=None):
+        """Recent messages from the agent's history, which is shared by all its connections."""
+        return self.agent.history(topic_filter, last=last, since=since)
+
+    def _remove_handler(self, topic_filter, handler=None):
+        broker_filter = self.dispatcher.remove(topic_filter, handler)
+        subscription = self.subscriptions.pop(broker_filter, None) if broker_filter else None
+        if subscription:
+            subscription.close()
+        return True
+
+
+def get_agent_client(config_dir) -> Optional[AgentClient]:
+    """Return a client for a running agent, or None if no agent answers."""
+    socket_path = get_agent_socket_path(config_dir)
+    if not socket_path.exists():
+        return None
+    client = AgentClient(socket_path)
+    try:
+        client.ping()
+        return client
+    except (MQTTConnectionError, ValueError):
+        return None
+
+
+class _AgentRequestHandler(socketserver.StreamRequestHandler):
+    """Handle one client socket; it may carry several requests."""
+
+    def handle(self):
+        for line in self.rfile:
+            op = None
+            try:
+                request = json.loads(line)
+                op = request.get('op')
+                if op == 'subscribe':
+                    self.server.agent.stream_subscription(request, self.rfile, self.wfile)
+                    return
+                response = self.server.agent.dispatch(op, request)
+                response['ok'] = True
+            except Exception as e:
+                response = {'ok': False, 'error': str(e)}
+            try:
+                self.wfile.write(json.dumps(response).encode() + b'\n')
+                self.wfile.flush()
+            except OSError:
+                return
+            if op == 'shutdown':
+                # Stop only after the reply has been delivered
+                self.server.agent.stop()
+                return
+
+
+class _AgentUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class ConnectionAgent:
+    """Server side of the agent: owns MQTTOperations clients keyed by node ID."""
+    def __init__(self, config_dir, client_factory=None):
+        self.config_dir = Path(config_dir)
+        self.socket_path = get_agent_socket_path(config_dir)
+        self.pid_path = get_agent_pid_path(config_dir)
+        self.clients = {}
+        self.started = time.time()
+        self._client_factory = client_factory or self._create_client
+        self._lock = threading.Lock()
+        self._node_locks: Dict[str, threading.Lock] = {}
+        self._streams: Dict[tuple, Set] = {}
+        self._fanouts: Dict[tuple, object] = {}
+        # Messages received on every connection, under one memory cap
+        self.history = MessageHistory()
+        self._server = None
+
+    def _create_client(self, broker, node_id, cert_path, key_path):
+        from ..mqtt_operations import MQTTOperations
+        from ..utils.config_manager import ConfigManager
+        from .spool import get_node_spool
+        # The agent owns the spool of every node it holds a connection for
+        spool = get_node_spool(ConfigManager(self.config_dir), node_id)
+        return MQTTOperations(broker=broker, node_id=node_id, cert_path=cert_path, key_path=key_path,
+                              spool=spool, history=self.history)
+
+    def _node_lock(self, node_id: str) -> threading.Lock:
+        with self._lock:
+            return self._node_locks.setdefault(node_id, threading.Lock())
+
+    def _get_client(self, node_id: str):
+        client = self.clients.get(node_id)
+        if client is None:
+            raise MQTTConnectionError(f"Node {node_id} is not connected to the agent")
+        return client
+
+    def dispatch(self, op: str, request: dict) -> dict:
+        """Execute a non-streaming request."""
+        handler = getattr(self, f"op_{op}", None)
+        if handler is None:
+            raise ValueError(f"Unknown agent operation: {op}")
+        return handler(request)
+
+    def op_ping(self, request):
+        return {'pid': os.getpid(), 'uptime': time.time() - self.started, 'nodes': len(self.clients)}
+
+    def op_status(self, request):
+        node_id = request.get('node_id')
+        node_ids = [node_id] if node_id else list(self.clients)
+        nodes = {}
+        for nid in node_ids:
+            client = self.clients.get(nid)
+            if client is not None:
+                nodes[nid] = {'connected': client.is_connected(), 'broker': client.broker}
+                if hasattr(client, 'liveness'):
+                    nodes[nid].update(client.liveness())
+        return {'nodes': nodes}
+
+    def op_connect(self, request):
+        node_id = request['node_id']
+        with self._node_lock(node_id):
+            client = self.clients.get(node_id)
+            if client is not None and client.broker == request['broker'] and client.is_connected():
+                return {'connected': True}
+            if client is not None:
+                self._close_client(node_id, self.clients.pop(node_id))
+            client = self._client_factory(request['broker'], node_id, request['cert_path'], request['key_path'])
+            try:
+                connected = bool(client.connect())
+            except Exception:
+                # Release the failed client's spool so a later connect can take it
+                self._close_client(node_id, client)
+                raise
+            if not connected:
+                self._close_client(node_id, client)
+                return {'connected': False}
+            self.clients[node_id] = client
+            logger.info(f"Agent connected node {node_id}")
+            return {'connected': True}
+
+    @staticmethod
+    def _close_client(node_id: str, client):
+        """Disconnect a client and release its spool."""
+        try:
+            if hasattr(client, 'close'):
+                client.close()
+            else:
+                client.disconnect()
+        except Exception as e:
+            logger.debug(f"Disconnect failed for {node_id}: {str(e)}")
+
+    def op_disconnect(self, request):
+        node_id = request['node_id']
+        with self._node_lock(node_id):
+            client = self.clients.pop(node_id, None)
+            if client is None:
+                return {'result': False}
+            self._close_client(node_id, client)
+            return {'result': True}
+
+    def op_publish(self, request):
+        client = self._get_client(request['node_id'])
+        payload = base64.b64decode(request['payload'])
+        return {'result': bool(client.publish(request['topic'], payload, request.get('qos', 1)))}
+
+    def op_stats(self, request):
+        from ..utils.stats import collect_stats
+        return {'stats': collect_stats()}
+
+    def op_history(self, request):
+        entries = self.history.query(request.get('topic') or '#', last=request.get('last'),
+                                     since=request.get('since'))
+        return {'messages': [{'topic': entry.topic, 'timestamp': entry.timestamp,
+                              'payload': base64.b64encode(entry.payload).decode()} for entry in entries]}
+
+    def op_shutdown(self, request):
+        return {}
+
+    def stream_subscription(self, request, rfile, wfile):
+        """Forward messages for a subscription until the client hangs up."""
+        node_id, topic = request['node_id'], request['topic']
+        key = (node_id, topic)
+        write_lock = threading.Lock()
+
+        def send(line: bytes):
+            with write_lock:
+                wfile.write(line)
+                wfile.flush()
+
+        try:
+            client = self._get_client(node_id)
+            with self._lock:
+                streams = self._streams.setdefault(key, set())
+                first = not streams
+                streams.add(send)
+            if first:
+                # Streams whose filters overlap share broker subscriptions on the node connection
+                fanout = self._fanouts[key] = self._make_fanout(key)
+                client.add_handler(topic, fanout, request.get('qos', 1))
+            send(json.dumps({'ok': True}).encode() + b'\n')
+        except Exception as e:
+            self._drop_stream(key, send)
+            try:
+                send(json.dumps({'ok': False, 'error': str(e)}).encode() + b'\n')
+            except OSError:
+                pass
+            return
+
+        # Block until the client closes its end of the socket
+        try:
+            while rfile.readline():
+                pass
+        except OSError:
+            pass
+        self._drop_stream(key, send)
+
+    def _make_fanout(self, key):
+        def fanout(client, userdata, message):
+            line = json.dumps({
+                'topic': message.topic,
+                'payload': base64.b64encode(message.payload).decode(),
+                'qos': getattr(message, 'qos', 0)
+            }).encode() + b'\n'
+            for send in list(self._streams.get(key, ())):
+                try:
+                    send(line)
+                except OSError:
+                    self._drop_stream(key, send)
+        return fanout
+
+    def _drop_stream(self, key, send):
+        with self._lock:
+            streams = self._streams.get(key)
+            if streams is None:
+                return
+            streams.discard(send)
+            if streams:
+                return
+            del self._streams[key]
+            fanout = self._fanouts.pop(key, None)
+        client = self.clients.get(key[0])
+        if client is not None and fanout is not None:
+            try:
+                client.remove_handler(key[1], fanout)
+            except Exception as e:
+                logger.debug(f"Unsubscribe failed for {key}: {str(e)}")
+
+    def serve_forever(self):
+        """Bind the socket and serve requests until stopped."""
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            if get_agent_client(self.config_dir):
+                raise MQTTConnectionError(f"An agent is already running on {self.socket_path}")
+            self.socket_path.unlink()
+
+        self._server = _AgentUnixServer(str(self.socket_path), _AgentRequestHandler)
+        self._server.agent = self
+        os.chmod(self.socket_path, 0o600)
+        self.pid_path.write_text(str(os.getpid()))
+        logger.info(f"Agent listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._cleanup()
+
+    def stop(self):
+        """Stop serving; serve_forever returns and connections are closed.
+
+        Blocks until serve_forever has returned, so it must not be called
+        from the thread that is running serve_forever.
+        """
+        if self._server:
+            self._server.shutdown()
+
+    def _cleanup(self):
+        for node_id in list(self.clients):
+            self.op_disconnect({'node_id': node_id})
+        if self._server:
+            self._server.server_close()
+        for path in (self.socket_path, self.pid_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
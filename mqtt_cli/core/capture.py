@@ -0,0 +1,277 @@
+"""
+Binary capture files of MQTT traffic for MQTT CLI.
+
+`messaging record` appends received messages to a capture (.rml) file and
+`messaging replay` publishes them again with their original spacing, so a
+burst seen in production can be reproduced against a staging broker.
+
+Capture layout (little endian): the magic b'RML1', then one record per
+message:
+
+    crc32:u32  length:u32  timestamp:f64  qos:u8  topic_len:u16  topic  payload
+
+where length covers everything after the first eight bytes and the CRC is
+taken over the same bytes, as in the publish spool. A torn tail record, left
+by a recorder that was killed, ends the capture when it is read and is cut
+off when the capture is appended to.
+
+A sparse time index is kept next to the capture in <capture>.idx as
+(timestamp:f64, offset:u64) pairs, one per INDEX_INTERVAL seconds of
+traffic, so replaying from the middle of a long capture seeks rather than
+reading everything before it. The index can always be rebuilt from the
+capture and is only a hint: a missing or short index just means more
+reading.
+"""
+import bisect
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .dispatcher import topic_matches
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_MAGIC = b'RML1'
+INDEX_SUFFIX = '.idx'
+# Seconds of traffic between time index entries
+INDEX_INTERVAL = 1.0
+
+_HEADER = struct.Struct('<II')
+_META = struct.Struct('<dBH')
+_INDEX_ENTRY = struct.Struct('<dQ')
+
+_WRITE_BUFFER = 1024 * 1024
+
+
+class CaptureFormatError(Exception):
+    """Raised when a file is not a capture."""
+
+
+class CaptureRecord(NamedTuple):
+    """One captured message."""
+    timestamp: float
+    topic: str
+    qos: int
+    payload: bytes
+
+
+def get_index_path(path) -> Path:
+    """Get the time index path for a capture file."""
+    path = Path(path)
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+def _scan(file, offset: int) -> Iterator[Tuple[int, int, bytes]]:
+    """Yield (offset, size, body) for every intact record from offset on."""
+    file.seek(offset)
+    while True:
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        crc, length = _HEADER.unpack(header)
+        body = file.read(length)
+        if len(body) != length or length < _META.size or zlib.crc32(body) != crc:
+            return
+        yield offset, _HEADER.size + length, body
+        offset += _HEADER.size + length
+
+
+def _decode(body: bytes) -> CaptureRecord:
+    timestamp, qos, topic_len = _META.unpack_from(body)
+    start = _META.size
+    return CaptureRecord(timestamp, body[start:start + topic_len].decode('utf-8'), qos,
+                         body[start + topic_len:])
+
+
+def _check_magic(file, path):
+    if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+        raise CaptureFormatError(f"{path} is not a capture file")
+
+
+class CaptureWriter:
+    """Appends messages to a capture file and its time index.
+
+    append() only copies into a write buffer, so it can be called from the
+    MQTT network thread; call flush() now and then to get the buffered
+    messages onto disk.
+    """
+
+    def __init__(self, path, index_interval: float = INDEX_INTERVAL):
+        self.path = Path(path)
+        self.index_path = get_index_path(path)
+        self.index_interval = index_interval
+        self.count = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._last_indexed = None
+        self._open()
+
+    def _open(self):
+        """Create the capture, or find the end of an existing one and rebuild its index."""
+        index = []
+        if self.path.exists() and self.path.stat().st_size > 0:
+            with open(self.path, 'r+b') as file:
+                _check_magic(file, self.path)
+                end = len(CAPTURE_MAGIC)
+                for offset, size, body in _scan(file, end):
+                    timestamp = _META.unpack_from(body)[0]
+                    if self._last_indexed is None or timestamp >= self._last_indexed + self.index_interval:
+                        index.append(_INDEX_ENTRY.pack(timestamp, offset))
+                        self._last_indexed = timestamp
+                    end = offset + size
+                file.seek(0, os.SEEK_END)
+                if file.tell() > end:
+                    logger.warning(f"Discarding {file.tell() - end} corrupt bytes at the end of {self.path}")
+                    file.truncate(end)
+            self._offset = end
+            self._file = open(self.path, 'ab', buffering=_WRITE_BUFFER)
+        else:
+            self._file = open(self.path, 'wb', buffering=_WRITE_BUFFER)
+            self._file.write(CAPTURE_MAGIC)
+            self._offset = len(CAPTURE_MAGIC)
+        self._index_file = open(self.index_path, 'wb')
+        self._index_file.write(b''.join(index))
+
+    def append(self, topic: str, payload, qos: int = 0, timestamp: Optional[float] = None):
+        """Add one message; the timestamp defaults to now."""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        if timestamp is None:
+            timestamp = time.time()
+        topic_bytes = topic.encode('utf-8')
+        body = _META.pack(timestamp, qos, len(topic_bytes)) + topic_bytes + bytes(payload)
+        record = _HEADER.pack(zlib.crc32(body), len(body)) + body
+        with self._lock:
+            if self._last_indexed is None or timestamp >= self._last_indexed + self.index_interval:
+                self._index_file.write(_INDEX_ENTRY.pack(timestamp, self._offset))
+                self._last_indexed = timestamp
+            self._file.write(record)
+            self._offset += len(record)
+            self.count += 1
+            self.bytes += len(payload)
+
+    def flush(self):
+        """Write buffered messages to disk; the index follows the capture."""
+        with self._lock:
+            self._file.flush()
+            self._index_file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CaptureReader:
+    """Reads the records of a capture file, using its time index to seek."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        try:
+            _check_magic(self._file, self.path)
+        except CaptureFormatError:
+            self._file.close()
+            raise
+        self._index_times: List[float] = []
+        self._index_offsets: List[int] = []
+        self._load_index()
+
+    def _load_index(self):
+        index_path = get_index_path(self.path)
+        if not index_path.exists():
+            return
+        size = self.path.stat().st_size
+        data = index_path.read_bytes()
+        for timestamp, offset in _INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % _INDEX_ENTRY.size]):
+            # Entries past the end of the capture belong to a torn tail
+            if offset >= size or (self._index_times and timestamp < self._index_times[-1]):
+                break
+            self._index_times.append(timestamp)
+            self._index_offsets.append(offset)
+
+    def _offset_for(self, timestamp: Optional[float]) -> int:
+        """Offset of a record at or before the first one received at timestamp."""
+        if timestamp is None or not self._index_times:
+            return len(CAPTURE_MAGIC)
+        position = bisect.bisect_right(self._index_times, timestamp) - 1
+        return self._index_offsets[position] if position >= 0 else len(CAPTURE_MAGIC)
+
+    def first_timestamp(self) -> Optional[float]:
+        """Receive time of the first record, or None for an empty capture."""
+        for record in self.records():
+            return record.timestamp
+        return None
+
+    def records(self, start: Optional[float] = None, end: Optional[float] = None,
+                topic_filter: Optional[str] = None) -> Iterator[CaptureRecord]:
+        """Records in capture order.
+
+        Args:
+            start: Skip records received before this Unix time
+            end: Stop at the first record received after this Unix time
+            topic_filter: Only records on topics matching this MQTT filter
+        """
+        for _, _, body in _scan(self._file, self._offset_for(start)):
+            record = _decode(body)
+            if start is not None and record.timestamp < start:
+                continue
+            if end is not None and record.timestamp > end:
+                return
+            if topic_filter is None or topic_matches(topic_filter, record.topic):
+                yield record
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def replay(records, publish: Callable[[str, bytes, int], object], speed: float = 1.0,
+           stop_event: Optional[threading.Event] = None) -> int:
+    """Publish records again, keeping their recorded spacing.
+
+    Args:
+        records: CaptureRecord iterable in capture order
+        publish: Callable(topic, payload, qos)
+        speed: Replay rate relative to the recording (2.0 is twice as fast);
+            0 publishes as fast as possible
+        stop_event: Optional event that stops the replay when set
+
+    Returns:
+        int: Number of records published
+    """
+    published = 0
+    first = None
+    started = time.monotonic()
+    for record in records:
+        if stop_event and stop_event.is_set():
+            break
+        if speed > 0:
+            if first is None:
+                first = record.timestamp
+            delay = started + (record.timestamp - first) / speed - time.monotonic()
+            if delay > 0:
+                if stop_event:
+                    if stop_event.wait(delay):
+                        break
+                else:
+                    time.sleep(delay)
+        publish(record.topic, record.payload, record.qos)
+        published += 1
+    return published
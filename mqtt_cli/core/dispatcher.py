@@ -0,0 +1,302 @@
+"""
+Topic-trie message dispatch for MQTT CLI.
+
+One connection often has several parts of the CLI interested in the same
+messages: a monitor on node/+/params/remote, an OTA run waiting on one
+node's otaurl, an agent stream for another client. MessageDispatcher keeps
+all their handlers in a TopicTrie keyed by topic filter, so an incoming
+message finds every matching handler in O(topic depth) rather than by
+testing each filter, and handlers whose filter is covered by an existing
+broker subscription (node/abc/otaurl under node/+/otaurl) need no
+subscription of their own.
+
+Each handler filter is served by exactly one broker subscription, its
+owner. The SDK calls the callback of every broker subscription matching a
+message, so each callback only dispatches to the filters it owns; a
+message is therefore delivered once per handler even when broker
+subscriptions overlap.
+"""
+import logging
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[object, object, object], None]
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Whether a topic matches an MQTT filter with + and # wildcards."""
+    if topic.startswith('$') and topic_filter[:1] in ('+', '#'):
+        # Wildcards at the first level never match $-topics (MQTT 4.7.2)
+        return False
+    filter_levels = topic_filter.split('/')
+    levels = topic.split('/')
+    for index, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if index >= len(levels) or (level != '+' and level != levels[index]):
+            return False
+    return len(filter_levels) == len(levels)
+
+
+def filter_covers(wide: str, narrow: str) -> bool:
+    """Whether every topic matching `narrow` also matches `wide`."""
+    if narrow.startswith('$') and wide[:1] in ('+', '#'):
+        return False
+    wide_levels = wide.split('/')
+    narrow_levels = narrow.split('/')
+    for index, level in enumerate(wide_levels):
+        if level == '#':
+            return True
+        if index >= len(narrow_levels):
+            return False
+        other = narrow_levels[index]
+        if other == '#' or (level != '+' and (other == '+' or level != other)):
+            return False
+    return len(wide_levels) == len(narrow_levels)
+
+
+def validate_filter(topic_filter: str):
+    """Raise ValueError for filters the broker would reject."""
+    if not topic_filter:
+        raise ValueError("Topic filter must not be empty")
+    levels = topic_filter.split('/')
+    for index, level in enumerate(levels):
+        if level == '#' and index != len(levels) - 1:
+            raise ValueError(f"'#' must be the last level in '{topic_filter}'")
+        if level not in ('+', '#') and ('+' in level or '#' in level):
+            raise ValueError(f"Wildcards must occupy a whole level in '{topic_filter}'")
+
+
+class _TrieNode:
+    __slots__ = ('children', 'value')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.value = None
+
+
+class TopicTrie:
+    """Map from MQTT topic filters to values, searchable by topic.
+
+    match(topic) walks one level per topic level and follows at most the
+    literal, '+' and '#' branches at each, so the cost depends on the
+    topic depth and the wildcards in use, not on the number of filters.
+    """
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, topic_filter: str) -> bool:
+        return self.get(topic_filter) is not None
+
+    def _find(self, topic_filter: str) -> Optional[_TrieNode]:
+        node = self._root
+        for level in topic_filter.split('/'):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node
+
+    def get(self, topic_filter: str, default=None):
+        node = self._find(topic_filter)
+        return default if node is None or node.value is None else node.value
+
+    def set(self, topic_filter: str, value):
+        """Store a value (not None) for a filter, replacing any previous one."""
+        node = self._root
+        for level in topic_filter.split('/'):
+            node = node.children.setdefault(level, _TrieNode())
+        if node.value is None:
+            self._size += 1
+        node.value = value
+
+    def remove(self, topic_filter: str):
+        """Remove a filter and prune empty branches; returns its value or None."""
+        path = [self._root]
+        for level in topic_filter.split('/'):
+            node = path[-1].children.get(level)
+            if node is None:
+                return None
+            path.append(node)
+        value, path[-1].value = path[-1].value, None
+        if value is None:
+            return None
+        self._size -= 1
+        levels = topic_filter.split('/')
+        for index in range(len(levels), 0, -1):
+            node = path[index]
+            if node.value is not None or node.children:
+                break
+            del path[index - 1].children[levels[index - 1]]
+        return value
+
+    def match(self, topic: str) -> List:
+        """Values of every filter matching the topic."""
+        levels = topic.split('/')
+        found = []
+        nodes = [self._root]
+        for depth, level in enumerate(levels):
+            next_nodes = []
+            wildcards = not (depth == 0 and level.startswith('$'))
+            for node in nodes:
+                children = node.children
+                if wildcards:
+                    # '#' also matches the parent level: sport/# matches sport
+                    multi = children.get('#')
+                    if multi is not None and multi.value is not None:
+                        found.append(multi.value)
+                    single = children.get('+')
+                    if single is not None:
+                        next_nodes.append(single)
+                child = children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+            nodes = next_nodes
+            if not nodes:
+                return found
+        for node in nodes:
+            if node.value is not None:
+                found.append(node.value)
+            multi = node.children.get('#')
+            if multi is not None and multi.value is not None:
+                found.append(multi.value)
+        return found
+
+    def items(self) -> Iterator:
+        """(filter, value) pairs in no particular order."""
+        stack = [((), self._root)]
+        while stack:
+            levels, node = stack.pop()
+            if node.value is not None:
+                yield '/'.join(levels), node.value
+            for level, child in node.children.items():
+                stack.append((levels + (level,), child))
+
+
+class _Route:
+    __slots__ = ('topic_filter', 'owner', 'handlers')
+
+    def __init__(self, topic_filter: str, owner: str):
+        self.topic_filter = topic_filter
+        self.owner = owner
+        self.handlers: List[Handler] = []
+
+
+class MessageDispatcher:
+    """Handlers by topic filter and the broker subscriptions serving them.
+
+    The dispatcher does no I/O: add() and remove() return the broker
+    filter the caller has to subscribe or unsubscribe, if any, and
+    callback_for() gives the SDK callback for a broker subscription.
+    """
+
+    def __init__(self):
+        self._routes = TopicTrie()
+        # Broker filter -> QoS for subscriptions made through the dispatcher
+        self._subscriptions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _owner_for(self, topic_filter: str) -> Optional[str]:
+        if topic_filter in self._subscriptions:
+            return topic_filter
+        for broker_filter in self._subscriptions:
+            if filter_covers(broker_filter, topic_filter):
+                return broker_filter
+        return None
+
+    def add(self, topic_filter: str, handler: Handler, qos: int = 1, replace: bool = False,
+            own: bool = False) -> Optional[str]:
+        """Register a handler for a filter.
+
+        Args:
+            topic_filter: MQTT topic filter, wildcards allowed
+            handler: Called as handler(client, userdata, message)
+            qos: QoS for a new broker subscription
+            replace: Drop the filter's other handlers first
+            own: Serve the filter from a broker subscription of its own even
+                if an existing one covers it
+
+        Returns:
+            The filter to subscribe at the broker, or None if an existing
+            broker subscription already delivers the filter's messages
+
+        Raises:
+            ValueError: If the filter is not a valid MQTT topic filter
+        """
+        validate_filter(topic_filter)
+        with self._lock:
+            route = self._routes.get(topic_filter)
+            owner = topic_filter if own else self._owner_for(topic_filter)
+            if route is None:
+                route = _Route(topic_filter, owner or topic_filter)
+                self._routes.set(topic_filter, route)
+            elif owner is not None and own:
+                route.owner = owner
+            if replace:
+                route.handlers = [handler]
+            elif handler not in route.handlers:
+                route.handlers = route.handlers + [handler]
+            if owner is not None and not own:
+                return None
+            self._subscriptions[route.owner] = qos
+            return route.owner
+
+    def remove(self, topic_filter: str, handler: Optional[Handler] = None) -> Optional[str]:
+        """Unregister one handler, or all handlers of a filter.
+
+        Returns:
+            The broker filter to unsubscribe, or None if it still serves
+            other handlers (or there was nothing to remove)
+        """
+        with self._lock:
+            route = self._routes.get(topic_filter)
+            if route is None:
+                return None
+            if handler is not None:
+                route.handlers = [h for h in route.handlers if h is not handler]
+                if route.handlers:
+                    return None
+            self._routes.remove(topic_filter)
+            owner = route.owner
+            if any(other.owner == owner for _, other in self._routes.items()):
+                return None
+            self._subscriptions.pop(owner, None)
+            return owner
+
+    def subscriptions(self) -> Dict[str, int]:
+        """Broker filters and their QoS, e.g. to restore after a reconnect."""
+        with self._lock:
+            return dict(self._subscriptions)
+
+    def handlers(self, topic: str) -> List[Handler]:
+        """Every handler whose filter matches a topic."""
+        with self._lock:
+            routes = self._routes.match(topic)
+        return [handler for route in routes for handler in route.handlers]
+
+    def dispatch(self, broker_filter: str, client, userdata, message) -> int:
+        """Call the handlers served by one broker subscription; returns how many ran."""
+        with self._lock:
+            routes = [route for route in self._routes.match(message.topic) if route.owner == broker_filter]
+        called = 0
+        for route in routes:
+            for handler in route.handlers:
+                called += 1
+                try:
+                    handler(client, userdata, message)
+                except Exception as e:
+                    logger.debug(f"Handler for {route.topic_filter} failed on {message.topic}: {str(e)}")
+        return called
+
+    def callback_for(self, broker_filter: str) -> Handler:
+        """SDK message callback for a broker subscription."""
+        def callback(client, userdata, message):
+            self.dispatch(broker_filter, client, userdata, message)
+        return callback
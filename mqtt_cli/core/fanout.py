@@ -0,0 +1,305 @@
+"""
+Concurrent multi-node operations for MQTT CLI.
+
+Connecting a node is dominated by blocking TLS and MQTT handshakes, so
+fan-out across many nodes runs on a bounded thread pool. Workers only
+resolve certificates and connect; all configuration and connection-state
+writes happen on the calling thread once the workers are done.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from ..mqtt_operations import MQTTOperations
+from .agent import AgentMQTTClient
+from .mqtt_client import find_node_cert_paths, get_agent, get_cert_index
+from .spool import get_node_spool
+
+DEFAULT_CONNECT_CONCURRENCY = 32
+
+# Error of nodes skipped because run_on_nodes was stopped
+CANCELLED = 'cancelled'
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectResult:
+    """Outcome of connecting a single node."""
+    def __init__(self, node_id: str, client=None, cert_path: Optional[str] = None,
+                 key_path: Optional[str] = None, stored: bool = False,
+                 elapsed: float = 0.0, error: Optional[str] = None, reused: bool = False):
+        self.node_id = node_id
+        self.client = client
+        self.cert_path = cert_path
+        self.key_path = key_path
+        self.stored = stored
+        self.elapsed = elapsed
+        self.error = error
+        # True if an existing connection was used and nothing needs registering
+        self.reused = reused
+
+    @property
+    def ok(self) -> bool:
+        return self.client is not None
+
+    @property
+    def elapsed_ms(self) -> float:
+        return self.elapsed * 1000
+
+
+def _connect_node(ctx, node_id: str, agent) -> ConnectResult:
+    """Connect one node; runs on a worker thread."""
+    start = time.perf_counter()
+    broker = ctx.obj.get('BROKER')
+    try:
+        # Reuse a live connection from this process or the agent
+        connection_manager = ctx.obj.get('CONNECTION_MANAGER')
+        existing = connection_manager.connections.get(node_id) if connection_manager else None
+        if existing is not None and existing.connected and existing.broker == broker:
+            return ConnectResult(node_id, existing, elapsed=time.perf_counter() - start, reused=True)
+        if agent:
+            status = agent.status(node_id).get(node_id)
+            if status and status['connected'] and status['broker'] == broker:
+                return ConnectResult(node_id, AgentMQTTClient(agent, node_id, broker),
+                                     elapsed=time.perf_counter() - start, reused=True)
+
+        cert_path, key_path, stored = find_node_cert_paths(ctx, node_id)
+        if agent:
+            connected = agent.connect(node_id, broker, cert_path, key_path)
+            client = AgentMQTTClient(agent, node_id, broker) if connected else None
+        else:
+            client = MQTTOperations(broker=broker, node_id=node_id, cert_path=cert_path, key_path=key_path,
+                                    spool=get_node_spool(ctx.obj.get('CONFIG_MANAGER'), node_id))
+            connected = client.connect()
+        elapsed = time.perf_counter() - start
+        if not connected:
+            return ConnectResult(node_id, elapsed=elapsed, error="connect failed")
+        return ConnectResult(node_id, client, cert_path, key_path, stored, elapsed)
+    except Exception as e:
+        logger.debug(f"Connection error for node {node_id}: {str(e)}")
+        return ConnectResult(node_id, elapsed=time.perf_counter() - start, error=str(e))
+
+
+class NodeResult:
+    """Outcome of connecting a node and running an operation on it."""
+    def __init__(self, node_id: str, connect: ConnectResult):
+        self.node_id = node_id
+        self.connect = connect
+        self.value = None
+        self.elapsed = 0.0
+        self.error = None if connect.ok else f"connect failed: {connect.error}"
+
+    @property
+    def ok(self) -> bool:
+        return self.connect.ok and self.error is None
+
+    @property
+    def elapsed_ms(self) -> float:
+        return self.elapsed * 1000
+
+
+def _run_on_node(ctx, node_id: str, agent, operation, keep_connection: bool = True) -> NodeResult:
+    """Connect one node and run operation(client, node_id); runs on a worker thread."""
+    result = NodeResult(node_id, _connect_node(ctx, node_id, agent))
+    if not result.connect.ok:
+        return result
+    start = time.perf_counter()
+    try:
+        result.value = operation(result.connect.client, node_id)
+        if result.value is False:
+            result.error = "operation failed"
+    except Exception as e:
+        logger.debug(f"Operation error for node {node_id}: {str(e)}")
+        result.error = str(e)
+    result.elapsed = time.perf_counter() - start
+    client = result.connect.client
+    if not keep_connection and not result.connect.reused and isinstance(client, MQTTOperations):
+        # Connections opened only for this operation; agent connections stay with the agent
+        try:
+            client.close()
+        except Exception as e:
+            logger.debug(f"Disconnect failed for node {node_id}: {str(e)}")
+    return result
+
+
+def _fan_out(ctx, node_ids: List[str], work, concurrency: int, on_result) -> dict:
+    """Run work(ctx, node_id, agent) for each node on a bounded thread pool."""
+    # Probe the agent and open the certificate index once on this thread;
+    # workers share the cached objects
+    agent = get_agent(ctx)
+    get_cert_index(ctx)
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(node_ids)))) as executor:
+        futures = [executor.submit(work, ctx, node_id, agent) for node_id in node_ids]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.node_id] = result
+            if on_result:
+                on_result(result)
+    return {node_id: results[node_id] for node_id in node_ids if node_id in results}
+
+
+def connect_nodes(ctx, node_ids: List[str], concurrency: int = DEFAULT_CONNECT_CONCURRENCY,
+                  on_result: Optional[Callable[[ConnectResult], None]] = None) -> Dict[str, ConnectResult]:
+    """Connect many nodes with at most `concurrency` handshakes in flight.
+
+    Args:
+        ctx: Click context carrying broker, certificate and manager objects
+        node_ids: Node IDs to connect
+        concurrency: Maximum number of simultaneous connection attempts
+        on_result: Optional callback invoked on the calling thread as each node finishes
+
+    Returns:
+        dict: node_id -> ConnectResult, in the order of node_ids
+    """
+    results = _fan_out(ctx, node_ids, _connect_node, concurrency, on_result)
+    register_connections(ctx, results.values())
+    return results
+
+
+def run_on_nodes(ctx, node_ids: List[str], operation: Callable[[object, str], object],
+                 concurrency: int = DEFAULT_CONNECT_CONCURRENCY,
+                 on_result: Optional[Callable[[NodeResult], None]] = None,
+                 keep_connections: bool = True,
+                 stop_event: Optional[threading.Event] = None) -> Dict[str, NodeResult]:
+    """Connect many nodes and run an operation on each as soon as it is connected.
+
+    Live connections from this process or the agent are reused. The operation is called
+    on a worker thread as operation(client, node_id); returning False or
+    raising marks the node as failed.
+
+    Args:
+        ctx: Click context carrying broker, certificate and manager objects
+        node_ids: Node IDs to run the operation on
+        operation: Callable run with each connected client
+        concurrency: Maximum number of nodes processed at once
+        on_result: Optional callback invoked on the calling thread as each node finishes
+        keep_connections: If False, connections opened here are closed as soon as
+            the node's operation is done and are not registered, so only
+            `concurrency` connections are ever open at once
+        stop_event: Optional event; once set, nodes not yet started are
+            skipped with the error "cancelled" instead of being connected
+
+    Returns:
+        dict: node_id -> NodeResult, in the order of node_ids
+    """
+    def work(ctx, node_id, agent):
+        if stop_event is not None and stop_event.is_set():
+            return NodeResult(node_id, ConnectResult(node_id, error=CANCELLED))
+        return _run_on_node(ctx, node_id, agent, operation, keep_connections)
+
+    results = _fan_out(ctx, node_ids, work, concurrency, on_result)
+    if keep_connections:
+        register_connections(ctx, [result.connect for result in results.values()])
+    return results
+
+
+class NodeConnector:
+    """Connects nodes in the background as they are first needed.
+
+    For commands that only learn their nodes while reading input:
+    connect() starts a node's connection on a bounded thread pool and
+    returns at once, so handshakes overlap with reading. Nothing is
+    registered until close().
+    """
+
+    def __init__(self, ctx, concurrency: int = DEFAULT_CONNECT_CONCURRENCY):
+        self.ctx = ctx
+        # Probe the agent and open the certificate index once on this thread
+        self._agent = get_agent(ctx)
+        get_cert_index(ctx)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='node-connect')
+        self._futures: Dict[str, Future] = {}
+
+    def connect(self, node_id: str) -> Future:
+        """Start connecting a node, once; the future resolves to its ConnectResult."""
+        future = self._futures.get(node_id)
+        if future is None:
+            future = self._executor.submit(_connect_node, self.ctx, node_id, self._agent)
+            self._futures[node_id] = future
+        return future
+
+    def close(self, keep_connections: bool = False) -> Dict[str, ConnectResult]:
+        """Wait for pending connects and register the results in one pass.
+
+        Args:
+            keep_connections: If False, connections opened here are closed
+                and only newly found certificates are registered
+
+        Returns:
+            dict: node_id -> ConnectResult for every node connect() was called for
+        """
+        self._executor.shutdown(wait=True)
+        results = {node_id: future.result() for node_id, future in self._futures.items()}
+        if not keep_connections:
+            for result in results.values():
+                if result.ok and not result.reused and isinstance(result.client, MQTTOperations):
+                    try:
+                        result.client.close()
+                    except Exception as e:
+                        logger.debug(f"Disconnect failed for node {result.node_id}: {str(e)}")
+        register_connections(self.ctx, results.values(), connections=keep_connections)
+        return results
+
+
+def register_connections(ctx, results, connections: bool = True):
+    """Persist newly discovered certificates and, optionally, direct connections in one pass."""
+    config_manager = ctx.obj.get('CONFIG_MANAGER')
+    connection_manager = ctx.obj.get('CONNECTION_MANAGER')
+    broker = ctx.obj.get('BROKER')
+    registered = False
+    results = [r for r in results if r.ok and not r.reused]
+    new_nodes = [r for r in results if not r.stored]
+    if config_manager and new_nodes:
+        with config_manager.batch():
+            for result in new_nodes:
+                config_manager.add_node(result.node_id, result.cert_path, result.key_path)
+    for result in results:
+        if connections and connection_manager and not isinstance(result.client, AgentMQTTClient):
+            connection_manager.add_connection(result.node_id, broker, result.cert_path,
+                                              result.key_path, result.client, save=False)
+            registered = True
+    if registered:
+        connection_manager.save()
+
+
+def load_node_ids(node_ids: Optional[str] = None, node_file=None) -> List[str]:
+    """Collect node IDs from a comma-separated string and/or an open file.
+
+    The file holds node IDs separated by newlines, commas or whitespace;
+    lines starting with '#' are ignored. Duplicates are dropped, keeping the
+    first occurrence.
+    """
+    collected = []
+    if node_ids:
+        collected.extend(node_ids.split(','))
+    if node_file is not None:
+        for line in node_file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                collected.extend(line.replace(',', ' ').split())
+    return list(dict.fromkeys(n.strip() for n in collected if n.strip()))
+
+
+def summarize_latencies(results, key: str = 'elapsed_ms') -> dict:
+    """Summarize latency (ms) over successful results.
+
+    Args:
+        results: ConnectResult or NodeResult objects
+        key: Attribute holding the latency, e.g. 'elapsed_ms'
+    """
+    latencies = sorted(getattr(r, key) for r in results if r.ok)
+    if not latencies:
+        return {}
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {
+        'min': latencies[0],
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'max': latencies[-1]
+    }
@@ -0,0 +1,163 @@
+"""
+Bounded history of received MQTT messages.
+
+MessageHistory keeps the most recent messages per topic in ring buffers
+under a memory cap shared by all topics. When the cap is exceeded, the
+topics that have gone longest without a message are dropped first, so a
+long-lived client or the connection agent holds the recent traffic of
+its busy topics in fixed memory however long it runs.
+
+Payloads are stored as received (bytes) by default, which costs no
+parsing on the network thread; with raw=False they are decoded on
+arrival to JSON values, or text for non-JSON payloads.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, NamedTuple, Optional
+
+from .dispatcher import topic_matches
+
+DEFAULT_MAX_PER_TOPIC = 100
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+# Approximate bookkeeping cost of one entry on top of its payload
+ENTRY_OVERHEAD = 120
+
+
+class HistoryEntry(NamedTuple):
+    """One received message."""
+    topic: str
+    timestamp: float
+    payload: object
+
+    def text(self) -> str:
+        if isinstance(self.payload, (bytes, bytearray)):
+            return self.payload.decode('utf-8', errors='replace')
+        if isinstance(self.payload, str):
+            return self.payload
+        return json.dumps(self.payload)
+
+
+def decode_payload(payload: bytes):
+    """A JSON payload as its value, anything else as text."""
+    text = payload.decode('utf-8', errors='replace')
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+class MessageHistory:
+    """Recent messages per topic with a per-topic length and a global memory cap."""
+
+    def __init__(self, max_per_topic: int = DEFAULT_MAX_PER_TOPIC, max_bytes: int = DEFAULT_MAX_BYTES,
+                 raw: bool = True):
+        if max_per_topic < 1 or max_bytes < 1:
+            raise ValueError("History limits must be positive")
+        self.max_per_topic = max_per_topic
+        self.max_bytes = max_bytes
+        self.raw = raw
+        # Topic -> deque of (entry, size); least recently written topic first
+        self._topics: 'OrderedDict[str, deque]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.recorded = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._topics.values())
+
+    def record(self, topic: str, payload: bytes, timestamp: Optional[float] = None):
+        """Add a received message; safe to call from the MQTT network thread."""
+        size = len(payload) + ENTRY_OVERHEAD
+        entry = HistoryEntry(topic, time.time() if timestamp is None else timestamp,
+                             bytes(payload) if self.raw else decode_payload(payload))
+        with self._lock:
+            entries = self._topics.get(topic)
+            if entries is None:
+                entries = self._topics[topic] = deque()
+            else:
+                self._topics.move_to_end(topic)
+            if len(entries) >= self.max_per_topic:
+                self.bytes -= entries.popleft()[1]
+            entries.append((entry, size))
+            self.bytes += size
+            self.recorded += 1
+            if self.bytes > self.max_bytes:
+                self._evict(topic)
+
+    def _evict(self, keep: str):
+        """Drop cold topics until under the cap; trim `keep` only if it is the last topic."""
+        while self.bytes > self.max_bytes and len(self._topics) > 1:
+            topic, entries = next(iter(self._topics.items()))
+            if topic == keep:
+                self._topics.move_to_end(topic)
+                continue
+            del self._topics[topic]
+            self.bytes -= sum(size for _, size in entries)
+            self.evicted += len(entries)
+        entries = self._topics.get(keep)
+        while self.bytes > self.max_bytes and entries and len(entries) > 1:
+            self.bytes -= entries.popleft()[1]
+            self.evicted += 1
+
+    def query(self, topic_filter: str = '#', last: Optional[int] = None,
+              since: Optional[float] = None) -> List[HistoryEntry]:
+        """Messages on topics matching a filter, oldest first.
+
+        Args:
+            topic_filter: MQTT topic filter, + and # allowed
+            last: Only the most recent `last` matching messages
+            since: Only messages received at or after this Unix time
+        """
+        with self._lock:
+            found = [entry for topic, entries in self._topics.items() if topic_matches(topic_filter, topic)
+                     for entry, _ in entries if since is None or entry.timestamp >= since]
+        found.sort(key=lambda entry: entry.timestamp)
+        if last is not None:
+            found = found[-last:] if last > 0 else []
+        return found
+
+    def last(self, topic: str, n: Optional[int] = None) -> List[HistoryEntry]:
+        """The last n messages on one topic (all kept ones if n is None), oldest first."""
+        with self._lock:
+            entries = [entry for entry, _ in self._topics.get(topic, ())]
+        return entries[-n:] if n is not None else entries
+
+    def latest(self, topic: str) -> Optional[HistoryEntry]:
+        """The most recent message on one topic."""
+        with self._lock:
+            entries = self._topics.get(topic)
+            return entries[-1][0] if entries else None
+
+    def since(self, timestamp: float, topic_filter: str = '#') -> List[HistoryEntry]:
+        """Messages received at or after a Unix time, oldest first."""
+        return self.query(topic_filter, since=timestamp)
+
+    def topics(self) -> List[str]:
+        """Topics with kept messages, most recently written last."""
+        with self._lock:
+            return list(self._topics)
+
+    def clear(self, topic_filter: str = '#') -> int:
+        """Forget the messages of matching topics; returns how many were removed."""
+        removed = 0
+        with self._lock:
+            for topic in [topic for topic in self._topics if topic_matches(topic_filter, topic)]:
+                entries = self._topics.pop(topic)
+                self.bytes -= sum(size for _, size in entries)
+                removed += len(entries)
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'topics': len(self._topics),
+                'messages': sum(len(entries) for entries in self._topics.values()),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'recorded': self.recorded,
+                'evicted': self.evicted,
+            }
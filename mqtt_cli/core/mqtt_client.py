@@ -4,10 +4,17 @@ MQTT client operations for MQTT CLI.
 import logging
 import click
 import sys
+import threading
 from pathlib import Path
 
 from ..mqtt_operations import MQTTOperations
 from ..utils.cert_finder import get_cert_and_key_paths, get_cert_paths_from_direct_path
+from ..utils.cert_index import CertIndex
+from .agent import AgentMQTTClient, get_agent_client
+from .spool import get_node_spool
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
 
 def connect_single_node(broker: str, node_id: str, base_path: str, direct_cert_path: str = None, mac_address: str = None) -> tuple:
     """Helper function to connect a single node"""
@@ -35,51 +42,116 @@ def connect_single_node(broker: str, node_id: str, base_path: str, direct_cert_p
     except Exception as e:
         return None, None, None
 
+def get_agent(ctx):
+    """Get a client for the running connection agent, if any.
+
+    The lookup result is cached in the context so a command probes the
+    agent socket at most once.
+    """
+    if 'AGENT' not in ctx.obj:
+        agent = None
+        if ctx.obj.get('USE_AGENT', True) and ctx.obj.get('CONFIG_DIR'):
+            agent = get_agent_client(ctx.obj['CONFIG_DIR'])
+        ctx.obj['AGENT'] = agent
+    return ctx.obj['AGENT']
+
+def get_cert_index(ctx):
+    """Get the certificate index for the current config directory.
+
+    The index is cached in the context and shared by all threads.
+    """
+    if 'CERT_INDEX' not in ctx.obj:
+        config_dir = ctx.obj.get('CONFIG_DIR')
+        ctx.obj['CERT_INDEX'] = CertIndex(config_dir) if config_dir else None
+    return ctx.obj['CERT_INDEX']
+
+def find_node_cert_paths(ctx, node_id: str) -> tuple:
+    """Find certificate and key paths for a node without storing them.
+
+    Resolution order: MAC-address path, direct --cert-path, stored
+    configuration, then the node_details structure under the certs folder.
+
+    Returns:
+        tuple: (cert_path, key_path, stored) where stored is True if the
+        paths came from the existing configuration
+
+    Raises:
+        FileNotFoundError: If certificates are not found
+    """
+    config_manager = ctx.obj.get('CONFIG_MANAGER')
+    cert_path = ctx.obj.get('CERT_PATH')
+    mac_address = ctx.obj.get('MAC_ADDRESS')  # Get MAC address from context
+    index = get_cert_index(ctx)
+
+    # Check if we have a MAC address path (for MAC-based discovery)
+    if mac_address and '/' in mac_address:
+        # MAC address contains a path, use it for MAC-based certificate search
+        cert_path, key_path = get_cert_paths_from_direct_path(mac_address, node_id, None, index=index)
+    # Try direct certificate path if provided
+    elif cert_path:
+        cert_path, key_path = get_cert_paths_from_direct_path(cert_path, node_id, mac_address, index=index)
+    else:
+        # Try to get from existing configuration
+        cert_paths = config_manager.get_node_paths(node_id) if config_manager else None
+        if cert_paths:
+            return cert_paths[0], cert_paths[1], True
+        # If not in config, try default location using node_details structure
+        base_path = ctx.obj['CERT_FOLDER']
+        cert_path, key_path = get_cert_and_key_paths(base_path, node_id, index=index)
+    return cert_path, key_path, False
+
+def resolve_node_cert_paths(ctx, node_id: str) -> tuple:
+    """Find certificate and key paths for a node.
+
+    Newly discovered paths are stored in the configuration for future use.
+
+    Returns:
+        tuple: (cert_path, key_path)
+
+    Raises:
+        FileNotFoundError: If certificates are not found
+    """
+    cert_path, key_path, stored = find_node_cert_paths(ctx, node_id)
+    config_manager = ctx.obj.get('CONFIG_MANAGER')
+    if config_manager and not stored:
+        config_manager.add_node(node_id, cert_path, key_path)
+    return cert_path, key_path
+
 def get_active_mqtt_client(ctx, auto_connect=False, node_id=None):
     """Get or create MQTT client for the specified node"""
-    from ..utils.config_manager import ConfigManager
-    
-    config_manager = ctx.obj.get('CONFIG_MANAGER')
-    
+    agent = get_agent(ctx) if node_id else None
+    if agent:
+        broker = ctx.obj.get('BROKER')
+        try:
+            status = agent.status(node_id).get(node_id)
+            if status and status['connected'] and status['broker'] == broker:
+                return AgentMQTTClient(agent, node_id, broker)
+            if auto_connect:
+                click.echo(click.style(f"Connecting node {node_id} through agent...", fg='yellow'))
+                cert_path, key_path = resolve_node_cert_paths(ctx, node_id)
+                if agent.connect(node_id, broker, cert_path, key_path):
+                    click.echo(click.style(f"✓ Connected to node {node_id}", fg='green'))
+                    return AgentMQTTClient(agent, node_id, broker)
+                click.echo(click.style(f"✗ Failed to connect to node {node_id}", fg='red'))
+                return None
+        except Exception as e:
+            click.echo(click.style(f"✗ Connection error for node {node_id}: {str(e)}", fg='red'))
+            return None
+
     if auto_connect and node_id:
         click.echo(click.style(f"Auto-connecting to node {node_id}...", fg='yellow'))
         broker = ctx.obj.get('BROKER')
-        cert_path = ctx.obj.get('CERT_PATH')
-        mac_address = ctx.obj.get('MAC_ADDRESS')  # Get MAC address from context
         
         try:
-            # Check if we have a MAC address path (for MAC-based discovery)
-            if mac_address and '/' in mac_address:
-                # MAC address contains a path, use it for MAC-based certificate search
-                cert_path, key_path = get_cert_paths_from_direct_path(mac_address, node_id, None)
-                # Store certificate paths in config for future use
-                if config_manager:
-                    config_manager.add_node(node_id, cert_path, key_path)
-            # Try direct certificate path if provided
-            elif cert_path:
-                cert_path, key_path = get_cert_paths_from_direct_path(cert_path, node_id, mac_address)
-                # Store certificate paths in config for future use
-                if config_manager:
-                    config_manager.add_node(node_id, cert_path, key_path)
-            else:
-                # Try to get from existing configuration
-                cert_paths = config_manager.get_node_paths(node_id) if config_manager else None
-                if cert_paths:
-                    cert_path, key_path = cert_paths
-                else:
-                    # If not in config, try default location using node_details structure
-                    base_path = ctx.obj['CERT_FOLDER']
-                    cert_path, key_path = get_cert_and_key_paths(base_path, node_id)
-                    # Store certificate paths in config for future use
-                    if config_manager:
-                        config_manager.add_node(node_id, cert_path, key_path)
+            cert_path, key_path = resolve_node_cert_paths(ctx, node_id)
             
             # Create and connect MQTT client
             mqtt_client = MQTTOperations(
                 broker=broker,
                 node_id=node_id,
                 cert_path=cert_path,
-                key_path=key_path
+                key_path=key_path,
+                spool=get_node_spool(ctx.obj.get('CONFIG_MANAGER'), node_id)
             )
             
             if mqtt_client.connect():
@@ -104,4 +176,46 @@ def get_active_mqtt_client(ctx, auto_connect=False, node_id=None):
     if connection_manager and node_id:
         return connection_manager.get_connection(node_id)
     
-    return None 
\ No newline at end of file
+    return None 
+
+
+class PublishTally:
+    """Counts the outcomes of publish_async calls for bulk publishing commands.
+
+    publish() hands a message to a client without waiting; the PUBACK (or
+    failure) is counted from the client's callback thread, so read the
+    counts after flushing the clients.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.records = 0
+        self.bytes = 0
+        self.acked = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def publish(self, mqtt_client, topic: str, payload, qos: int = 1, records: int = 0):
+        """Publish without waiting and count the message."""
+        with self._lock:
+            self.messages += 1
+            self.records += records
+            self.bytes += len(payload)
+        future = mqtt_client.publish_async(topic, payload, qos=qos)
+        future.add_done_callback(self._on_published)
+        return future
+
+    def fail(self, count: int = 1):
+        """Count messages that could not be handed to a client."""
+        with self._lock:
+            self.errors += count
+
+    def _on_published(self, future):
+        error = future.exception()
+        with self._lock:
+            if error or not future.result():
+                self.errors += 1
+            else:
+                self.acked += 1
+        if error:
+            logger.debug(f"Publish failed: {str(error)}")
@@ -0,0 +1,408 @@
+"""
+Staged OTA campaigns for MQTT CLI.
+
+A campaign runs the full OTA cycle (otafetch, wait for otaurl, report the
+policy's status sequence) for a large node list in waves. Waves are given
+as cumulative sizes, e.g. ``5%,25%,100%``: the first 5% of nodes, then up
+to 25%, then the rest. A wave only starts once the previous one reached
+the minimum success rate.
+
+Every node moves through a small state machine:
+
+    pending -> fetching -> updating -> succeeded | failed
+                        -> timed-out | skipped | failed
+
+and each transition is appended to a JSON-lines progress file, so an
+interrupted campaign resumes where it stopped. The first line of the file
+describes the campaign; later lines are {"node", "state", "wave", "t", ...}
+records and the last record for a node wins.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from ..utils.exceptions import MQTTOTAError
+from .fanout import CANCELLED, DEFAULT_CONNECT_CONCURRENCY, run_on_nodes
+from .ota_policy import (DEFAULT_STATUS_INFO, STATUS_PUBLISH_ATTEMPTS, STATUS_RETRY_DELAY, OTAPolicy,
+                         publish_ota_status)
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+FETCHING = 'fetching'
+UPDATING = 'updating'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+TIMED_OUT = 'timed-out'
+SKIPPED = 'skipped'
+
+TRANSITIONS = {
+    PENDING: (FETCHING, FAILED),
+    FETCHING: (UPDATING, SKIPPED, TIMED_OUT, FAILED),
+    UPDATING: (SUCCEEDED, FAILED),
+    SUCCEEDED: (),
+    FAILED: (),
+    TIMED_OUT: (),
+    SKIPPED: (),
+}
+# Finished states counted by the success-rate gate
+GATED_STATES = (SUCCEEDED, FAILED, TIMED_OUT)
+# Finished states that are run again with retry_failed
+RETRYABLE_STATES = (FAILED, TIMED_OUT)
+
+DEFAULT_WAVES = '5%,25%,100%'
+DEFAULT_MIN_SUCCESS_RATE = 95.0
+DEFAULT_URL_TIMEOUT = 60
+PROGRESS_FILE_NAME = 'ota_campaign.jsonl'
+
+
+class CampaignInterrupted(Exception):
+    """Raised inside a node worker when the campaign is being stopped."""
+
+
+def parse_waves(spec: str, total: int) -> List[int]:
+    """Turn a cumulative wave spec into wave end offsets into the node list.
+
+    Entries are percentages ("5%") or node counts ("100"). The last wave
+    always extends to the end of the list, and empty waves are dropped.
+
+    Raises:
+        ValueError: On a malformed entry or sizes that shrink
+    """
+    bounds = []
+    for entry in (part.strip() for part in spec.split(',')):
+        if not entry:
+            continue
+        try:
+            if entry.endswith('%'):
+                percent = float(entry[:-1])
+                if not 0 < percent <= 100:
+                    raise ValueError
+                bound = math.ceil(total * percent / 100)
+            else:
+                bound = int(entry)
+                if bound <= 0:
+                    raise ValueError
+        except ValueError:
+            raise ValueError(f"Invalid wave size '{entry}', expected a percentage like 5% or a node count")
+        if bounds and bound < bounds[-1]:
+            raise ValueError(f"Wave sizes are cumulative and must not shrink ('{entry}')")
+        bounds.append(min(bound, total))
+    if not bounds or bounds[-1] < total:
+        bounds.append(total)
+    return [bound for index, bound in enumerate(bounds) if bound > (bounds[index - 1] if index else 0)]
+
+
+def _nodes_digest(node_ids: List[str]) -> str:
+    return hashlib.sha1('\n'.join(node_ids).encode()).hexdigest()
+
+
+class CampaignProgress:
+    """Append-only record of node state transitions, used to resume a campaign."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.header: Optional[dict] = None
+        self.records: Dict[str, dict] = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the header and the last record per node; a torn final line is ignored."""
+        self.header, self.records = None, {}
+        if not self.path.exists():
+            return
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        for number, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                if number == len(lines) - 1:
+                    logger.debug(f"Ignoring incomplete last line of {self.path}")
+                    continue
+                raise ValueError(f"Corrupt progress file {self.path} at line {number + 1}")
+            if number == 0:
+                self.header = entry.get('campaign')
+                if self.header is None:
+                    raise ValueError(f"{self.path} is not an OTA campaign progress file")
+            else:
+                self.records[entry['node']] = entry
+
+    def open(self, header: dict):
+        """Start appending, writing the header if the file is new."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        new = self.header is None
+        self._file = open(self.path, 'w' if new else 'a')
+        if new:
+            self.header = header
+            self._write({'campaign': header})
+
+    def state(self, node_id: str) -> str:
+        record = self.records.get(node_id)
+        return record['state'] if record else PENDING
+
+    def record(self, node_id: str, state: str, wave: int, **fields):
+        """Append a state transition for a node; safe to call from worker threads."""
+        entry = {'node': node_id, 'state': state, 'wave': wave, 't': round(time.time(), 3)}
+        entry.update({key: value for key, value in fields.items() if value is not None})
+        with self._lock:
+            self.records[node_id] = entry
+            self._write(entry)
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def sync(self):
+        """Force written records to disk, e.g. at the end of a wave."""
+        with self._lock:
+            if self._file:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class WaveSummary:
+    """State counts for the nodes of one wave."""
+
+    def __init__(self, index: int, node_ids: List[str], progress: CampaignProgress):
+        self.index = index
+        self.size = len(node_ids)
+        self.counts: Dict[str, int] = {}
+        for node_id in node_ids:
+            state = progress.state(node_id)
+            self.counts[state] = self.counts.get(state, 0) + 1
+
+    @property
+    def finished(self) -> int:
+        return sum(self.counts.get(state, 0) for state in TRANSITIONS if not TRANSITIONS[state])
+
+    @property
+    def success_rate(self) -> float:
+        """Percentage of succeeded nodes among nodes that were updated or failed."""
+        gated = sum(self.counts.get(state, 0) for state in GATED_STATES)
+        return 100.0 * self.counts.get(SUCCEEDED, 0) / gated if gated else 100.0
+
+
+class OTACampaign:
+    """Runs the OTA cycle for many nodes in gated waves.
+
+    Each node's cycle runs on a fan-out worker, so `concurrency` bounds both
+    the open connections and the nodes in the middle of an update.
+    """
+
+    def __init__(self, ctx, node_ids: List[str], fw_version: str, policy: OTAPolicy,
+                 progress: CampaignProgress, waves: str = DEFAULT_WAVES,
+                 concurrency: int = DEFAULT_CONNECT_CONCURRENCY,
+                 min_success_rate: float = DEFAULT_MIN_SUCCESS_RATE,
+                 url_timeout: float = DEFAULT_URL_TIMEOUT, network_id: Optional[str] = None,
+                 retry_failed: bool = False,
+                 on_node: Optional[Callable[[str, dict], None]] = None,
+                 on_wave: Optional[Callable[[WaveSummary, List[str]], None]] = None):
+        self.ctx = ctx
+        self.node_ids = node_ids
+        self.fw_version = fw_version
+        self.policy = policy
+        self.progress = progress
+        self.waves = waves
+        self.concurrency = concurrency
+        self.min_success_rate = min_success_rate
+        self.url_timeout = url_timeout
+        self.network_id = network_id
+        self.retry_failed = retry_failed
+        self.on_node = on_node
+        self.on_wave = on_wave
+        self.stop_event = threading.Event()
+        self.bounds = parse_waves(waves, len(node_ids))
+        self._states: Dict[str, str] = {}
+
+    def header(self) -> dict:
+        return {
+            'fw_version': self.fw_version,
+            'network_id': self.network_id,
+            'waves': self.waves,
+            'nodes': len(self.node_ids),
+            'nodes_sha1': _nodes_digest(self.node_ids),
+            'started': round(time.time(), 3),
+        }
+
+    def check_resume(self):
+        """Make sure an existing progress file belongs to this campaign.
+
+        Raises:
+            ValueError: If it was written for another firmware, node list or wave plan
+        """
+        previous = self.progress.header
+        if previous is None:
+            return
+        current = self.header()
+        for key in ('fw_version', 'nodes_sha1', 'waves'):
+            if previous.get(key) != current[key]:
+                raise ValueError(f"Progress file {self.progress.path} belongs to a different campaign "
+                                 f"({key} differs); use --restart or another --progress-file")
+
+    def wave_nodes(self, index: int) -> List[str]:
+        start = self.bounds[index - 1] if index else 0
+        return self.node_ids[start:self.bounds[index]]
+
+    def needs_run(self, node_id: str) -> bool:
+        state = self.progress.state(node_id)
+        if state in RETRYABLE_STATES:
+            return self.retry_failed
+        # Nodes interrupted mid-cycle start over
+        return state not in (SUCCEEDED, SKIPPED)
+
+    def run(self) -> List[WaveSummary]:
+        """Run the waves in order, stopping at the first wave below the gate.
+
+        Returns:
+            list: WaveSummary of every wave that was run, the last one
+            possibly incomplete (stopped) or below the success-rate gate
+        """
+        self.check_resume()
+        self.progress.open(self.header())
+        summaries = []
+        try:
+            for index in range(len(self.bounds)):
+                wave = self.wave_nodes(index)
+                todo = [node_id for node_id in wave if self.needs_run(node_id)]
+                logger.debug(f"Wave {index + 1}: {len(todo)} of {len(wave)} nodes to run")
+                if todo:
+                    self._run_wave(index + 1, todo)
+                self.progress.sync()
+                summary = WaveSummary(index + 1, wave, self.progress)
+                summaries.append(summary)
+                if self.on_wave:
+                    self.on_wave(summary, todo)
+                if self.stop_event.is_set() or summary.success_rate < self.min_success_rate:
+                    break
+        finally:
+            self.progress.close()
+        return summaries
+
+    def stop(self):
+        """Stop starting nodes and abandon in-flight cycles; safe from any thread."""
+        self.stop_event.set()
+
+    def _run_wave(self, wave: int, node_ids: List[str]):
+        for node_id in node_ids:
+            self._states[node_id] = PENDING
+
+        def on_result(result):
+            if result.error == CANCELLED or (result.error and self.stop_event.is_set()):
+                return
+            if not result.connect.ok:
+                self._transition(result.node_id, FAILED, wave, error=result.connect.error)
+            elif result.error:
+                self._transition(result.node_id, FAILED, wave, error=result.error)
+
+        def operation(client, node_id):
+            return self._run_node(client, node_id, wave)
+
+        run_on_nodes(self.ctx, node_ids, operation, concurrency=self.concurrency, on_result=on_result,
+                     keep_connections=False, stop_event=self.stop_event)
+
+    def _transition(self, node_id: str, state: str, wave: int, **fields):
+        current = self._states.get(node_id, PENDING)
+        if state not in TRANSITIONS[current]:
+            raise MQTTOTAError(f"Invalid OTA state change for {node_id}: {current} -> {state}")
+        self._states[node_id] = state
+        self.progress.record(node_id, state, wave, **fields)
+        if self.on_node:
+            self.on_node(node_id, self.progress.records[node_id])
+
+    def _wait(self, seconds: float):
+        if self.stop_event.wait(seconds):
+            raise CampaignInterrupted("campaign stopped")
+
+    def _run_node(self, client, node_id: str, wave: int) -> str:
+        """Run one node's OTA cycle on a fan-out worker and return its final state."""
+        if self.stop_event.is_set():
+            raise CampaignInterrupted("campaign stopped")
+        received = threading.Event()
+        response = {}
+
+        def on_ota_url(mqtt_client, userdata, message):
+            try:
+                response.update(json.loads(message.payload.decode()))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                response['error'] = 'invalid JSON in otaurl response'
+            received.set()
+
+        url_topic = f"node/{node_id}/otaurl"
+        self._transition(node_id, FETCHING, wave)
+        if not client.add_handler(url_topic, on_ota_url, qos=1):
+            raise MQTTOTAError("subscribe to otaurl failed")
+        try:
+            payload = {"fw_version": self.fw_version}
+            if self.network_id:
+                payload["network_id"] = self.network_id
+            if not client.publish(f"node/{node_id}/otafetch", json.dumps(payload), qos=1):
+                raise MQTTOTAError("otafetch publish failed")
+
+            if not self._wait_for(received, self.url_timeout):
+                self._transition(node_id, TIMED_OUT, wave, error=f"no otaurl within {self.url_timeout:g}s")
+                return TIMED_OUT
+            if 'error' in response:
+                raise MQTTOTAError(response['error'])
+            job_id = response.get('ota_job_id')
+            if not job_id:
+                raise MQTTOTAError("no OTA job ID in otaurl response")
+
+            steps = self.policy.sequence_for(node_id, response)
+            if not steps:
+                self._transition(node_id, SKIPPED, wave, job_id=job_id)
+                return SKIPPED
+            self._transition(node_id, UPDATING, wave, job_id=job_id)
+            network_id = response.get('network_id', self.network_id)
+            for step in steps:
+                self._wait(step.delay)
+                self._send_status(client, node_id, job_id, step, network_id)
+
+            final = steps[-1].status
+            if final == 'success':
+                self._transition(node_id, SUCCEEDED, wave, job_id=job_id, status=final)
+                return SUCCEEDED
+            self._transition(node_id, FAILED, wave, job_id=job_id, status=final, error=f"reported {final}")
+            return FAILED
+        finally:
+            try:
+                client.remove_handler(url_topic, on_ota_url)
+            except Exception as e:
+                logger.debug(f"Unsubscribe from {url_topic} failed: {str(e)}")
+
+    def _wait_for(self, event: threading.Event, timeout: float) -> bool:
+        """Wait for an event, waking up regularly to notice a stop."""
+        deadline = time.monotonic() + timeout
+        while not event.wait(min(0.5, max(0.0, deadline - time.monotonic()))):
+            if self.stop_event.is_set():
+                raise CampaignInterrupted("campaign stopped")
+            if time.monotonic() >= deadline:
+                return False
+        return True
+
+    def _send_status(self, client, node_id, job_id, step, network_id):
+        error = None
+        for attempt in range(STATUS_PUBLISH_ATTEMPTS):
+            if attempt:
+                self._wait(STATUS_RETRY_DELAY)
+            try:
+                if publish_ota_status(client, node_id, job_id, step.status, network_id,
+                                      step.info or DEFAULT_STATUS_INFO[step.status]):
+                    return
+                error = "publish failed"
+            except Exception as e:
+                error = str(e)
+            logger.debug(f"Status {step.status} for {node_id} failed ({error}), attempt {attempt + 1}")
+        raise MQTTOTAError(f"{step.status}: {error}")
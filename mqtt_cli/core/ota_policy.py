@@ -0,0 +1,333 @@
+"""
+Policy-driven OTA status responder for MQTT CLI.
+
+`ota request` normally asks the operator which status to report for every
+otaurl response. For fleet tests the answer comes from a policy instead: a
+status sequence such as ``in-progress,success:5`` (report in-progress right
+away, success five seconds later), optionally overridden per node or
+firmware version by a rules file:
+
+    {
+      "default": "in-progress,success:5",
+      "rules": [
+        {"node_id": "lab-*", "sequence": "in-progress:1,failed:2"},
+        {"fw_version": "1.*", "sequence": "rejected", "info": "Firmware too old"},
+        {"node_id": "node-skip", "sequence": []}
+      ]
+    }
+
+Rules match with shell-style wildcards and the first match wins; an empty
+sequence skips the node. OTAResponder runs the sequences without blocking
+the MQTT receive thread: delays are kept on a single timer heap and
+publishes run on a small worker pool, so thousands of nodes can be in the
+middle of their OTA cycle at once.
+"""
+import fnmatch
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+OTA_STATUSES = ('in-progress', 'success', 'rejected', 'failed', 'delayed')
+
+DEFAULT_STATUS_INFO = {
+    'success': 'Update completed successfully',
+    'failed': 'Update failed',
+    'in-progress': 'Update in progress',
+    'rejected': 'Update rejected',
+    'delayed': 'Update delayed',
+}
+
+DEFAULT_RESPONDER_WORKERS = 16
+# Attempts per status publish, and the wait between them
+STATUS_PUBLISH_ATTEMPTS = 3
+STATUS_RETRY_DELAY = 2.0
+
+
+class StatusStep(NamedTuple):
+    """One status report: wait delay seconds after the previous step, then send."""
+    status: str
+    delay: float = 0.0
+    info: Optional[str] = None
+
+
+def parse_status_sequence(spec, info: Optional[str] = None) -> List[StatusStep]:
+    """Parse a status sequence.
+
+    Accepts a string like "in-progress,success:5" or a list whose items are
+    such strings or {"status", "delay", "info"} objects.
+
+    Raises:
+        ValueError: On an unknown status or a bad delay
+    """
+    if isinstance(spec, str):
+        spec = [part for part in spec.split(',') if part.strip()]
+    steps = []
+    for item in spec:
+        if isinstance(item, dict):
+            status, delay, step_info = item.get('status'), item.get('delay', 0), item.get('info', info)
+        else:
+            status, _, delay = item.strip().partition(':')
+            step_info = info
+        if status not in OTA_STATUSES:
+            raise ValueError(f"Unknown OTA status '{status}', expected one of: {', '.join(OTA_STATUSES)}")
+        try:
+            delay = float(delay or 0)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid delay '{delay}' for status '{status}'")
+        if delay < 0:
+            raise ValueError(f"Delay for status '{status}' must not be negative")
+        steps.append(StatusStep(status, delay, step_info))
+    return steps
+
+
+class OTARule:
+    """Status sequence for nodes and/or firmware versions matching patterns."""
+
+    def __init__(self, sequence: List[StatusStep], node_id: str = '*', fw_version: str = '*'):
+        self.sequence = sequence
+        self.node_id = node_id
+        self.fw_version = fw_version
+
+    def matches(self, node_id: str, fw_version: str) -> bool:
+        return fnmatch.fnmatchcase(node_id, self.node_id) and fnmatch.fnmatchcase(fw_version, self.fw_version)
+
+
+class OTAPolicy:
+    """Chooses the status sequence to report for an otaurl response."""
+
+    def __init__(self, default: Optional[List[StatusStep]] = None, rules: Optional[List[OTARule]] = None):
+        self.default = default
+        self.rules = rules or []
+
+    def sequence_for(self, node_id: str, response: dict) -> List[StatusStep]:
+        """Steps to run for a node's otaurl response; empty to skip the node."""
+        fw_version = str(response.get('fw_version', ''))
+        for rule in self.rules:
+            if rule.matches(node_id, fw_version):
+                return rule.sequence
+        return self.default or []
+
+    @classmethod
+    def load(cls, sequence: Optional[str] = None, rules_path: Optional[str] = None) -> 'OTAPolicy':
+        """Build a policy from an --auto-status sequence and/or a rules file.
+
+        The sequence, if given, replaces the rules file's default.
+
+        Raises:
+            ValueError: If the rules file or a sequence is invalid
+        """
+        default = parse_status_sequence(sequence) if sequence else None
+        rules = []
+        if rules_path:
+            try:
+                with open(rules_path) as f:
+                    data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON in rules file {rules_path}: {str(e)}")
+            if default is None and data.get('default') is not None:
+                default = parse_status_sequence(data['default'])
+            for index, rule in enumerate(data.get('rules', [])):
+                if 'sequence' not in rule:
+                    raise ValueError(f"Rule {index + 1} in {rules_path} has no sequence")
+                rules.append(OTARule(parse_status_sequence(rule['sequence'], rule.get('info')),
+                                     node_id=rule.get('node_id', '*'),
+                                     fw_version=rule.get('fw_version', '*')))
+        if default is None and not rules:
+            raise ValueError("OTA policy needs a status sequence or at least one rule")
+        return cls(default, rules)
+
+
+def build_ota_status_payload(job_id: str, status: str, network_id: Optional[str] = None,
+                             info: Optional[str] = None) -> dict:
+    """Payload for node/<node_id>/otastatus."""
+    payload = {
+        "status": status,
+        "ota_job_id": job_id
+    }
+    if network_id:
+        payload["network_id"] = network_id
+    if info:
+        payload["additional_info"] = info
+    return payload
+
+
+def publish_ota_status(mqtt_client, node_id: str, job_id: str, status: str,
+                       network_id: Optional[str] = None, info: Optional[str] = None) -> bool:
+    """Publish one OTA status report for a node."""
+    payload = build_ota_status_payload(job_id, status, network_id, info)
+    return bool(mqtt_client.publish(f"node/{node_id}/otastatus", json.dumps(payload), qos=1))
+
+
+def publish_ota_status_async(mqtt_client, node_id: str, job_id: str, status: str,
+                             network_id: Optional[str] = None, info: Optional[str] = None):
+    """Like publish_ota_status, but return the client's publish_async future."""
+    payload = build_ota_status_payload(job_id, status, network_id, info)
+    return mqtt_client.publish_async(f"node/{node_id}/otastatus", json.dumps(payload), qos=1)
+
+
+class OTAOutcome:
+    """Progress of one node's status sequence."""
+
+    def __init__(self, node_id: str, job_id: str, steps: List[StatusStep]):
+        self.node_id = node_id
+        self.job_id = job_id
+        self.steps = steps
+        self.sent: List[str] = []
+        self.error: Optional[str] = None
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and len(self.sent) == len(self.steps)
+
+    @property
+    def final_status(self) -> Optional[str]:
+        return self.sent[-1] if self.sent else None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+
+class OTAResponder:
+    """Answers otaurl responses according to an OTAPolicy.
+
+    handle() only enqueues and is safe to call from the MQTT receive thread.
+    A timer thread releases each step when its delay is up and a worker pool
+    publishes it.
+    """
+
+    def __init__(self, clients: Dict[str, object], policy: OTAPolicy,
+                 workers: int = DEFAULT_RESPONDER_WORKERS,
+                 on_status: Optional[Callable[[OTAOutcome, StatusStep], None]] = None,
+                 on_done: Optional[Callable[[OTAOutcome], None]] = None):
+        self.clients = clients
+        self.policy = policy
+        self.on_status = on_status
+        self.on_done = on_done
+        self.outcomes: Dict[str, OTAOutcome] = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ota-responder')
+        # (due, seq, outcome, step index, network_id, attempt)
+        self._timers = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._active = 0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run_timers, name='ota-responder-timers', daemon=True)
+        self._thread.start()
+
+    @property
+    def stopped(self) -> bool:
+        """Whether close() has been called; handle() then ignores responses."""
+        return self._stopped
+
+    def handle(self, node_id: str, response: dict) -> Optional[OTAOutcome]:
+        """Start the policy's status sequence for an otaurl response.
+
+        Returns None when the response has no job ID or the responder is stopped.
+        """
+        job_id = response.get('ota_job_id')
+        if not job_id:
+            logger.debug(f"No OTA job ID in response from {node_id}, ignoring")
+            return None
+        outcome = OTAOutcome(node_id, job_id, self.policy.sequence_for(node_id, response))
+        with self._cond:
+            if self._stopped:
+                return None
+            self.outcomes[node_id] = outcome
+            self._active += 1
+        if not outcome.steps:
+            self._finish(outcome)
+            return outcome
+        self._schedule(outcome, 0, response.get('network_id'), 1, outcome.steps[0].delay)
+        return outcome
+
+    def _schedule(self, outcome, index, network_id, attempt, delay):
+        with self._cond:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._seq),
+                                          outcome, index, network_id, attempt))
+            self._cond.notify()
+
+    def _run_timers(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._timers:
+                    self._cond.wait()
+                    continue
+                delay = self._timers[0][0] - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                _, _, outcome, index, network_id, attempt = heapq.heappop(self._timers)
+                self._executor.submit(self._send, outcome, index, network_id, attempt)
+
+    def _send(self, outcome: OTAOutcome, index: int, network_id, attempt: int):
+        """Publish one step on a worker and schedule the next one."""
+        step = outcome.steps[index]
+        client = self.clients.get(outcome.node_id)
+        try:
+            if client is None:
+                raise RuntimeError(f"No MQTT client for node {outcome.node_id}")
+            sent = publish_ota_status(client, outcome.node_id, outcome.job_id, step.status, network_id,
+                                      step.info or DEFAULT_STATUS_INFO[step.status])
+            error = None if sent else "publish failed"
+        except Exception as e:
+            error = str(e)
+
+        if error:
+            if attempt < STATUS_PUBLISH_ATTEMPTS:
+                logger.debug(f"Status {step.status} for {outcome.node_id} failed ({error}), retrying")
+                self._schedule(outcome, index, network_id, attempt + 1, STATUS_RETRY_DELAY)
+                return
+            outcome.error = f"{step.status}: {error}"
+            self._finish(outcome)
+            return
+
+        outcome.sent.append(step.status)
+        if self.on_status:
+            self.on_status(outcome, step)
+        if index + 1 < len(outcome.steps):
+            self._schedule(outcome, index + 1, network_id, 1, outcome.steps[index + 1].delay)
+        else:
+            self._finish(outcome)
+
+    def _finish(self, outcome: OTAOutcome):
+        outcome.finished = time.monotonic()
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+        if self.on_done:
+            self.on_done(outcome)
+
+    @property
+    def active(self) -> int:
+        """Number of nodes whose sequence has not finished."""
+        return self._active
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every started sequence has finished."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._active:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self):
+        """Drop pending steps and stop the timer thread and workers."""
+        with self._cond:
+            self._stopped = True
+            self._timers.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,149 @@
+"""
+Fixed-rate scheduling for MQTT CLI load generation.
+
+RateScheduler runs many periodic streams (e.g. 200 nodes at 50 Hz) from a
+single thread. Deadlines are computed from the start time as
+start + phase + n * period on the monotonic clock instead of by adding up
+sleeps, so rates do not drift however long a run lasts. Each wakeup runs
+every stream whose deadline falls within a small slack window, which keeps
+the number of sleeps well below the number of ticks at high rates.
+
+For every tick the scheduler records how late it ran (jitter). A stream
+that falls more than a full period behind skips the ticks it missed rather
+than bursting to catch up, and the skipped ticks are counted as missed
+deadlines.
+"""
+import heapq
+import threading
+import time
+from typing import Callable, List, Optional
+
+from ..utils.stats import LatencyHistogram
+
+# Deadlines this close together are run in one wakeup
+DEFAULT_SLACK = 0.002
+
+
+class ScheduleStats:
+    """Tick counts and lateness for a scheduler run."""
+
+    def __init__(self):
+        self.ticks = 0
+        self.missed = 0
+        self.lateness = LatencyHistogram()
+        self.wakeups = 0
+        self.started = time.monotonic()
+
+    def to_dict(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            'ticks': self.ticks,
+            'missed': self.missed,
+            'wakeups': self.wakeups,
+            'elapsed': elapsed,
+            'rate': self.ticks / elapsed if elapsed > 0 else 0.0,
+            'jitter_p50_ms': self.lateness.percentile(50),
+            'jitter_p99_ms': self.lateness.percentile(99),
+            'jitter_max_ms': self.lateness.max_us / 1000,
+        }
+
+
+class _Stream:
+    __slots__ = ('callback', 'period', 'offset', 'tick')
+
+    def __init__(self, callback, period: float, offset: float):
+        self.callback = callback
+        self.period = period
+        self.offset = offset
+        self.tick = 0
+
+
+class RateScheduler:
+    """Runs callbacks at fixed rates from one thread.
+
+    Each callback is called as callback(tick, deadline), where tick counts
+    from 0 and deadline is the monotonic time it was due. Callbacks run on
+    the scheduler thread and should be quick; time they take shows up as
+    lateness of the ticks after them.
+    """
+
+    def __init__(self, slack: float = DEFAULT_SLACK, stop_event: Optional[threading.Event] = None):
+        self.slack = slack
+        self.stop_event = stop_event or threading.Event()
+        self.stats = ScheduleStats()
+        self._streams: List[_Stream] = []
+        self._start = None
+
+    def add(self, rate: float, callback: Callable[[int, float], None], phase: float = 0.0):
+        """Add a stream of `rate` ticks per second.
+
+        Args:
+            rate: Ticks per second
+            callback: Called as callback(tick, deadline)
+            phase: Fraction of a period (0-1) to delay the stream by, to spread
+                streams with the same rate over the period
+        """
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        period = 1.0 / rate
+        self._streams.append(_Stream(callback, period, (phase % 1.0) * period))
+
+    def stop(self):
+        """Make run() return after the current wakeup; safe from any thread."""
+        self.stop_event.set()
+
+    def run(self, duration: Optional[float] = None,
+            on_wakeup: Optional[Callable[[float], None]] = None) -> ScheduleStats:
+        """Run until stopped or for `duration` seconds.
+
+        Args:
+            duration: Seconds to run, or None to run until stop()
+            on_wakeup: Optional callback(now) after each wakeup's ticks, e.g.
+                for periodic reporting
+
+        Returns:
+            ScheduleStats for the run
+        """
+        self._start = start = time.monotonic()
+        self.stats = stats = ScheduleStats()
+        end = start + duration if duration is not None else None
+        # (deadline, stream index)
+        heap = [(start + stream.offset, index) for index, stream in enumerate(self._streams)]
+        heapq.heapify(heap)
+
+        while heap and not self.stop_event.is_set():
+            deadline = heap[0][0]
+            if end is not None and deadline >= end:
+                break
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                # Event.wait returns early on stop()
+                if self.stop_event.wait(delay):
+                    break
+            now = time.monotonic()
+            stats.wakeups += 1
+            horizon = now + self.slack
+            while heap and heap[0][0] <= horizon:
+                deadline, index = heapq.heappop(heap)
+                if end is not None and deadline >= end:
+                    break
+                stream = self._streams[index]
+                lateness = time.monotonic() - deadline
+                stream.callback(stream.tick, deadline)
+                stats.ticks += 1
+                stats.lateness.record(max(0.0, lateness))
+                heapq.heappush(heap, (self._next_deadline(stream, start, time.monotonic()), index))
+            if on_wakeup:
+                on_wakeup(now)
+        return stats
+
+    def _next_deadline(self, stream: _Stream, start: float, now: float) -> float:
+        """Advance a stream to its next deadline, skipping any already a period overdue."""
+        stream.tick += 1
+        deadline = start + stream.offset + stream.tick * stream.period
+        if now - deadline > stream.period:
+            behind = int((now - start - stream.offset) / stream.period)
+            self.stats.missed += behind - stream.tick
+            stream.tick = behind
+            deadline = start + stream.offset + stream.tick * stream.period
+        return deadline
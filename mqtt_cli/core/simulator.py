@@ -0,0 +1,540 @@
+"""
+In-process virtual RainMaker nodes for MQTT CLI load tests.
+
+Each virtual node has its own MQTT connection and certificate, like a real
+device, but nodes do not get the client threads of AWSIoTMQTTClient. All
+connections are plain paho clients driven from one selector loop
+(ClientLoop), so one process can host thousands of nodes. Blocking TLS
+handshakes run on a small connect pool, and everything else happens on the
+loop thread: reads, writes, keepalives, timers and every node callback.
+
+A virtual node behaves like the firmware:
+
+- on its first connect it publishes its config and initial params
+  (and otafetch, if enabled)
+- values received on params/remote are applied and reported back on
+  params/local
+- to-node commands are acknowledged on from-node
+- otaurl responses are answered with otastatus reports following an
+  OTAPolicy sequence
+- parameters with the time_series or simple_ts property emit tsdata at a
+  fixed rate, driven by a RateScheduler
+"""
+import collections
+import heapq
+import itertools
+import json
+import logging
+import selectors
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import paho.mqtt.client as paho
+
+from ..utils.stats import LatencyHistogram
+from .ota_policy import OTAPolicy, build_ota_status_payload
+from .scheduler import RateScheduler
+from .tsdata import TSRecord, make_value_generator, pack_records, tsdata_topic
+
+logger = logging.getLogger(__name__)
+
+# AWS IoT only accepts MQTT on port 443 with this ALPN protocol
+AWS_IOT_ALPN = 'x-amzn-mqtt-ca'
+DEFAULT_KEEPALIVE = 30
+# How often keepalives are checked for every connection
+MISC_INTERVAL = 1.0
+RECONNECT_MIN_DELAY = 1.0
+RECONNECT_MAX_DELAY = 32.0
+DEFAULT_OTA_SEQUENCE = 'in-progress,success:5'
+TS_PROPERTIES = ('time_series', 'simple_ts')
+# Command response TLV types, as in the ESP RainMaker firmware
+TLV_REQUEST_ID = '1'
+TLV_ROLE = '2'
+TLV_STATUS = '3'
+TLV_COMMAND = '5'
+
+COUNTERS = ('connected', 'connect_failed', 'disconnects', 'params_remote', 'commands', 'ota_jobs',
+            'ota_status', 'tsdata_messages', 'published', 'acked', 'dropped', 'errors')
+
+
+def make_tls_context(root_path: str, cert_path: str, key_path: str, alpn: bool = True) -> ssl.SSLContext:
+    """Client TLS context for one node certificate."""
+    context = ssl.create_default_context(cafile=root_path)
+    context.load_cert_chain(cert_path, key_path)
+    if alpn:
+        context.set_alpn_protocols([AWS_IOT_ALPN])
+    return context
+
+
+def _new_paho_client(client_id: str):
+    kwargs = {'client_id': client_id, 'clean_session': True, 'protocol': paho.MQTTv311}
+    if hasattr(paho, 'CallbackAPIVersion'):
+        # paho-mqtt 2.x; the callbacks below accept the arguments of both versions
+        kwargs['callback_api_version'] = paho.CallbackAPIVersion.VERSION2
+    return paho.Client(**kwargs)
+
+
+def _reason_value(rc) -> int:
+    # paho-mqtt 2.x passes ReasonCode objects, 1.x plain ints
+    return int(getattr(rc, 'value', rc))
+
+
+def timeseries_params(config: dict) -> List[tuple]:
+    """(device, param, data_type, low, high) for every numeric or bool time series parameter."""
+    found = []
+    for device in config.get('devices', []):
+        for param in device.get('params', []):
+            if not set(param.get('properties', [])) & set(TS_PROPERTIES):
+                continue
+            data_type = param.get('data_type')
+            if data_type not in ('int', 'float', 'bool'):
+                continue
+            bounds = param.get('bounds', {})
+            found.append((device['name'], param['name'], data_type,
+                          float(bounds.get('min', 0)), float(bounds.get('max', 100))))
+    return found
+
+
+class ClientLoop:
+    """Selector loop running many paho clients, timers and queued calls on one thread.
+
+    Only call_soon() may be used from other threads; everything else,
+    including publishing through a registered client, belongs on the loop
+    thread. After publishing, mark() the client so its queued packets are
+    written.
+    """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self._timers = []  # (when, sequence, callback, args)
+        self._sequence = itertools.count()
+        self._calls = collections.deque()
+        self._wake_pending = False
+        self._waker_r, self._waker_w = socket.socketpair()
+        self._waker_r.setblocking(False)
+        self._waker_w.setblocking(False)
+        self.selector.register(self._waker_r, selectors.EVENT_READ, None)
+        self._socks = {}  # client -> (socket, registered events)
+        self._dirty = set()
+        self._next_misc = time.monotonic() + MISC_INTERVAL
+        self._stopped = threading.Event()
+        self.thread = None
+
+    @property
+    def clients(self) -> int:
+        return len(self._socks)
+
+    def call_soon(self, callback, *args):
+        """Run callback(*args) on the loop thread; safe from any thread."""
+        self._calls.append((callback, args))
+        if not self._wake_pending:
+            self._wake_pending = True
+            try:
+                self._waker_w.send(b'\0')
+            except (BlockingIOError, OSError):
+                pass
+
+    def call_later(self, delay: float, callback, *args):
+        """Run callback(*args) on the loop thread after delay seconds."""
+        heapq.heappush(self._timers, (time.monotonic() + delay, next(self._sequence), callback, args))
+
+    def add_client(self, client):
+        """Start serving a client whose socket has just connected."""
+        sock = client.socket()
+        if sock is None:
+            return
+        self.selector.register(sock, selectors.EVENT_READ, client)
+        self._socks[client] = (sock, selectors.EVENT_READ)
+        self._dirty.add(client)
+
+    def remove_client(self, client):
+        entry = self._socks.pop(client, None)
+        self._dirty.discard(client)
+        if entry is not None:
+            try:
+                self.selector.unregister(entry[0])
+            except (KeyError, ValueError):
+                pass
+
+    def mark(self, client):
+        """Note that a client may have packets to write."""
+        self._dirty.add(client)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='simulator-loop', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self.call_soon(lambda: None)
+
+    def join(self, timeout: Optional[float] = None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.run_once()
+        self.selector.close()
+        self._waker_r.close()
+        self._waker_w.close()
+
+    def run_once(self, max_wait: float = MISC_INTERVAL):
+        now = time.monotonic()
+        timeout = min(max_wait, max(0.0, self._next_misc - now))
+        if self._timers:
+            timeout = min(timeout, max(0.0, self._timers[0][0] - now))
+        if self._calls or self._dirty:
+            timeout = 0
+        for key, mask in self.selector.select(timeout):
+            client = key.data
+            if client is None:
+                self._drain_waker()
+                continue
+            if mask & selectors.EVENT_READ:
+                self._read(client)
+            if mask & selectors.EVENT_WRITE and client in self._socks:
+                client.loop_write()
+            self._dirty.add(client)
+        self._run_calls()
+        self._run_timers()
+        if time.monotonic() >= self._next_misc:
+            for client in list(self._socks):
+                client.loop_misc()
+            self._next_misc = time.monotonic() + MISC_INTERVAL
+        self._flush_writes()
+
+    def _read(self, client):
+        client.loop_read()
+        # TLS may hold decrypted bytes the selector cannot see
+        entry = self._socks.get(client)
+        pending = getattr(entry[0], 'pending', None) if entry else None
+        while pending is not None and client in self._socks and pending() > 0:
+            client.loop_read()
+
+    def _drain_waker(self):
+        try:
+            while self._waker_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_calls(self):
+        self._wake_pending = False
+        calls = self._calls
+        while calls:
+            callback, args = calls.popleft()
+            self._safely(callback, args)
+
+    def _run_timers(self):
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, callback, args = heapq.heappop(self._timers)
+            self._safely(callback, args)
+
+    def _safely(self, callback, args):
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.debug(f"Simulator callback {getattr(callback, '__name__', callback)} failed: {str(e)}")
+
+    def _flush_writes(self):
+        dirty, self._dirty = self._dirty, set()
+        for client in dirty:
+            if client not in self._socks:
+                continue
+            if client.want_write():
+                client.loop_write()
+            entry = self._socks.get(client)
+            if entry is None:
+                # The write found the connection gone
+                continue
+            sock, events = entry
+            wanted = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.want_write() else 0)
+            if wanted != events:
+                self.selector.modify(sock, wanted, client)
+                self._socks[client] = (sock, wanted)
+
+
+class VirtualNode:
+    """One simulated node; all methods except connect() run on the loop thread."""
+
+    def __init__(self, simulator: 'Simulator', node_id: str, config: dict, params: dict,
+                 tls_context: Optional[ssl.SSLContext] = None):
+        self.simulator = simulator
+        self.node_id = node_id
+        self.config = config
+        self.params = params
+        self.fw_version = str(config.get('info', {}).get('fw_version', ''))
+        self.connected = False
+        self.booted = False
+        self._prefix = f"node/{node_id}/"
+        self._connect_started = None
+        self._reconnect_delay = RECONNECT_MIN_DELAY
+        self._generators = {}
+        self.client = _new_paho_client(node_id)
+        if tls_context is not None:
+            self.client.tls_set_context(tls_context)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_publish = self._on_publish
+
+    # Connection
+
+    def connect(self):
+        """Blocking TCP/TLS connect and CONNECT; runs on the connect pool."""
+        self._connect_started = time.perf_counter()
+        sim = self.simulator
+        try:
+            if self.booted:
+                self.client.reconnect()
+            else:
+                self.client.connect(sim.host, sim.port, sim.keepalive)
+        except Exception as e:
+            logger.debug(f"Connect failed for {self.node_id}: {str(e)}")
+            sim.loop.call_soon(self._connect_failed, str(e))
+            return
+        sim.loop.call_soon(sim.loop.add_client, self.client)
+
+    def _connect_failed(self, error: str):
+        sim = self.simulator
+        sim.counts['connect_failed'] += 1
+        sim.last_error = error
+        self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        if self.simulator.stopping:
+            return
+        self.simulator.loop.call_later(self._reconnect_delay, self.simulator.submit_connect, self)
+        self._reconnect_delay = min(self._reconnect_delay * 2, RECONNECT_MAX_DELAY)
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        sim = self.simulator
+        if _reason_value(rc) != 0:
+            sim.counts['connect_failed'] += 1
+            sim.last_error = f"connection refused ({rc})"
+            return
+        self.connected = True
+        self._reconnect_delay = RECONNECT_MIN_DELAY
+        sim.counts['connected'] += 1
+        sim.peak_connected = max(sim.peak_connected, sim.counts['connected'])
+        sim.connect_latency.record(time.perf_counter() - self._connect_started)
+        client.subscribe([(self._prefix + 'params/remote', 1), (self._prefix + 'to-node', 1),
+                          (self._prefix + 'otaurl', 1)])
+        if not self.booted:
+            self.booted = True
+            self.publish('config', self.config)
+            self.publish('params/local/init', self.params)
+            if sim.ota_fetch:
+                self.publish('otafetch', {'fw_version': self.fw_version})
+        sim.loop.mark(client)
+
+    def _on_disconnect(self, client, userdata, *args):
+        sim = self.simulator
+        was_connected = self.connected
+        self.connected = False
+        sim.loop.remove_client(client)
+        if was_connected:
+            sim.counts['connected'] -= 1
+        if not sim.stopping:
+            sim.counts['disconnects'] += 1
+            self._schedule_reconnect()
+
+    def close(self):
+        if self.connected:
+            self.client.disconnect()
+            self.simulator.loop.mark(self.client)
+
+    # Publishing
+
+    def publish(self, suffix: str, payload, topic: Optional[str] = None):
+        sim = self.simulator
+        if not self.connected:
+            sim.counts['dropped'] += 1
+            return
+        if not isinstance(payload, str):
+            payload = json.dumps(payload)
+        info = self.client.publish(topic or self._prefix + suffix, payload, qos=1)
+        if info.rc == 0:
+            sim.counts['published'] += 1
+        else:
+            sim.counts['errors'] += 1
+        sim.loop.mark(self.client)
+
+    def _on_publish(self, client, userdata, mid, *args):
+        self.simulator.counts['acked'] += 1
+
+    # Incoming messages
+
+    def _on_message(self, client, userdata, message):
+        suffix = message.topic[len(self._prefix):]
+        try:
+            data = json.loads(message.payload)
+        except (ValueError, UnicodeDecodeError):
+            logger.debug(f"Ignoring non-JSON message for {self.node_id} on {message.topic}")
+            return
+        if suffix == 'params/remote':
+            self._on_params_remote(data)
+        elif suffix == 'to-node':
+            self._on_command(data)
+        elif suffix == 'otaurl':
+            self._on_otaurl(data)
+
+    def _on_params_remote(self, data):
+        if not isinstance(data, dict):
+            return
+        self.simulator.counts['params_remote'] += 1
+        applied = {}
+        for device, values in data.items():
+            if device in self.params and isinstance(values, dict):
+                self.params[device].update(values)
+                applied[device] = values
+        if applied:
+            # Report the new values like the firmware does
+            self.publish('params/local', applied)
+
+    def _on_command(self, data):
+        if not isinstance(data, dict):
+            return
+        self.simulator.counts['commands'] += 1
+        response = {TLV_REQUEST_ID: data.get(TLV_REQUEST_ID), TLV_STATUS: 0,
+                    TLV_COMMAND: data.get(TLV_COMMAND)}
+        if TLV_ROLE in data:
+            response[TLV_ROLE] = data[TLV_ROLE]
+        self.publish('from-node', response)
+
+    def _on_otaurl(self, data):
+        if not isinstance(data, dict) or not data.get('ota_job_id'):
+            return
+        sim = self.simulator
+        sim.counts['ota_jobs'] += 1
+        delay = 0.0
+        for step in sim.ota_policy.sequence_for(self.node_id, data):
+            delay += step.delay
+            sim.loop.call_later(delay, self._send_ota_status, data, step)
+
+    def _send_ota_status(self, data, step):
+        payload = build_ota_status_payload(data['ota_job_id'], step.status, data.get('network_id'), step.info)
+        self.simulator.counts['ota_status'] += 1
+        self.publish('otastatus', payload)
+        if step.status == 'success' and data.get('fw_version'):
+            self.fw_version = str(data['fw_version'])
+
+    # Time series
+
+    def emit_tsdata(self, t: int, elapsed: float):
+        if not self.connected:
+            # Like the firmware, points are only produced while online
+            return
+        sim = self.simulator
+        records = []
+        for device, name, data_type, low, high in sim.ts_params.get(self.node_id, ()):
+            generate = self._generators.get((device, name))
+            if generate is None:
+                generate = self._generators[(device, name)] = make_value_generator('walk', low, high)
+            value = generate(elapsed)
+            if data_type == 'int':
+                value = int(round(value))
+            elif data_type == 'bool':
+                value = value > (low + high) / 2
+            else:
+                value = round(value, 2)
+            self.params.setdefault(device, {})[name] = value
+            records.append(TSRecord(self.node_id, f"{device}.{name}", data_type, value, t))
+        for message in pack_records(records):
+            sim.counts['tsdata_messages'] += 1
+            self.publish('tsdata', message.payload, topic=tsdata_topic(self.node_id, sim.basic_ingest))
+
+
+class Simulator:
+    """Hosts virtual nodes on one ClientLoop.
+
+    Counters in `counts` are only written on the loop thread; reading
+    them from elsewhere gives a slightly stale but consistent-enough view
+    for progress reports.
+    """
+
+    def __init__(self, host: str, port: int = 443, keepalive: int = DEFAULT_KEEPALIVE,
+                 connect_concurrency: int = 32, ota_policy: Optional[OTAPolicy] = None,
+                 ota_fetch: bool = False, tsdata_rate: float = 0.0, basic_ingest: bool = False):
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.ota_policy = ota_policy or OTAPolicy.load(DEFAULT_OTA_SEQUENCE)
+        self.ota_fetch = ota_fetch
+        self.tsdata_rate = tsdata_rate
+        self.basic_ingest = basic_ingest
+        self.loop = ClientLoop()
+        self.nodes: Dict[str, VirtualNode] = {}
+        self.ts_params: Dict[str, list] = {}
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.connect_latency = LatencyHistogram()
+        self.last_error = None
+        self.peak_connected = 0
+        self.stopping = False
+        self.scheduler = None
+        self._connect_pool = ThreadPoolExecutor(max_workers=connect_concurrency, thread_name_prefix='simulator-connect')
+        self._scheduler_thread = None
+
+    def add_node(self, node_id: str, config: dict, params: dict,
+                 tls_context: Optional[ssl.SSLContext] = None) -> VirtualNode:
+        node = self.nodes[node_id] = VirtualNode(self, node_id, config, params, tls_context)
+        self.ts_params[node_id] = timeseries_params(config)
+        return node
+
+    def submit_connect(self, node: VirtualNode):
+        if not self.stopping:
+            self._connect_pool.submit(node.connect)
+
+    def start(self):
+        """Start the loop, connect every node and start time series emission."""
+        self.loop.start()
+        for node in self.nodes.values():
+            self.submit_connect(node)
+        if self.tsdata_rate > 0 and any(self.ts_params.values()):
+            self.scheduler = RateScheduler()
+            # Monotonic deadlines map onto wall-clock timestamps from one reference point
+            wall_offset = time.time() - time.monotonic()
+            emitting = [node for node in self.nodes.values() if self.ts_params[node.node_id]]
+            for index, node in enumerate(emitting):
+                def tick(number, deadline, node=node):
+                    self.loop.call_soon(node.emit_tsdata, int(wall_offset + deadline), number / self.tsdata_rate)
+                self.scheduler.add(self.tsdata_rate, tick, phase=index / len(emitting))
+            self._scheduler_thread = threading.Thread(target=self.scheduler.run, name='simulator-tsdata', daemon=True)
+            self._scheduler_thread.start()
+
+    def close(self, timeout: float = 5.0):
+        """Disconnect every node and stop all threads."""
+        self.stopping = True
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self._scheduler_thread.join(timeout)
+        # Connects still queued are dropped; ones in progress finish
+        self._connect_pool.shutdown(wait=True, cancel_futures=True)
+        for node in self.nodes.values():
+            self.loop.call_soon(node.close)
+        deadline = time.monotonic() + timeout
+        while self.loop.clients and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.loop.stop()
+        self.loop.join(timeout)
+
+    def snapshot(self) -> dict:
+        """Counters plus connect latency and tsdata scheduling figures."""
+        snapshot = dict(self.counts)
+        snapshot['nodes'] = len(self.nodes)
+        snapshot['peak_connected'] = self.peak_connected
+        snapshot['connect_p50_ms'] = self.connect_latency.percentile(50)
+        snapshot['connect_p99_ms'] = self.connect_latency.percentile(99)
+        snapshot['last_error'] = self.last_error
+        if self.scheduler is not None:
+            schedule = self.scheduler.stats.to_dict()
+            snapshot['ticks'] = schedule['ticks']
+            snapshot['missed'] = schedule['missed']
+            snapshot['jitter_p99_ms'] = schedule['jitter_p99_ms']
+        return snapshot
@@ -0,0 +1,364 @@
+"""
+Disk-backed offline publish spool for MQTT CLI.
+
+Publishes made while a node is offline are appended to a per-node
+write-ahead log under <config_dir>/spool instead of the SDK's unbounded
+in-memory queue. The log survives process exits and is drained at a
+configurable rate once the node is back online.
+
+Record layout (little endian):
+
+    crc32:u32  length:u32  qos:u8  topic_len:u16  topic  payload
+
+where length covers everything after the first eight bytes and the CRC is
+taken over the same bytes. A torn or corrupt tail record is discarded when
+the spool is opened. The offset of the oldest undelivered record is kept in
+a separate .head file; the log is compacted once most of it is consumed.
+
+Connections get a LazySpool, which opens (and locks) the log only for the
+first offline publish or when records are already pending, so nodes that
+never go offline cost no file descriptor and leave no files behind.
+"""
+import logging
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from pathlib import Path
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR_NAME = 'spool'
+DROP_POLICIES = ('oldest', 'newest')
+
+DEFAULT_SPOOL_SETTINGS = {
+    'enabled': True,
+    'max_messages': 10000,
+    'max_bytes': 16 * 1024 * 1024,
+    'drop_policy': 'oldest',
+    'drain_rate': 20.0,  # messages per second
+}
+
+_HEADER = struct.Struct('<II')
+_META = struct.Struct('<BH')
+
+# Compact once this many bytes at the start of the log have been consumed
+_COMPACT_MIN_BYTES = 1024 * 1024
+
+
+class SpoolBusyError(Exception):
+    """Raised when another process holds a node's spool."""
+
+
+class PublishSpool:
+    """Bounded per-node write-ahead log of publishes waiting for a connection."""
+
+    def __init__(self, spool_dir, node_id: str, max_messages: int = DEFAULT_SPOOL_SETTINGS['max_messages'],
+                 max_bytes: int = DEFAULT_SPOOL_SETTINGS['max_bytes'],
+                 drop_policy: str = DEFAULT_SPOOL_SETTINGS['drop_policy'],
+                 drain_rate: float = DEFAULT_SPOOL_SETTINGS['drain_rate']):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}', expected one of: {', '.join(DROP_POLICIES)}")
+        self.node_id = node_id
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.drop_policy = drop_policy
+        self.drain_rate = drain_rate
+        self.dropped = 0
+
+        spool_dir = Path(spool_dir)
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', node_id)
+        self.log_path = spool_dir / f"{safe_name}.wal"
+        self.head_path = spool_dir / f"{safe_name}.head"
+
+        self._lock = threading.RLock()
+        self._drain_lock = threading.Lock()
+        # (offset, record size) for every pending record, oldest first
+        self._index = deque()
+        self._bytes = 0
+        self._head = 0
+        self._open()
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def _open(self):
+        """Load the head offset and index pending records, dropping a torn tail."""
+        try:
+            self._head = int(self.head_path.read_text() or 0)
+        except (FileNotFoundError, ValueError):
+            self._head = 0
+
+        self._file = open(self.log_path, 'a+b')
+        if fcntl:
+            try:
+                # One process owns a node's spool at a time
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._file.close()
+                raise SpoolBusyError(f"Spool for {self.node_id} is in use by another process")
+        self._file.seek(0, os.SEEK_END)
+        end = self._file.tell()
+        if self._head > end:
+            self._head = 0
+
+        offset = self._head
+        self._file.seek(offset)
+        while offset + _HEADER.size <= end:
+            crc, length = _HEADER.unpack(self._file.read(_HEADER.size))
+            body = self._file.read(length)
+            if len(body) != length or zlib.crc32(body) != crc:
+                break
+            self._index.append((offset, _HEADER.size + length))
+            self._bytes += _HEADER.size + length
+            offset += _HEADER.size + length
+
+        if offset < end:
+            logger.warning(f"Discarding {end - offset} corrupt bytes at the end of {self.log_path}")
+            self._file.truncate(offset)
+        if self._index:
+            logger.debug(f"Spool for {self.node_id} has {len(self._index)} pending message(s)")
+
+    def append(self, topic: str, payload, qos: int) -> bool:
+        """Append a publish to the log, applying the caps and drop policy.
+
+        Returns:
+            bool: False if the message was dropped
+        """
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        topic_bytes = topic.encode('utf-8')
+        body = _META.pack(qos, len(topic_bytes)) + topic_bytes + bytes(payload)
+        record = _HEADER.pack(zlib.crc32(body), len(body)) + body
+
+        with self._lock:
+            if len(record) > self.max_bytes:
+                self.dropped += 1
+                return False
+            while len(self._index) >= self.max_messages or self._bytes + len(record) > self.max_bytes:
+                if self.drop_policy == 'newest' or not self._index:
+                    self.dropped += 1
+                    return False
+                # Drop the oldest record by moving the head past it
+                self._advance(1)
+                self.dropped += 1
+
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(record)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._index.append((offset, len(record)))
+            self._bytes += len(record)
+        return True
+
+    def _read(self, offset: int, size: int):
+        self._file.seek(offset + _HEADER.size)
+        body = self._file.read(size - _HEADER.size)
+        qos, topic_len = _META.unpack_from(body)
+        start = _META.size
+        topic = body[start:start + topic_len].decode('utf-8')
+        return topic, body[start + topic_len:], qos
+
+    def peek(self):
+        """Return the oldest pending (topic, payload, qos), or None."""
+        with self._lock:
+            if not self._index:
+                return None
+            return self._read(*self._index[0])
+
+    def _advance(self, count: int):
+        """Mark the oldest count records as done and persist the head."""
+        for _ in range(count):
+            offset, size = self._index.popleft()
+            self._bytes -= size
+            self._head = offset + size
+        if not self._index:
+            # Nothing pending: start the log over
+            self._file.truncate(0)
+            self._head = 0
+        elif self._head >= _COMPACT_MIN_BYTES and self._head * 2 >= self._head + self._bytes:
+            self._compact()
+        self._write_head()
+
+    def _write_head(self):
+        tmp_path = self.head_path.with_suffix('.head.tmp')
+        tmp_path.write_text(str(self._head))
+        os.replace(tmp_path, self.head_path)
+
+    def _compact(self):
+        """Rewrite the log without the consumed prefix."""
+        tmp_path = self.log_path.with_suffix('.wal.tmp')
+        self._file.seek(self._head)
+        with open(tmp_path, 'wb') as tmp_file:
+            while True:
+                chunk = self._file.read(1024 * 1024)
+                if not chunk:
+                    break
+                tmp_file.write(chunk)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        shift = self._head
+        self._file.close()
+        os.replace(tmp_path, self.log_path)
+        self._file = open(self.log_path, 'a+b')
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._index = deque((offset - shift, size) for offset, size in self._index)
+        self._head = 0
+        logger.debug(f"Compacted spool for {self.node_id}, {self._bytes} bytes pending")
+
+    def drain(self, publish: Callable[[str, bytes, int], bool],
+              stop_event: Optional[threading.Event] = None) -> int:
+        """Publish pending records oldest first at the configured drain rate.
+
+        Stops at the first failed publish, leaving that record pending.
+
+        Args:
+            publish: Callable(topic, payload, qos) returning True on success
+            stop_event: Optional event that stops draining when set
+
+        Returns:
+            int: Number of records delivered
+        """
+        if not self._drain_lock.acquire(blocking=False):
+            # Another thread is already draining this spool
+            return 0
+        delivered = 0
+        interval = 1.0 / self.drain_rate if self.drain_rate > 0 else 0
+        next_send = time.monotonic()
+        try:
+            while not (stop_event and stop_event.is_set()):
+                with self._lock:
+                    if not self._index:
+                        break
+                    entry = self._index[0]
+                    record = self._read(*entry)
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    if stop_event:
+                        if stop_event.wait(delay):
+                            break
+                    else:
+                        time.sleep(delay)
+                try:
+                    if not publish(*record):
+                        break
+                except Exception as e:
+                    logger.debug(f"Spool drain for {self.node_id} stopped: {str(e)}")
+                    break
+                with self._lock:
+                    # The record may have been dropped by an append meanwhile
+                    if self._index and self._index[0] == entry:
+                        self._advance(1)
+                delivered += 1
+                next_send += interval
+        finally:
+            self._drain_lock.release()
+        if delivered:
+            logger.debug(f"Drained {delivered} spooled message(s) for {self.node_id}, {len(self)} left")
+        return delivered
+
+    def close(self):
+        """Close the log, removing its files if nothing is pending."""
+        with self._lock:
+            if not self._index:
+                # Unlink while still holding the lock so no other process sees a half-removed spool
+                for path in (self.log_path, self.head_path):
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        pass
+            self._file.close()
+
+
+class LazySpool:
+    """PublishSpool stand-in that opens the log on first use.
+
+    Until a publish is spooled, or pending records are found on disk, no
+    file is opened or created.
+    """
+
+    def __init__(self, spool_dir, node_id: str, **settings):
+        self.spool_dir = Path(spool_dir)
+        self.node_id = node_id
+        self.settings = settings
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', node_id)
+        self.log_path = self.spool_dir / f"{safe_name}.wal"
+        self._spool: Optional[PublishSpool] = None
+        self._busy = False
+        self._lock = threading.Lock()
+
+    def _open(self, create: bool) -> Optional[PublishSpool]:
+        with self._lock:
+            if self._spool is None and not self._busy:
+                try:
+                    if create or self.log_path.stat().st_size:
+                        self._spool = PublishSpool(self.spool_dir, self.node_id, **self.settings)
+                except FileNotFoundError:
+                    pass
+                except SpoolBusyError as e:
+                    # e.g. the connection agent owns this node's spool
+                    logger.warning(str(e))
+                    self._busy = True
+            return self._spool
+
+    def __len__(self):
+        spool = self._open(create=False)
+        return len(spool) if spool is not None else 0
+
+    @property
+    def size_bytes(self) -> int:
+        spool = self._open(create=False)
+        return spool.size_bytes if spool is not None else 0
+
+    @property
+    def dropped(self) -> int:
+        return self._spool.dropped if self._spool is not None else 0
+
+    def append(self, topic: str, payload, qos: int) -> bool:
+        spool = self._open(create=True)
+        return spool.append(topic, payload, qos) if spool is not None else False
+
+    def drain(self, publish: Callable[[str, bytes, int], bool],
+              stop_event: Optional[threading.Event] = None) -> int:
+        spool = self._open(create=False)
+        return spool.drain(publish, stop_event) if spool is not None else 0
+
+    def close(self):
+        with self._lock:
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+
+
+def get_node_spool(config_manager, node_id: str) -> Optional[LazySpool]:
+    """Get the spool for a node using the configured settings.
+
+    The spool's files are only opened once it is needed (see LazySpool).
+
+    Returns:
+        LazySpool, or None if spooling is disabled
+    """
+    if config_manager is None:
+        return None
+    settings = config_manager.get_spool_settings()
+    if not settings['enabled']:
+        return None
+    return LazySpool(Path(config_manager.config_dir) / SPOOL_DIR_NAME, node_id,
+                     max_messages=settings['max_messages'], max_bytes=settings['max_bytes'],
+                     drop_policy=settings['drop_policy'], drain_rate=settings['drain_rate'])
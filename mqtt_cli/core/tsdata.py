@@ -0,0 +1,340 @@
+"""
+Streaming time series helpers for MQTT CLI.
+
+`tsdata ingest` reads CSV or NDJSON rows one at a time and turns them into
+standard (2021-09-13) tsdata messages. Rows are buffered per node; one
+message carries a ts_data entry for every parameter of the node that has
+pending records, and a node's buffer is flushed as one message as soon as
+adding a record would take it over the AWS IoT payload limit. Total
+buffered bytes are capped too, so memory use does not grow with the size
+of the file.
+
+Records are JSON-encoded once when they are added and messages are
+assembled from the encoded pieces, so the size of every message is known
+exactly without serialising it twice.
+"""
+import csv
+import json
+import math
+import random
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+TS_DATA_VERSION = "2021-09-13"
+# AWS IoT rejects MQTT payloads larger than 128 KB
+MAX_PAYLOAD_BYTES = 128 * 1024
+# Encoded records held across all buffers before the largest is flushed
+DEFAULT_MAX_BUFFERED_BYTES = 8 * 1024 * 1024
+
+DATA_TYPES = ('string', 'int', 'float', 'bool', 'object', 'array')
+INPUT_FORMATS = ('csv', 'ndjson')
+VALUE_PATTERNS = ('sine', 'random', 'walk', 'constant')
+
+# Accepted column/key names for each record field
+NODE_FIELDS = ('node_id', 'node')
+NAME_FIELDS = ('param', 'name', 'param_name')
+VALUE_FIELDS = ('value', 'v')
+TIME_FIELDS = ('t', 'timestamp', 'time')
+TYPE_FIELDS = ('dt', 'data_type')
+
+
+class TSRecord(NamedTuple):
+    """One time series point for a node parameter."""
+    node_id: str
+    name: str
+    data_type: str
+    value: object
+    t: int
+
+
+class TSMessage(NamedTuple):
+    """A ready-to-publish standard tsdata message."""
+    node_id: str
+    payload: str
+    records: int
+
+
+def convert_value(value, data_type: str):
+    """Convert a raw value to the given tsdata type.
+
+    Strings are parsed (JSON for object/array); values that already have
+    a JSON type, e.g. from NDJSON input, are checked and passed through.
+
+    Raises:
+        ValueError: If the value does not match the type
+    """
+    if data_type == 'bool':
+        return value.lower() in ('true', '1', 'yes', 'on') if isinstance(value, str) else bool(value)
+    if data_type == 'int':
+        return int(value)
+    if data_type == 'float':
+        return float(value)
+    if data_type in ('object', 'array'):
+        if isinstance(value, str):
+            value = json.loads(value)
+        expected = dict if data_type == 'object' else list
+        if not isinstance(value, expected):
+            raise ValueError(f"Value must be a valid JSON {data_type}")
+        return value
+    if data_type == 'string':
+        return value if isinstance(value, str) else json.dumps(value)
+    raise ValueError(f"Unknown data type '{data_type}'")
+
+
+def parse_param_spec(spec: str, data_type: str = 'string') -> Tuple[str, object, str]:
+    """Parse "name:value[:type]" into (name, converted value, type).
+
+    The value may itself contain colons; a trailing known type name is
+    taken as the type.
+
+    Raises:
+        ValueError: On a missing value or a value that does not match its type
+    """
+    parts = spec.split(':')
+    if len(parts) < 2 or not parts[0]:
+        raise ValueError(f"Invalid parameter '{spec}'. Use 'name:value' or 'name:value:type'")
+    name, rest = parts[0], parts[1:]
+    if len(rest) > 1 and rest[-1] in DATA_TYPES:
+        data_type = rest.pop()
+    value = ':'.join(rest)
+    try:
+        return name, convert_value(value, data_type), data_type
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid value '{value}' for parameter '{name}' of type {data_type}: {str(e)}")
+
+
+def parse_timestamp(value) -> int:
+    """Epoch seconds from a number or an ISO 8601 string."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    value = value.strip()
+    try:
+        return int(float(value))
+    except ValueError:
+        return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+
+
+def make_value_generator(pattern: str, low: float, high: float, period: float = 60.0,
+                         rng: Optional[random.Random] = None) -> Callable[[float], float]:
+    """Synthetic signal between low and high, as a function of elapsed seconds.
+
+    Patterns: sine (one cycle per `period`, random phase), random (uniform),
+    walk (bounded random walk) and constant (always low).
+    """
+    rng = rng or random.Random()
+    span = high - low
+    if pattern == 'sine':
+        phase = rng.uniform(0, 2 * math.pi)
+        return lambda elapsed: low + span * (0.5 + 0.5 * math.sin(2 * math.pi * elapsed / period + phase))
+    if pattern == 'random':
+        return lambda elapsed: rng.uniform(low, high)
+    if pattern == 'walk':
+        state = [rng.uniform(low, high)]
+        step = span / 50
+
+        def walk(elapsed):
+            state[0] = min(high, max(low, state[0] + rng.gauss(0, step)))
+            return state[0]
+        return walk
+    if pattern == 'constant':
+        return lambda elapsed: low
+    raise ValueError(f"Unknown value pattern '{pattern}', expected one of: {', '.join(VALUE_PATTERNS)}")
+
+
+def tsdata_topic(node_id: str, basic_ingest: bool = False) -> str:
+    prefix = "$aws/rules/esp_ts_ingest/node/" if basic_ingest else "node/"
+    return f"{prefix}{node_id}/tsdata"
+
+
+def _field(row: dict, names: Tuple[str, ...]):
+    for name in names:
+        value = row.get(name)
+        if value is not None and value != '':
+            return value
+    return None
+
+
+def read_rows(file, input_format: str) -> Iterator[Tuple[int, object]]:
+    """Yield (line number, row) from an open CSV or NDJSON file.
+
+    CSV rows are dicts; NDJSON rows are the undecoded lines, which
+    row_to_record decodes so a bad line is reported like any other bad row.
+    """
+    if input_format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(file, 1):
+        if line.strip():
+            yield line_number, line
+
+
+def row_to_record(row, node_id: Optional[str] = None, name: Optional[str] = None,
+                  data_type: str = 'string', now: Optional[int] = None) -> TSRecord:
+    """Build a record from a row dict or NDJSON line, filling gaps from the defaults.
+
+    Raises:
+        ValueError: If a field is missing or a value does not match its type
+    """
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON ({e.msg})")
+        if not isinstance(row, dict):
+            raise ValueError("expected a JSON object")
+    row_node = _field(row, NODE_FIELDS) or node_id
+    row_name = _field(row, NAME_FIELDS) or name
+    if not row_node:
+        raise ValueError("no node ID (add a node_id column or use --node-id)")
+    if not row_name:
+        raise ValueError("no parameter name (add a param column or use --param-name)")
+    raw = _field(row, VALUE_FIELDS)
+    if raw is None:
+        raise ValueError("no value")
+    row_type = _field(row, TYPE_FIELDS) or data_type
+    if row_type not in DATA_TYPES:
+        raise ValueError(f"unknown data type '{row_type}'")
+    raw_t = _field(row, TIME_FIELDS)
+    t = parse_timestamp(raw_t) if raw_t is not None else (now if now is not None else int(time.time()))
+    try:
+        value = convert_value(raw, row_type)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid value for type {row_type}: {str(e)}")
+    return TSRecord(str(row_node), str(row_name), row_type, value, t)
+
+
+_encode_json = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def _encode_value(value) -> str:
+    # Scalars are formatted directly; json.dumps per point dominates ingest time
+    kind = type(value)
+    if kind is bool:
+        return 'true' if value else 'false'
+    if kind is int or (kind is float and math.isfinite(value)):
+        return repr(value)
+    return _encode_json(value)
+
+
+def encode_record(record: TSRecord) -> str:
+    return f'{{"v":{{"value":{_encode_value(record.value)}}},"t":{record.t}}}'
+
+
+def _entry_prefix(name: str, data_type: str) -> str:
+    """A ts_data entry up to its first record; the entry closes with ']}'."""
+    header = json.dumps({"name": name, "dt": data_type, "ow": False}, separators=(',', ':'))
+    return f'{header[:-1]},"records":['
+
+
+_MESSAGE_PREFIX = f'{{"ts_data_version":"{TS_DATA_VERSION}","ts_data":['
+# Message and entry closers: ']}' each
+_EMPTY_MESSAGE_SIZE = len(_MESSAGE_PREFIX) + 2
+
+
+class _NodeBuffer:
+    """Encoded records waiting for one node, one ts_data entry per parameter."""
+    __slots__ = ('node_id', 'entries', 'size', 'records')
+
+    def __init__(self, node_id: str):
+        self.node_id = node_id
+        # (name, data_type) -> (entry prefix, encoded records), in first-seen order
+        self.entries: Dict[Tuple[str, str], Tuple[str, List[str]]] = {}
+        self.size = _EMPTY_MESSAGE_SIZE
+        self.records = 0
+
+    def added_size(self, key: Tuple[str, str], prefix: str, encoded: str) -> int:
+        """Bytes the message grows by when the record is added."""
+        if key in self.entries:
+            return len(encoded) + 1
+        return len(prefix) + len(encoded) + 2 + (1 if self.entries else 0)
+
+    def append(self, key: Tuple[str, str], prefix: str, encoded: str, added: int):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = (prefix, [])
+        entry[1].append(encoded)
+        self.size += added
+        self.records += 1
+
+    def take(self) -> TSMessage:
+        body = ','.join(prefix + ','.join(records) + ']}' for prefix, records in self.entries.values())
+        message = TSMessage(self.node_id, _MESSAGE_PREFIX + body + ']}', self.records)
+        self.entries = {}
+        self.size = _EMPTY_MESSAGE_SIZE
+        self.records = 0
+        return message
+
+
+class RecordChunker:
+    """Packs records into as few messages per node as the size limit allows.
+
+    Records for all parameters of a node share a message, one ts_data entry
+    per parameter and data type, so a node reporting many parameters costs
+    one publish per batch instead of one per parameter. add() returns the
+    messages that became ready; flush() returns the rest.
+    """
+
+    def __init__(self, max_payload_bytes: int = MAX_PAYLOAD_BYTES,
+                 max_buffered_bytes: int = DEFAULT_MAX_BUFFERED_BYTES):
+        self.max_payload_bytes = max_payload_bytes
+        self.max_buffered_bytes = max_buffered_bytes
+        self._buffers: Dict[str, _NodeBuffer] = {}
+        self._prefixes: Dict[Tuple[str, str], str] = {}
+        self._buffered = 0
+
+    def add(self, record: TSRecord) -> List[TSMessage]:
+        """Buffer a record.
+
+        Raises:
+            ValueError: If the record alone does not fit in a message
+        """
+        ready = []
+        buffer = self._buffers.get(record.node_id)
+        if buffer is None:
+            buffer = self._buffers[record.node_id] = _NodeBuffer(record.node_id)
+        key = (record.name, record.data_type)
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            prefix = self._prefixes[key] = _entry_prefix(*key)
+        encoded = encode_record(record)
+        added = buffer.added_size(key, prefix, encoded)
+        if buffer.size + added > self.max_payload_bytes:
+            if not buffer.records:
+                raise ValueError(f"record for {record.node_id}/{record.name} is larger than "
+                                 f"{self.max_payload_bytes} bytes")
+            ready.append(self._take(buffer))
+            added = buffer.added_size(key, prefix, encoded)
+        buffer.append(key, prefix, encoded, added)
+        self._buffered += added
+        if self._buffered > self.max_buffered_bytes:
+            # Keep memory bounded with many nodes
+            ready.append(self._take(max(self._buffers.values(), key=lambda b: b.size)))
+        return ready
+
+    def _take(self, buffer: _NodeBuffer) -> TSMessage:
+        self._buffered -= buffer.size - _EMPTY_MESSAGE_SIZE
+        return buffer.take()
+
+    def flush(self) -> List[TSMessage]:
+        """Return messages for everything still buffered."""
+        ready = [self._take(buffer) for buffer in self._buffers.values() if buffer.records]
+        self._buffers.clear()
+        self._buffered = 0
+        return ready
+
+
+def pack_records(records: Iterable[TSRecord], max_payload_bytes: int = MAX_PAYLOAD_BYTES) -> List[TSMessage]:
+    """Pack records into as few standard tsdata messages per node as possible."""
+    chunker = RecordChunker(max_payload_bytes=max_payload_bytes)
+    messages = []
+    for record in records:
+        messages.extend(chunker.add(record))
+    messages.extend(chunker.flush())
+    return messages
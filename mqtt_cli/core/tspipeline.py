@@ -0,0 +1,201 @@
+"""
+Time series reduction stages for MQTT CLI.
+
+High-rate sensors produce far more points than are worth storing. The
+stages here sit between a record source (file ingest, simulators) and the
+tsdata packer and thin the stream out per node parameter:
+
+- WindowAggregator folds points into tumbling windows of N seconds and
+  emits min, max, avg and/or last per window.
+- DeadbandFilter drops points within +/- delta of the last value sent,
+  optionally still sending one point every max_interval seconds.
+
+Every stage has process(record) -> list of records and flush() -> list of
+records; RecordPipeline chains them and counts what went in and out.
+State is kept per node parameter only, so memory does not grow with the
+number of points.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .tsdata import TSRecord
+
+AGGREGATE_FUNCTIONS = ('min', 'max', 'avg', 'last')
+NUMERIC_TYPES = ('int', 'float')
+
+
+def parse_aggregate_functions(spec: str) -> List[str]:
+    """Parse "avg" or "min,max" into a list of functions.
+
+    Raises:
+        ValueError: On an unknown function
+    """
+    functions = [part.strip() for part in spec.split(',') if part.strip()]
+    for function in functions:
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"Unknown aggregate '{function}', expected one of: {', '.join(AGGREGATE_FUNCTIONS)}")
+    if not functions:
+        raise ValueError("No aggregate function given")
+    return list(dict.fromkeys(functions))
+
+
+class _Window:
+    __slots__ = ('start', 'count', 'total', 'low', 'high', 'last', 'record')
+
+    def __init__(self, start: int, record: TSRecord):
+        self.start = start
+        self.count = 0
+        self.total = 0
+        self.low = self.high = self.last = record.value
+        self.record = record
+
+    def add(self, record: TSRecord, numeric: bool):
+        self.count += 1
+        self.last = record.value
+        self.record = record
+        if numeric:
+            value = record.value
+            self.total += value
+            if value < self.low:
+                self.low = value
+            if value > self.high:
+                self.high = value
+
+
+class WindowAggregator:
+    """Folds points into tumbling windows aligned to multiples of `window` seconds.
+
+    Each closed window yields one record per function, stamped with the
+    window start. With several functions the parameter name gets a
+    ".<function>" suffix. Non-numeric parameters only support "last"
+    semantics and always report the last value. Points older than a
+    parameter's open window are passed through unchanged.
+    """
+
+    def __init__(self, window: int, functions: Sequence[str] = ('avg',)):
+        if window <= 0:
+            raise ValueError("Aggregation window must be positive")
+        self.window = window
+        self.functions = list(functions)
+        self._windows: Dict[Tuple[str, str, str], _Window] = {}
+
+    def process(self, record: TSRecord) -> List[TSRecord]:
+        key = (record.node_id, record.name, record.data_type)
+        start = record.t - record.t % self.window
+        current = self._windows.get(key)
+        if current is not None and start < current.start:
+            return [record]
+        ready = []
+        if current is None or start > current.start:
+            if current is not None:
+                ready = self._emit(current)
+            current = self._windows[key] = _Window(start, record)
+        current.add(record, record.data_type in NUMERIC_TYPES)
+        return ready
+
+    def _emit(self, window: _Window) -> List[TSRecord]:
+        record = window.record
+        numeric = record.data_type in NUMERIC_TYPES
+        out = []
+        for function in self.functions:
+            name = record.name if len(self.functions) == 1 else f"{record.name}.{function}"
+            data_type = record.data_type
+            if not numeric or function == 'last':
+                value = window.last
+            elif function == 'min':
+                value = window.low
+            elif function == 'max':
+                value = window.high
+            else:
+                value = window.total / window.count
+                data_type = 'float'
+            out.append(TSRecord(record.node_id, name, data_type, value, window.start))
+        return out
+
+    def flush(self) -> List[TSRecord]:
+        """Close every open window."""
+        ready = []
+        for window in self._windows.values():
+            ready.extend(self._emit(window))
+        self._windows.clear()
+        return ready
+
+
+class DeadbandFilter:
+    """Suppresses points that differ from the last sent value by at most delta.
+
+    Non-numeric values are suppressed only when equal to the last sent
+    value. With max_interval, a point is sent anyway once that many
+    seconds have passed since the last one sent, so quiet parameters still
+    report.
+    """
+
+    def __init__(self, delta: float, max_interval: Optional[int] = None):
+        if delta < 0:
+            raise ValueError("Dead-band must not be negative")
+        self.delta = delta
+        self.max_interval = max_interval
+        # (node, name, type) -> (last sent value, its timestamp)
+        self._last: Dict[Tuple[str, str, str], Tuple[object, int]] = {}
+
+    def process(self, record: TSRecord) -> List[TSRecord]:
+        key = (record.node_id, record.name, record.data_type)
+        last = self._last.get(key)
+        if last is not None:
+            value, t = last
+            if self.max_interval is None or record.t - t < self.max_interval:
+                if record.data_type in NUMERIC_TYPES:
+                    if abs(record.value - value) <= self.delta:
+                        return []
+                elif record.value == value:
+                    return []
+        self._last[key] = (record.value, record.t)
+        return [record]
+
+    def flush(self) -> List[TSRecord]:
+        return []
+
+
+class RecordPipeline:
+    """Runs records through stages in order and counts points in and out."""
+
+    def __init__(self, stages: Sequence = ()):
+        self.stages = list(stages)
+        self.records_in = 0
+        self.records_out = 0
+
+    def process(self, record: TSRecord) -> List[TSRecord]:
+        self.records_in += 1
+        records = [record]
+        for stage in self.stages:
+            records = [out for pending in records for out in stage.process(pending)]
+            if not records:
+                return records
+        self.records_out += len(records)
+        return records
+
+    def flush(self) -> List[TSRecord]:
+        """Drain every stage, passing each stage's leftovers through the later ones."""
+        records = []
+        for stage in self.stages:
+            records = [out for pending in records for out in stage.process(pending)] + stage.flush()
+        self.records_out += len(records)
+        return records
+
+
+def build_pipeline(aggregate: Optional[str] = None, window: Optional[int] = None,
+                   deadband: Optional[float] = None, max_interval: Optional[int] = None) -> RecordPipeline:
+    """Pipeline from command-line style options: aggregation first, then the dead-band.
+
+    Raises:
+        ValueError: On invalid options
+    """
+    stages = []
+    if aggregate or window:
+        if not window:
+            raise ValueError("Aggregation needs a window in seconds")
+        stages.append(WindowAggregator(window, parse_aggregate_functions(aggregate or 'avg')))
+    if deadband is not None:
+        stages.append(DeadbandFilter(deadband, max_interval))
+    elif max_interval is not None:
+        raise ValueError("A maximum interval only applies together with a dead-band")
+    return RecordPipeline(stages)
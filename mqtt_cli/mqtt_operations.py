@@ -1,23 +1,39 @@
 """
 MQTT operations for ESP RainMaker.
 """
-import paho.mqtt.client as mqtt
-import ssl
 import json
 import time
 import logging
 import os
+import threading
+from concurrent.futures import Future, wait
 from pathlib import Path
-import AWSIoTPythonSDK
-from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTClient
 from typing import Optional, Dict, Any, Callable
 import click
 import sys
 from .utils.exceptions import MQTTOperationsException
+from .utils.stats import ClientStats, register_client_stats, unregister_client_stats
+from .core.dispatcher import MessageDispatcher
+from .core.history import MessageHistory
 
 PORT = 443
 OPERATION_TIMEOUT = 30
 CONNECT_DISCONNECT_TIMEOUT = 20
+# MQTT keepalive: a dead connection is detected within about twice this
+KEEPALIVE_INTERVAL = 30
+# In-memory offline queue size used when no disk spool is attached
+OFFLINE_QUEUE_SIZE = 1000
+# QoS1 publishes awaiting PUBACK per connection on the publish_async path
+DEFAULT_INFLIGHT_WINDOW = 64
+
+
+def _queued_mid():
+    """Message ID the SDK returns for publishes queued while offline."""
+    try:
+        from AWSIoTPythonSDK.core.protocol.internal.events import FixedEventMids
+        return FixedEventMids.QUEUED_MID
+    except (ImportError, AttributeError):
+        return 'QUEUED'
 
 
 class MQTTOperationsException(Exception):
@@ -25,7 +41,8 @@ class MQTTOperationsException(Exception):
 
 class MQTTOperations:
     """MQTT client operations."""
-    def __init__(self, broker, node_id, cert_path, key_path, root_path=None):
+    def __init__(self, broker, node_id, cert_path, key_path, root_path=None, spool=None,
+                 inflight_window=DEFAULT_INFLIGHT_WINDOW, history=None):
         self.broker = broker
         self.node_id = node_id
         self.cert_path = cert_path
@@ -39,13 +56,31 @@ class MQTTOperations:
                 raise MQTTOperationsException(f"Root CA certificate not found at {root_path}")
         
         self.root_path = str(root_path)
+        # Optional core.spool.PublishSpool for publishes made while offline
+        self.spool = spool
+        # publish_async: a slot is held from send until PUBACK (or timeout)
+        self.inflight_window = inflight_window
+        self._inflight_slots = threading.BoundedSemaphore(inflight_window)
+        self._inflight = {}  # Future -> PUBACK deadline
+        self._inflight_lock = threading.Lock()
+        # Latency histograms and counters, reported by `rmnode stats`
+        self.stats = ClientStats(node_id)
+        register_client_stats(self.stats, owner=self)
+        self._ever_online = False
+        # Imported here so commands that never connect don't pay for the SDK
+        from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTClient
         self.mqtt_client = AWSIoTMQTTClient(node_id)
-        self.subscription_messages = {}
-        self.old_msgs = {}
+        # Recent received messages, bounded per topic and in total (core.history)
+        self.history = history if history is not None else MessageHistory()
+        self._last_message = None
+        # Message handlers by topic filter, sharing broker subscriptions where they overlap
+        self.dispatcher = MessageDispatcher()
         self.logger = logging.getLogger("mqtt_cli")
+        # Liveness is driven by SDK callbacks and keepalive traffic, never by publishing
         self.connected = False
-        self.last_ping = 0
-        self.ping_interval = 30  # Check connection every 30 seconds
+        self.connected_since = None  # Wall-clock time of the last CONNACK
+        self.last_rx = None  # Wall-clock time any packet, incl. PINGRESP, was last received
+        self._pingreq_sent = None
 
         # Disable all AWS IoT SDK logging
         for logger_name in ['AWSIoTPythonSDK', 
@@ -70,39 +105,65 @@ class MQTTOperations:
         self.mqtt_client.configureConnectDisconnectTimeout(CONNECT_DISCONNECT_TIMEOUT)
         self.mqtt_client.configureMQTTOperationTimeout(OPERATION_TIMEOUT)
         self.mqtt_client.configureAutoReconnectBackoffTime(1, 32, 20)
-        self.mqtt_client.configureOfflinePublishQueueing(-1)  # Infinite publish queueing
+        if self.spool is not None:
+            # Offline publishes go to the disk spool; the SDK raises instead of queueing
+            self.mqtt_client.configureOfflinePublishQueueing(0)
+        else:
+            from AWSIoTPythonSDK.MQTTLib import DROP_OLDEST
+            self.mqtt_client.configureOfflinePublishQueueing(OFFLINE_QUEUE_SIZE, DROP_OLDEST)
         self.mqtt_client.configureDrainingFrequency(2)  # Draining: 2 Hz
+        self.mqtt_client.onOnline = self._on_online
+        self.mqtt_client.onOffline = self._on_offline
         self.mqtt_client.configureConnectDisconnectTimeout(10)  # 10 sec
         self.mqtt_client.configureMQTTOperationTimeout(30)  # 30 sec instead of 5 sec
+        # The paho log hook is the only place inbound packets (incl. PINGRESP) are visible.
+        # It is SDK-internal: without it there are no keepalive stats or last_rx
+        try:
+            self.mqtt_client._mqtt_core._internal_async_client._paho_client.on_log = self._on_paho_log
+        except AttributeError:
+            self.logger.debug("SDK internals changed, keepalive tracking disabled")
 
-    def _check_connection(self):
-        """Check connection status by attempting to publish to a test topic."""
+    def _on_paho_log(self, client, userdata, level, buf):
+        """Track received packets and keepalive round trips from paho's packet log."""
+        if buf.startswith('Received '):
+            self.last_rx = time.time()
+            if buf.startswith('Received PINGRESP') and self._pingreq_sent is not None:
+                self.stats.keepalive.record(time.perf_counter() - self._pingreq_sent)
+                self._pingreq_sent = None
+        elif buf.startswith('Sending PINGREQ'):
+            self._pingreq_sent = time.perf_counter()
+
+    def _sdk_status(self):
+        """The SDK's internal client status, or None if this SDK version does not expose it."""
         try:
-            # Only check every ping_interval seconds
-            current_time = time.time()
-            if current_time - self.last_ping < self.ping_interval:
-                return self.connected
-                
-            # Try to publish to a test topic
-            test_topic = f"$aws/things/{self.node_id}/ping"
-            result = self.mqtt_client.publish(test_topic, "", 0)
-            
-            self.connected = bool(result)
-            self.last_ping = current_time
-            return self.connected
-            
-        except Exception as e:
-            self.connected = False
+            from AWSIoTPythonSDK.core.protocol.internal.clients import ClientStatus
+            return ClientStatus, self.mqtt_client._mqtt_core._client_status.get_status()
+        except (ImportError, AttributeError):
+            return None
+
+    def is_reconnecting(self):
+        """Check if the SDK is restoring a dropped connection on its own."""
+        sdk_status = self._sdk_status()
+        if sdk_status is None:
             return False
+        status, current = sdk_status
+        return current in (status.ABNORMAL_DISCONNECT, status.CONNECT, status.RESUBSCRIBE,
+                           status.DRAINING) and self._ever_online
+
+    def _ensure_connected(self):
+        """Connect unless connected or the SDK is already reconnecting."""
+        if not self.connected and not self.is_reconnecting():
+            self.connect()
 
     def connect(self):
         """Connect to MQTT broker with status tracking"""
         try:
             if not self.connected:
-                result = self.mqtt_client.connect()
+                start = time.perf_counter()
+                result = self.mqtt_client.connect(KEEPALIVE_INTERVAL)
                 if result:
+                    self.stats.connect.record(time.perf_counter() - start)
                     self.connected = True
-                    self.last_ping = time.time()
                 return result
             return True
         except Exception as e:
@@ -114,105 +175,355 @@ class MQTTOperations:
             result = self.mqtt_client.disconnect()
             if result:
                 self.connected = False
+                self.connected_since = None
             return result
         except Exception as e:
             raise MQTTOperationsException(f"Failed to disconnect: {str(e)}")
 
+    def close(self):
+        """Disconnect and release the spool; the client is not used afterwards."""
+        try:
+            if self.connected:
+                self.disconnect()
+        finally:
+            if self.spool is not None:
+                self.spool.close()
+            unregister_client_stats(self.stats)
+
     def is_connected(self):
-        """Check if currently connected"""
-        return self._check_connection()
+        """Check if currently connected, as last reported by the SDK."""
+        return self.connected
 
     def publish(self, topic, payload, qos=1):
-        """Publish message with retry logic and optional serialization"""
-        try:
-            if not self.is_connected():
-                self.connect()
+        """Publish message with retry logic and optional serialization.
+        
+        If a spool is attached and the broker is unreachable, the message is
+        written to the spool and delivered after reconnecting.
+        """
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
 
-            if isinstance(payload, (dict, list)):
-                payload = json.dumps(payload)
+        # Use QoS 0 for status updates to avoid waiting for acknowledgment
+        if 'otastatus' in topic:
+            qos = 0
 
-            # Use QoS 0 for status updates to avoid waiting for acknowledgment
-            if 'otastatus' in topic:
-                qos = 0
+        try:
+            self._ensure_connected()
 
+            start = time.perf_counter()
             result = self.mqtt_client.publish(topic, payload, qos)
             if result:
+                # For QoS1 this is the time to PUBACK
+                self.stats.record_publish(topic, time.perf_counter() - start)
                 # Only log at debug level
                 self.logger.debug(f"Published to {topic}: {payload}")
             return result
         except Exception as e:
+            if self.spool is not None and self._is_offline_error(e):
+                return self._spool_publish(topic, payload, qos)
+            self.stats.increment('publish_errors')
             self.logger.error(f"Publish failed: {str(e)}")
             raise MQTTOperationsException(f"Publish failed: {str(e)}")
 
-    def subscribe(self, topic, qos=1, callback=None):
-        """Subscribe to a topic"""
+    def publish_async(self, topic, payload, qos=1):
+        """Publish without waiting for the PUBACK.
+        
+        Up to inflight_window QoS1 publishes may await their PUBACK at once;
+        beyond that this call blocks until a slot frees up. The returned
+        future resolves to True on PUBACK (immediately for QoS0 and for
+        messages queued or spooled while offline), or fails with
+        MQTTOperationsException if the publish fails or no PUBACK arrives
+        within the operation timeout. Use flush() to wait for all of them.
+        
+        Returns:
+            concurrent.futures.Future
+        """
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
+        if 'otastatus' in topic:
+            qos = 0
+
+        future = Future()
+        if qos:
+            while not self._inflight_slots.acquire(timeout=1):
+                self._expire_inflight()
+            with self._inflight_lock:
+                self._inflight[future] = time.monotonic() + OPERATION_TIMEOUT
+
         try:
-            if not self.is_connected():
-                self.connect()
+            self._ensure_connected()
+            start = time.perf_counter()
+
+            def on_puback(mid):
+                self.stats.record_publish(topic, time.perf_counter() - start)
+                self._complete_inflight(future, True)
+
+            mid = self.mqtt_client.publishAsync(topic, payload, qos, ackCallback=on_puback)
+        except Exception as e:
+            if self.spool is not None and self._is_offline_error(e):
+                self._complete_inflight(future, self._spool_publish(topic, payload, qos))
+            else:
+                self.stats.increment('publish_errors')
+                self.logger.error(f"Publish failed: {str(e)}")
+                self._complete_inflight(future, error=MQTTOperationsException(f"Publish failed: {str(e)}"))
+            return future
+
+        if not qos or mid == _queued_mid():
+            # No PUBACK will be reported for these
+            self._complete_inflight(future, True)
+        return future
+
+    def _complete_inflight(self, future, result=None, error=None):
+        """Resolve a publish_async future and free its window slot."""
+        with self._inflight_lock:
+            held = self._inflight.pop(future, None) is not None
+        if held:
+            self._inflight_slots.release()
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _expire_inflight(self):
+        """Fail publishes whose PUBACK is overdue so their slots are reused."""
+        now = time.monotonic()
+        with self._inflight_lock:
+            expired = [future for future, deadline in self._inflight.items() if deadline <= now]
+        for future in expired:
+            self.stats.increment('publish_errors')
+            self._complete_inflight(future, error=MQTTOperationsException(
+                f"Publish timed out: no PUBACK within {OPERATION_TIMEOUT}s"))
+
+    def flush(self, timeout=None):
+        """Wait for every outstanding publish_async to complete.
+        
+        Returns:
+            bool: True if nothing is left in flight
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._inflight_lock:
+                pending = list(self._inflight)
+            if not pending:
+                return True
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return False
+            wait(pending, timeout=min(remaining, 1.0) if remaining is not None else 1.0)
+            self._expire_inflight()
+
+    def _is_offline_error(self, error):
+        """Check if a publish failed because the broker could not be reached.
+
+        Only the SDK refusing to queue while offline and a failed connect
+        count; a PUBACK timeout on a live connection may still be delivered
+        by the SDK, so spooling it would send the message twice.
+        """
+        from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishQueueDisabledException
+        # MQTTOperationsException is only raised by connect() inside the publish calls
+        return isinstance(error, (publishQueueDisabledException, MQTTOperationsException))
+
+    def _spool_publish(self, topic, payload, qos):
+        """Write a publish to the spool while offline."""
+        if self.spool.append(topic, payload, qos):
+            self.logger.info(f"Broker unreachable, spooled message for {topic} "
+                             f"({len(self.spool)} pending)")
+            return True
+        self.logger.warning(f"Spool full or in use, dropped message for {topic}")
+        return False
+
+    def _on_online(self):
+        """SDK callback on (re)connect: replay spooled publishes in the background."""
+        self.connected = True
+        self.connected_since = time.time()
+        if self._ever_online:
+            self.stats.increment('reconnects')
+        self._ever_online = True
+        if self.spool is not None and len(self.spool):
+            # Publishing from the SDK callback thread would block its own PUBACKs
+            threading.Thread(target=self.drain_spool, name=f"spool-drain-{self.node_id}",
+                             daemon=True).start()
+
+    def _on_offline(self):
+        """SDK callback when the connection drops."""
+        self.connected = False
+        self.connected_since = None
+        self.stats.increment('disconnects')
+
+    def drain_spool(self, stop_event=None):
+        """Publish spooled messages at the spool's drain rate.
+        
+        Returns:
+            int: Number of messages delivered
+        """
+        if self.spool is None:
+            return 0
+        return self.spool.drain(lambda topic, payload, qos: self.mqtt_client.publish(topic, payload, qos),
+                                stop_event)
+
+    def subscribe(self, topic, qos=1, callback=None):
+        """Subscribe to a topic.
+
+        The callback replaces any handlers registered for exactly this
+        topic, and the topic always gets a broker subscription of its own.
+        Use add_handler to add a handler next to others instead.
+        """
+        if callback is None:
+            callback = self._on_message
+        return self._add_handler(topic, callback, qos, replace=True, own=True)
+
+    def add_handler(self, topic_filter, handler, qos=1):
+        """Add a message handler for a topic filter.
+
+        Handlers for the same or overlapping filters share broker
+        subscriptions: if a subscription already covers the filter (e.g.
+        node/+/otaurl for node/abc/otaurl) nothing is subscribed, otherwise
+        the filter is subscribed at the broker.
+
+        Args:
+            topic_filter: MQTT topic filter, + and # allowed
+            handler: Called as handler(client, userdata, message)
+            qos: QoS for a new broker subscription
 
-            if callback is None:
-                callback = self._on_message
+        Returns:
+            bool: True if the handler is registered and subscribed
+        """
+        return self._add_handler(topic_filter, handler, qos)
 
+    def _add_handler(self, topic_filter, handler, qos, replace=False, own=False):
+        try:
+            self._ensure_connected()
             # Ensure QoS is an integer
             qos = int(qos)
-            
-            # Subscribe with proper parameter order for AWSIoTMQTTClient
-            result = self.mqtt_client.subscribe(topic, qos, callback)
-            if result:
-                # Only log at debug level
-                self.logger.debug(f"Subscribed to {topic}")
+            broker_filter = self.dispatcher.add(topic_filter, handler, qos, replace=replace, own=own)
+            if broker_filter is None:
+                self.logger.debug(f"Handler for {topic_filter} uses an existing subscription")
+                return True
+            result = self._broker_subscribe(broker_filter, qos)
+            if not result:
+                self.dispatcher.remove(topic_filter, handler)
             return result
         except Exception as e:
+            self.dispatcher.remove(topic_filter, handler)
             self.logger.error(f"Subscribe failed: {str(e)}")
             raise MQTTOperationsException(f"Subscribe failed: {str(e)}")
 
+    def _broker_subscribe(self, broker_filter, qos):
+        # Subscribe with proper parameter order for AWSIoTMQTTClient
+        start = time.perf_counter()
+        result = self.mqtt_client.subscribe(broker_filter, qos,
+                                            self._timed_callback(self._receiver(broker_filter)))
+        if result:
+            self.stats.subscribe.record(time.perf_counter() - start)
+            # Only log at debug level
+            self.logger.debug(f"Subscribed to {broker_filter}")
+        return result
+
+    def remove_handler(self, topic_filter, handler):
+        """Remove a handler added with add_handler.
+
+        The broker subscription is dropped once no handler needs it.
+        """
+        return self._remove_handler(topic_filter, handler)
+
+    def _receiver(self, broker_filter):
+        """SDK callback for a broker subscription: record the message, then dispatch it."""
+        dispatch = self.dispatcher.dispatch
+
+        def receive(client, userdata, message):
+            # The SDK hands the same message object to every matching
+            # subscription in turn, so overlapping ones record it once
+            if message is not self._last_message:
+                self._last_message = message
+                self.history.record(message.topic, message.payload)
+            dispatch(broker_filter, client, userdata, message)
+        return receive
+
+    def recent_messages(self, topic_filter='#', last=None, since=None):
+        """Received messages kept in the history, oldest first.
+
+        Args:
+            topic_filter: MQTT topic filter, + and # allowed
+            last: Only the most recent `last` matching messages
+            since: Only messages received at or after this Unix time
+
+        Returns:
+            list: core.history.HistoryEntry tuples (topic, timestamp, payload)
+        """
+        return self.history.query(topic_filter, last=last, since=since)
+
+    def _timed_callback(self, callback):
+        """Wrap a message callback to record its execution time."""
+        histogram = self.stats.callback
+
+        def timed(client, userdata, message):
+            start = time.perf_counter()
+            try:
+                callback(client, userdata, message)
+            finally:
+                histogram.record(time.perf_counter() - start)
+        return timed
+
     def unsubscribe(self, topic):
-        """Unsubscribe from a topic"""
+        """Remove every handler for a topic and unsubscribe if nothing else needs it"""
+        return self._remove_handler(topic)
+
+    def _remove_handler(self, topic_filter, handler=None):
+        broker_filter = self.dispatcher.remove(topic_filter, handler)
+        if broker_filter is None:
+            return True
         try:
-            result = self.mqtt_client.unsubscribe(topic)
+            result = self.mqtt_client.unsubscribe(broker_filter)
             if result:
                 # Only log at debug level
-                self.logger.debug(f"Unsubscribed from {topic}")
+                self.logger.debug(f"Unsubscribed from {broker_filter}")
             return result
         except Exception as e:
             raise MQTTOperationsException(f"Unsubscribe failed: {str(e)}")
 
     def _on_message(self, client, userdata, message):
-        """Default message callback"""
+        """Default message callback; the message itself is kept in self.history"""
         try:
             payload = json.loads(message.payload.decode())
-            self.subscription_messages[message.topic] = payload
             self.logger.info(json.dumps(payload, indent=2))
-            self.old_msgs.setdefault(message.topic, []).append(payload)
         except json.JSONDecodeError:
             self.logger.warning(f"Non-JSON message received: {message.payload.decode()}")
-            self.subscription_messages[message.topic] = message.payload.decode()
-            self.old_msgs.setdefault(message.topic, []).append(message.payload.decode())
 
     def reconnect(self) -> bool:
-        """Attempt to reconnect to MQTT broker."""
+        """Attempt to reconnect to MQTT broker and restore subscriptions."""
         try:
             self.disconnect()
             time.sleep(1)  # Brief delay before reconnecting
-            return self.connect()
-        except Exception:
-            return False
-
-    def ping(self) -> bool:
-        """Check if connection is alive and ping if needed."""
-        try:
-            current_time = time.time()
-            if current_time - self.last_ping >= self.ping_interval:
-                # Publish a ping message to a temporary topic
-                ping_topic = f"node/{self.node_id}/ping"
-                if self.mqtt_client.publish(ping_topic, json.dumps({"timestamp": current_time}), 0):
-                    self.last_ping = current_time
-                    return True
+            if not self.connect():
                 return False
+            for broker_filter, qos in self.dispatcher.subscriptions().items():
+                self._broker_subscribe(broker_filter, qos)
             return True
         except Exception:
             return False
 
+    def ping(self) -> bool:
+        """Check if the connection is alive or being restored by the SDK.
+        
+        Nothing is published: MQTT keepalive (PINGREQ/PINGRESP every
+        KEEPALIVE_INTERVAL seconds of idle time) detects dead connections and
+        the SDK reports them through its offline callback. Returns False only
+        when the connection is down and not reconnecting, i.e. when the
+        caller should reconnect.
+        """
+        return self.connected or self.is_reconnecting()
+
+    def liveness(self) -> dict:
+        """Connection state with connected_since and last_rx timestamps."""
+        return {
+            'connected': self.connected,
+            'reconnecting': not self.connected and self.is_reconnecting(),
+            'connected_since': self.connected_since,
+            'last_rx': self.last_rx,
+        }
+
 
 class PublishResult:
     def __init__(self, success=True):
@@ -1,11 +1,22 @@
 """
 Utility functions for MQTT CLI.
 """
-from .cert_finder import find_node_cert_key_pairs, get_cert_and_key_paths
-from .exceptions import MQTTError
+import importlib
 
 __all__ = [
     'find_node_cert_key_pairs',
     'get_cert_and_key_paths',
     'MQTTError'
-] 
\ No newline at end of file
+]
+
+# Exports are resolved on first access so importing one utility does not load the others
+_LAZY_EXPORTS = {
+    'find_node_cert_key_pairs': '.cert_finder',
+    'get_cert_and_key_paths': '.cert_finder',
+    'MQTTError': '.exceptions',
+}
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        return getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -137,8 +137,19 @@ def find_node_cert_key_pairs(base_path: str) -> List[Tuple[str, str, str]]:
     return node_pairs
 
 @debug_step("Getting certificate and key paths")
-def get_cert_and_key_paths(base_path: str, node_id: str) -> Tuple[str, str]:
-    """Find certificate and key paths for a node."""
+def get_cert_and_key_paths(base_path: str, node_id: str, index=None) -> Tuple[str, str]:
+    """Find certificate and key paths for a node.
+
+    If a CertIndex is given it is used instead of walking base_path.
+    """
+    if index is not None:
+        result = index.lookup(base_path, node_id)
+        if result:
+            logger.debug(f"Found certificates for node {node_id} in index")
+            return result[0], result[1]
+        logger.debug(f"No certificates found for node {node_id}")
+        raise FileNotFoundError(f"Certificate and key not found for node {node_id}")
+
     logger.debug(f"Searching for certificates for node {node_id} in {base_path}")
     node_pairs = find_node_cert_key_pairs(base_path)
     
@@ -188,15 +199,29 @@ def find_node_folders(base_path):
         if Path(root).name == "node_details":
             # Look for node-xxxxxx-node_id folders
             for dir_name in dirs:
-                if dir_name.startswith("node-") and "-" in dir_name[6:]:
-                    # Extract node_id (part after the 6th dash)
-                    node_id = dir_name.split("-", 6)[-1]
+                parsed = parse_node_folder_name(dir_name)
+                if parsed:
                     full_path = Path(root) / dir_name
-                    node_folders.append((node_id, full_path))
+                    node_folders.append((parsed[0], full_path))
+            # Node folders only hold certificate files, don't descend into them
+            dirs[:] = []
 
     return node_folders
 
 
+def parse_node_folder_name(dir_name):
+    """
+    Parse a node-xxxxxx-node_id folder name
+    Returns (node_id, mac) or None if the name does not match
+    """
+    if dir_name.startswith("node-") and "-" in dir_name[6:]:
+        # Extract node_id (part after the 6th dash)
+        node_id = dir_name.split("-", 6)[-1]
+        mac = dir_name.split("-")[1]
+        return node_id, mac
+    return None
+
+
 def find_crt_key_files(folder_path):
     """
     Find certificate and key files in the node folder
@@ -263,7 +288,8 @@ def find_node_cert_key_pairs_path(base_path):
 
     return node_pairs
 
-def get_cert_paths_from_direct_path(base_path: str, node_id: str, mac_address: Optional[str] = None) -> Tuple[str, str]:
+def get_cert_paths_from_direct_path(base_path: str, node_id: str, mac_address: Optional[str] = None,
+                                    index=None) -> Tuple[str, str]:
     """
     Find certificate and key paths for a node when using direct path.
     This is used when --cert-path is provided in CLI.
@@ -272,6 +298,7 @@ def get_cert_paths_from_direct_path(base_path: str, node_id: str, mac_address: O
         base_path: Base directory to search
         node_id: Node ID to find certificates for
         mac_address: Optional 12-digit alphanumeric MAC address
+        index: Optional CertIndex used instead of walking base_path
         
     Returns:
         tuple: (cert_path, key_path)
@@ -288,6 +315,12 @@ def get_cert_paths_from_direct_path(base_path: str, node_id: str, mac_address: O
             return result
     
     # If MAC search failed or wasn't requested, try the node_details structure
+    if index is not None:
+        result = index.lookup(base_path, node_id)
+        if result:
+            return result[0], result[1]
+        raise FileNotFoundError(f"Certificate files not found for node {node_id} in {base_path}")
+
     node_folders = find_node_folders(base_path)
     for folder_node_id, folder_path in node_folders:
         if folder_node_id == node_id:
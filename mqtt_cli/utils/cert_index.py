@@ -0,0 +1,221 @@
+"""
+Persistent certificate index for MQTT CLI.
+
+Maps node_id -> (cert_path, key_path, mac) for every node folder found in
+the node_details directories below a certificate root, so repeated lookups
+do not have to walk the whole admin-cli tree. Entries are invalidated by
+node_details directory mtimes and refreshed one directory at a time.
+"""
+import os
+import sqlite3
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .cert_finder import find_crt_key_files, parse_node_folder_name
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+CERT_INDEX_NAME = 'cert_index.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS roots (
+    root TEXT PRIMARY KEY,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (root, path)
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    root TEXT NOT NULL,
+    node_id TEXT NOT NULL,
+    dir TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    cert TEXT,
+    key TEXT,
+    mac TEXT,
+    PRIMARY KEY (root, node_id)
+);
+CREATE INDEX IF NOT EXISTS nodes_by_dir ON nodes (root, dir);
+"""
+
+
+class CertIndex:
+    """On-disk node_id -> certificate index stored under the config directory."""
+
+    def __init__(self, config_dir):
+        self.path = Path(config_dir) / CERT_INDEX_NAME
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def lookup(self, base_path, node_id: str) -> Optional[Tuple[str, str, Optional[str]]]:
+        """Find certificate and key paths for a node below base_path.
+
+        A hit costs one indexed query plus a stat of the two files. On a miss
+        the known node_details directories are refreshed, and if the node is
+        still unknown the tree is rescanned for new node_details directories.
+
+        Args:
+            base_path: Certificate root directory
+            node_id: Node ID to find certificates for
+
+        Returns:
+            tuple: (cert_path, key_path, mac) if found, None otherwise
+        """
+        root = str(Path(base_path).resolve())
+        with self._lock:
+            db = self._connect()
+            with db:
+                if not self._is_scanned(db, root):
+                    self._full_scan(db, root)
+                    return self._get(db, root, node_id)
+
+                result = self._get(db, root, node_id)
+                if result:
+                    return result
+
+                logger.debug(f"Certificate index miss for node {node_id}, refreshing {root}")
+                self._refresh(db, root)
+                result = self._get(db, root, node_id)
+                if result:
+                    return result
+
+                self._full_scan(db, root)
+                return self._get(db, root, node_id)
+
+    def rebuild(self, base_path) -> List[Tuple[str, str, str]]:
+        """Drop and rebuild the index for base_path.
+
+        Returns:
+            list: (node_id, cert_path, key_path) for every indexed node folder
+                with both files, in directory order
+        """
+        root = str(Path(base_path).resolve())
+        with self._lock:
+            db = self._connect()
+            with db:
+                for table in ('roots', 'dirs', 'nodes'):
+                    db.execute(f"DELETE FROM {table} WHERE root = ?", (root,))
+                self._full_scan(db, root)
+                return db.execute(
+                    "SELECT node_id, cert, key FROM nodes WHERE root = ? AND cert IS NOT NULL "
+                    "AND key IS NOT NULL ORDER BY dir, folder", (root,)).fetchall()
+
+    def _is_scanned(self, db, root: str) -> bool:
+        return db.execute("SELECT 1 FROM roots WHERE root = ?", (root,)).fetchone() is not None
+
+    def _get(self, db, root: str, node_id: str) -> Optional[Tuple[str, str, Optional[str]]]:
+        row = db.execute(
+            "SELECT dir, folder, cert, key, mac FROM nodes WHERE root = ? AND node_id = ?",
+            (root, str(node_id))).fetchone()
+        if not row:
+            return None
+        dir_path, folder, cert, key, mac = row
+        if cert and key and os.path.exists(cert) and os.path.exists(key):
+            return cert, key, mac
+
+        # Files were added, renamed or removed inside the node folder,
+        # which does not change the node_details mtime
+        folder_path = Path(dir_path) / folder
+        crt_path, key_path = find_crt_key_files(folder_path) if folder_path.is_dir() else (None, None)
+        if not (crt_path and key_path):
+            db.execute("UPDATE nodes SET cert = NULL, key = NULL WHERE root = ? AND node_id = ?",
+                       (root, str(node_id)))
+            return None
+        db.execute("UPDATE nodes SET cert = ?, key = ? WHERE root = ? AND node_id = ?",
+                   (str(crt_path), str(key_path), root, str(node_id)))
+        return str(crt_path), str(key_path), mac
+
+    def _full_scan(self, db, root: str):
+        """Walk root for node_details directories and index the changed ones."""
+        start = time.perf_counter()
+        found = set()
+        for current, dirs, files in os.walk(root):
+            if os.path.basename(current) == "node_details":
+                found.add(current)
+                # Node folders never contain further node_details directories
+                dirs[:] = []
+
+        known = dict(db.execute("SELECT path, mtime_ns FROM dirs WHERE root = ?", (root,)).fetchall())
+        for dir_path in set(known) - found:
+            self._drop_dir(db, root, dir_path)
+        for dir_path in sorted(found):
+            try:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                continue
+            if known.get(dir_path) != mtime_ns:
+                self._scan_dir(db, root, dir_path, mtime_ns)
+
+        db.execute("INSERT OR REPLACE INTO roots (root, scanned_at) VALUES (?, ?)", (root, time.time()))
+        logger.debug(f"Indexed {len(found)} node_details directories under {root} "
+                     f"in {time.perf_counter() - start:.3f}s")
+
+    def _refresh(self, db, root: str):
+        """Rescan known node_details directories whose mtime changed."""
+        for dir_path, stored_mtime in db.execute(
+                "SELECT path, mtime_ns FROM dirs WHERE root = ?", (root,)).fetchall():
+            try:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                self._drop_dir(db, root, dir_path)
+                continue
+            if mtime_ns != stored_mtime:
+                self._scan_dir(db, root, dir_path, mtime_ns)
+
+    def _scan_dir(self, db, root: str, dir_path: str, mtime_ns: int):
+        """Sync the index with the node folders of one node_details directory."""
+        current = {}
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    parsed = parse_node_folder_name(entry.name)
+                    if parsed and entry.is_dir():
+                        current[entry.name] = parsed
+        except OSError as e:
+            logger.debug(f"Failed to scan {dir_path}: {str(e)}")
+            return
+
+        indexed = {folder for (folder,) in db.execute(
+            "SELECT folder FROM nodes WHERE root = ? AND dir = ?", (root, dir_path))}
+        removed = indexed - set(current)
+        db.executemany("DELETE FROM nodes WHERE root = ? AND dir = ? AND folder = ?",
+                       [(root, dir_path, folder) for folder in removed])
+
+        rows = []
+        for folder in current.keys() - indexed:
+            node_id, mac = current[folder]
+            crt_path, key_path = find_crt_key_files(Path(dir_path) / folder)
+            rows.append((root, node_id, dir_path, folder,
+                         str(crt_path) if crt_path else None,
+                         str(key_path) if key_path else None, mac))
+        # Keep the first folder seen for a node_id, like the directory walk does
+        db.executemany("INSERT OR IGNORE INTO nodes (root, node_id, dir, folder, cert, key, mac) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        db.execute("INSERT OR REPLACE INTO dirs (root, path, mtime_ns) VALUES (?, ?, ?)",
+                   (root, dir_path, mtime_ns))
+        logger.debug(f"Indexed {dir_path}: {len(rows)} added, {len(removed)} removed")
+
+    def _drop_dir(self, db, root: str, dir_path: str):
+        db.execute("DELETE FROM nodes WHERE root = ? AND dir = ?", (root, dir_path))
+        db.execute("DELETE FROM dirs WHERE root = ? AND path = ?", (root, dir_path))
@@ -1,10 +1,16 @@
 """
 Configuration manager for MQTT CLI.
 """
+import copy
 import json
+import os
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Dict, Optional, Tuple
 
+from .node_store import NODE_DB_NAME, NODE_STORE_BACKENDS, JsonNodeStore, SqliteNodeStore
+
 class ConfigManager:
     """Manages MQTT CLI configuration including broker and node details."""
     
@@ -17,12 +23,26 @@ class ConfigManager:
         self.config = {
             'broker': self.DEFAULT_BROKER,
             'nodes': {},  # node_id -> {'cert_path': str, 'key_path': str}
-            'admin_cli_path': None
+            'admin_cli_path': None,
+            'node_store': 'json'
         }
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self._dirty = False
         self._load()
+        self.nodes = self._open_node_store(self.config.get('node_store', 'json'))
         
-        # Ensure all configured nodes have valid certificate paths
-        self._validate_node_paths()
+        # Ensure all configured nodes have valid certificate paths. The SQLite
+        # store is validated lazily in get_node_paths instead, since checking
+        # every node on startup does not scale.
+        if self.nodes.name == 'json':
+            self._validate_node_paths()
+
+    def _open_node_store(self, backend: str):
+        """Open the node storage backend."""
+        if backend == 'sqlite':
+            return SqliteNodeStore(self.config_dir / NODE_DB_NAME)
+        return JsonNodeStore(self.config, self._save)
 
     def _load(self):
         """Load configuration from file."""
@@ -33,9 +53,58 @@ class ConfigManager:
                 pass
 
     def _save(self):
-        """Save configuration to file."""
-        self.config_dir.mkdir(parents=True, exist_ok=True)
-        self.config_file.write_text(json.dumps(self.config, indent=2))
+        """Save configuration to file, or defer it until the current batch commits."""
+        with self._lock:
+            if self._batch_depth:
+                self._dirty = True
+                return
+            self.config_dir.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file and rename so a crash never leaves a truncated config
+            tmp_file = self.config_file.with_suffix('.json.tmp')
+            tmp_file.write_text(json.dumps(self.config, indent=2))
+            os.replace(tmp_file, self.config_file)
+
+    @contextmanager
+    def batch(self):
+        """Group configuration changes into a single transaction.
+        
+        Changes made inside the block are written once when it exits. If the
+        block raises, all of them are rolled back. Batches may be nested; only
+        the outermost one commits.
+        
+        Example:
+            with config_manager.batch():
+                for node_id, cert_path, key_path in nodes:
+                    config_manager.add_node(node_id, cert_path, key_path)
+        """
+        with self._lock:
+            if self._batch_depth:
+                self._batch_depth += 1
+                try:
+                    yield self
+                finally:
+                    self._batch_depth -= 1
+                return
+
+            snapshot = copy.deepcopy({key: value for key, value in self.config.items() if key != 'nodes'})
+            self._batch_depth = 1
+            self._dirty = False
+            self.nodes.begin()
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth = 0
+                self._dirty = False
+                self.nodes.rollback()
+                self.config.update(snapshot)
+                for key in set(self.config) - set(snapshot) - {'nodes'}:
+                    del self.config[key]
+                raise
+            self._batch_depth = 0
+            self.nodes.commit()
+            if self._dirty:
+                self._dirty = False
+                self._save()
 
     def _validate_node_paths(self):
         """Validate and update node certificate paths."""
@@ -60,6 +129,38 @@ class ConfigManager:
         if invalid_nodes:
             self._save()
 
+    def get_node_store(self) -> str:
+        """Get the active node storage backend name."""
+        return self.nodes.name
+
+    def set_node_store(self, backend: str) -> int:
+        """Move all node configurations to another storage backend.
+        
+        Returns:
+            int: Number of nodes migrated
+        """
+        if backend not in NODE_STORE_BACKENDS:
+            raise ValueError(f"Unknown node store '{backend}', expected one of: {', '.join(NODE_STORE_BACKENDS)}")
+        if backend == self.nodes.name:
+            return len(self.nodes.all())
+
+        with self._lock:
+            nodes = dict(self.nodes.all())
+            target = self._open_node_store(backend)
+            # Fill the new store in one write before switching over
+            target.put_many(nodes)
+
+            old = self.nodes
+            self.nodes = target
+            self.config['node_store'] = backend
+            if old.name == 'json':
+                self.config['nodes'] = {}
+            self._save()
+            if old.name == 'sqlite':
+                old.clear()
+            old.close()
+        return len(nodes)
+
     def set_broker(self, broker: str):
         """Set the MQTT broker URL."""
         self.config['broker'] = broker
@@ -69,6 +170,17 @@ class ConfigManager:
         """Get the current MQTT broker URL."""
         return self.config.get('broker', self.DEFAULT_BROKER)
 
+    def get_spool_settings(self) -> dict:
+        """Get offline publish spool settings, filled in with defaults."""
+        from ..core.spool import DEFAULT_SPOOL_SETTINGS
+        return {**DEFAULT_SPOOL_SETTINGS, **self.config.get('spool', {})}
+
+    def set_spool_settings(self, **settings):
+        """Update offline publish spool settings; None values are left unchanged."""
+        spool = self.config.setdefault('spool', {})
+        spool.update({key: value for key, value in settings.items() if value is not None})
+        self._save()
+
     def set_admin_cli_path(self, path: str):
         """Set the Nodes's Certs path."""
         self.config['admin_cli_path'] = str(Path(path).resolve())
@@ -88,15 +200,11 @@ class ConfigManager:
         if not key_path.exists():
             raise FileNotFoundError(f"Key file not found: {key_path}")
             
-        self.config['nodes'][node_id] = {
-            'cert_path': str(cert_path.resolve()),
-            'key_path': str(key_path.resolve())
-        }
-        self._save()
+        self.nodes.put(node_id, str(cert_path.resolve()), str(key_path.resolve()))
 
     def get_node_paths(self, node_id: str) -> Optional[Tuple[str, str]]:
         """Get certificate paths for a node."""
-        node_info = self.config['nodes'].get(node_id)
+        node_info = self.nodes.get(node_id)
         if node_info:
             cert_path = Path(node_info['cert_path'])
             key_path = Path(node_info['key_path'])
@@ -105,28 +213,27 @@ class ConfigManager:
                 return str(cert_path), str(key_path)
                 
             # Remove invalid node
-            del self.config['nodes'][node_id]
-            self._save()
+            self.nodes.delete(node_id)
             
         return None
 
     def list_nodes(self) -> Dict[str, dict]:
         """Get all configured nodes."""
-        return self.config['nodes']
+        return self.nodes.all()
 
     def remove_node(self, node_id: str) -> bool:
         """Remove a node's configuration."""
-        if node_id in self.config['nodes']:
-            del self.config['nodes'][node_id]
-            self._save()
-            return True
-        return False
+        return self.nodes.delete(node_id)
 
     def reset(self):
         """Reset configuration to defaults."""
+        self.nodes.clear()
+        self.nodes.close()
         self.config = {
             'broker': self.DEFAULT_BROKER,
             'nodes': {},
-            'admin_cli_path': None
+            'admin_cli_path': None,
+            'node_store': 'json'
         }
-        self._save() 
\ No newline at end of file
+        self.nodes = self._open_node_store('json')
+        self._save()
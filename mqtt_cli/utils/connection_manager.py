@@ -7,6 +7,8 @@ import logging
 from pathlib import Path
 from typing import Dict, Optional
 from ..mqtt_operations import MQTTOperations
+from ..core.spool import get_node_spool
+from .config_manager import ConfigManager
 
 class ConnectionManager:
     """Manages MQTT client connections and their persistence."""
@@ -44,7 +46,12 @@ class ConnectionManager:
         except Exception as e:
             self.logger.warning(f"Failed to save connection state: {str(e)}")
 
-    def add_connection(self, node_id: str, broker: str, cert_path: str, key_path: str, client: MQTTOperations):
+    def save(self):
+        """Write the state file, e.g. after add_connection(..., save=False) calls."""
+        self._save()
+
+    def add_connection(self, node_id: str, broker: str, cert_path: str, key_path: str, client: MQTTOperations,
+                       save: bool = True):
         """
         Add a new connection.
         
@@ -54,6 +61,8 @@ class ConnectionManager:
             cert_path: Path to the node certificate
             key_path: Path to the node key
             client: The connected MQTT client
+            save: Write the state file now; pass False when adding many
+                connections and call save() once afterwards
         """
         self.connections[node_id] = client
         self.connection_info[node_id] = {
@@ -62,7 +71,8 @@ class ConnectionManager:
             'key_path': str(key_path)
         }
         self.active_node = node_id
-        self._save()
+        if save:
+            self._save()
 
     def remove_connection(self, node_id: str) -> bool:
         """Remove a connection."""
@@ -96,7 +106,8 @@ class ConnectionManager:
                     broker=info['broker'],
                     node_id=node_id,
                     cert_path=info['cert_path'],
-                    key_path=info['key_path']
+                    key_path=info['key_path'],
+                    spool=get_node_spool(ConfigManager(self.config_dir), node_id)
                 )
                 if client.connect():
                     self.connections[node_id] = client
@@ -0,0 +1,152 @@
+"""
+Node certificate storage backends for MQTT CLI.
+
+Node configurations map node_id -> {'cert_path': str, 'key_path': str}.
+The 'json' backend keeps them embedded in config.json, which is simple but
+rewrites the whole file on every change. The 'sqlite' backend keeps them in
+nodes.db next to config.json and updates single rows, which scales to
+hundreds of thousands of nodes.
+"""
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+NODE_STORE_BACKENDS = ('json', 'sqlite')
+NODE_DB_NAME = 'nodes.db'
+
+
+class JsonNodeStore:
+    """Nodes embedded in the configuration dict and saved with config.json."""
+
+    name = 'json'
+
+    def __init__(self, config: dict, save):
+        self.nodes = config.setdefault('nodes', {})
+        self._save = save
+        self._snapshot = None
+
+    def get(self, node_id: str) -> Optional[dict]:
+        return self.nodes.get(node_id)
+
+    def put(self, node_id: str, cert_path: str, key_path: str):
+        self.nodes[node_id] = {'cert_path': cert_path, 'key_path': key_path}
+        self._save()
+
+    def put_many(self, nodes: Dict[str, dict]):
+        for node_id, info in nodes.items():
+            self.nodes[node_id] = {'cert_path': info['cert_path'], 'key_path': info['key_path']}
+        self._save()
+
+    def delete(self, node_id: str) -> bool:
+        if node_id in self.nodes:
+            del self.nodes[node_id]
+            self._save()
+            return True
+        return False
+
+    def all(self) -> Dict[str, dict]:
+        return self.nodes
+
+    def clear(self):
+        self.nodes.clear()
+        self._save()
+
+    def begin(self):
+        # Node entries are replaced, never mutated, so a shallow copy suffices
+        self._snapshot = dict(self.nodes)
+
+    def commit(self):
+        self._snapshot = None
+
+    def rollback(self):
+        if self._snapshot is not None:
+            self.nodes.clear()
+            self.nodes.update(self._snapshot)
+            self._snapshot = None
+
+    def close(self):
+        pass
+
+
+class SqliteNodeStore:
+    """Nodes stored one row per node in a SQLite database."""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._in_batch = False
+        self._db = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS nodes ("
+            "node_id TEXT PRIMARY KEY, cert_path TEXT NOT NULL, key_path TEXT NOT NULL)")
+        self._db.commit()
+
+    def _autocommit(self):
+        if not self._in_batch:
+            self._db.commit()
+
+    def get(self, node_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT cert_path, key_path FROM nodes WHERE node_id = ?", (node_id,)).fetchone()
+        if row:
+            return {'cert_path': row[0], 'key_path': row[1]}
+        return None
+
+    def put(self, node_id: str, cert_path: str, key_path: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO nodes (node_id, cert_path, key_path) VALUES (?, ?, ?)",
+                (node_id, cert_path, key_path))
+            self._autocommit()
+
+    def put_many(self, nodes: Dict[str, dict]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO nodes (node_id, cert_path, key_path) VALUES (?, ?, ?)",
+                [(node_id, info['cert_path'], info['key_path']) for node_id, info in nodes.items()])
+            self._autocommit()
+
+    def delete(self, node_id: str) -> bool:
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,)).rowcount > 0
+            self._autocommit()
+        return deleted
+
+    def all(self) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT node_id, cert_path, key_path FROM nodes ORDER BY node_id").fetchall()
+        return {node_id: {'cert_path': cert, 'key_path': key} for node_id, cert, key in rows}
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM nodes")
+            self._autocommit()
+
+    def begin(self):
+        self._lock.acquire()
+        self._in_batch = True
+
+    def commit(self):
+        try:
+            self._db.commit()
+        finally:
+            self._in_batch = False
+            self._lock.release()
+
+    def rollback(self):
+        try:
+            self._db.rollback()
+        finally:
+            self._in_batch = False
+            self._lock.release()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,160 @@
+"""
+Buffered message output for MQTT CLI.
+
+MQTT message callbacks run on the SDK's network thread, so they must not
+format or write anything: a slow terminal would stall the network loop and
+the broker would eventually drop us. MessageWriter takes raw messages on a
+bounded queue (counting drops when it is full) and formats and writes them
+in batches on its own thread.
+"""
+import json
+import queue
+import threading
+import time
+from typing import Optional, TextIO
+
+OUTPUT_FORMATS = ('pretty', 'raw', 'ndjson')
+DEFAULT_QUEUE_SIZE = 10000
+
+# Maximum number of queued messages formatted into a single write
+_BATCH_SIZE = 512
+_STOP = object()
+
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def format_message(fmt: str, timestamp: float, topic: str, payload) -> str:
+    """Format one message as a line (raw, ndjson) or block (pretty) of output."""
+    text = payload.decode('utf-8', errors='replace') if isinstance(payload, (bytes, bytearray)) else str(payload)
+    if fmt == 'raw':
+        return f"{topic} {text}\n"
+    if fmt == 'ndjson':
+        return (f'{{"ts":{timestamp:.3f},"topic":{json.dumps(topic)},'
+                f'"payload":{_ndjson_payload(text)}}}\n')
+
+    try:
+        # Try to parse and pretty print JSON
+        text = json.dumps(json.loads(text), indent=2)
+    except json.JSONDecodeError:
+        # Not JSON, use raw payload
+        pass
+    return f"\nTopic: {topic}\nMessage: {text}\n"
+
+
+def _ndjson_payload(text: str) -> str:
+    """Embed a JSON payload verbatim, otherwise as a JSON string."""
+    stripped = text.strip()
+    if stripped[:1] in ('{', '[') and '\n' not in stripped:
+        try:
+            # Validate only; the original bytes are written unchanged
+            json.loads(stripped)
+            return stripped
+        except json.JSONDecodeError:
+            pass
+    return json.dumps(text)
+
+
+class MessageWriter:
+    """Formats and writes received messages on a background thread."""
+
+    def __init__(self, stream: TextIO, fmt: str = 'pretty', queue_size: int = DEFAULT_QUEUE_SIZE):
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{fmt}'")
+        self.stream = stream
+        self.format = fmt
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+        self._lock = threading.Lock()
+        self._delays = []
+        self._interval_start = time.monotonic()
+        self._interval_received = 0
+        self.started = time.monotonic()
+        self.received = 0
+        self.written = 0
+        self.dropped = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, topic: str, payload: bytes) -> bool:
+        """Queue a message for output; safe to call from the MQTT callback thread.
+
+        Returns:
+            bool: False if the queue was full and the message was dropped
+        """
+        self.received += 1
+        try:
+            self._queue.put_nowait((time.monotonic(), time.time(), topic, payload))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Write out queued messages and stop the writer thread."""
+        if self._thread.is_alive():
+            # Block rather than drop the sentinel if the queue is full
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < _BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            lines = []
+            delays = []
+            for item in batch:
+                if item is _STOP:
+                    stop = True
+                    continue
+                received_at, timestamp, topic, payload = item
+                try:
+                    lines.append(self._format(timestamp, topic, payload))
+                except Exception as e:
+                    lines.append(f"Error processing message on {topic}: {str(e)}\n")
+                delays.append(time.monotonic() - received_at)
+
+            if lines:
+                self.stream.write(''.join(lines))
+                self.stream.flush()
+                with self._lock:
+                    self.written += len(lines)
+                    self._delays.extend(delays)
+            if stop:
+                return
+
+    def _format(self, timestamp: float, topic: str, payload: bytes) -> str:
+        return format_message(self.format, timestamp, topic, payload)
+
+    def take_stats(self) -> dict:
+        """Return throughput and write-delay stats since the previous call."""
+        now = time.monotonic()
+        with self._lock:
+            delays, self._delays = sorted(self._delays), []
+        elapsed = max(now - self._interval_start, 1e-9)
+        received = self.received
+        stats = {
+            'rate': (received - self._interval_received) / elapsed,
+            'received': received,
+            'written': self.written,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize(),
+        }
+        if delays:
+            stats.update({
+                'delay_p50_ms': _percentile(delays, 0.50) * 1000,
+                'delay_p95_ms': _percentile(delays, 0.95) * 1000,
+                'delay_max_ms': delays[-1] * 1000,
+            })
+        self._interval_start = now
+        self._interval_received = received
+        return stats
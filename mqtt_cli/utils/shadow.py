@@ -0,0 +1,123 @@
+"""
+Local parameter shadow for MQTT CLI.
+
+The shadow remembers, per node, device and parameter, the last value this
+CLI published on the node's params/local topics and the last value seen
+on params/remote (set from the cloud). The newer of the two is taken as
+the current value, which lets `node params --delta` publish only the
+parameters that actually changed and skip nodes with nothing to send.
+
+Values are kept as canonical JSON in shadow.db next to config.json, one
+row per parameter, so lookups and updates stay cheap for many nodes.
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+SHADOW_DB_NAME = 'shadow.db'
+
+
+def _canonical(value) -> str:
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+class ParamShadow:
+    """Last published and last reported parameter values per node."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS params ("
+            "node_id TEXT NOT NULL, device TEXT NOT NULL, param TEXT NOT NULL, "
+            "published TEXT, published_at REAL, reported TEXT, reported_at REAL, "
+            "PRIMARY KEY (node_id, device, param))")
+        self._db.commit()
+
+    def _rows(self, node_id: str):
+        with self._lock:
+            return self._db.execute(
+                "SELECT device, param, published, published_at, reported, reported_at "
+                "FROM params WHERE node_id = ? ORDER BY device, param", (node_id,)).fetchall()
+
+    def state(self, node_id: str) -> Dict[str, Dict[str, object]]:
+        """Current values as {device: {param: value}}, the newer of published and reported."""
+        current = {}
+        for device, param, published, published_at, reported, reported_at in self._rows(node_id):
+            if reported_at is not None and (published_at is None or reported_at > published_at):
+                value = reported
+            else:
+                value = published
+            current.setdefault(device, {})[param] = json.loads(value)
+        return current
+
+    def entries(self, node_id: str) -> list:
+        """Rows as dicts with both values and their timestamps, for display."""
+        return [{'device': device, 'param': param,
+                 'published': json.loads(published) if published is not None else None,
+                 'published_at': published_at,
+                 'reported': json.loads(reported) if reported is not None else None,
+                 'reported_at': reported_at}
+                for device, param, published, published_at, reported, reported_at in self._rows(node_id)]
+
+    def delta(self, node_id: str, payload: dict) -> dict:
+        """The parts of a {device: {param: value}} payload that differ from the shadow.
+
+        Devices left without changed parameters are dropped, so an empty
+        dict means publishing the payload would be a no-op.
+        """
+        current = self.state(node_id)
+        changed = {}
+        for device, params in payload.items():
+            known = current.get(device, {})
+            device_changes = {name: value for name, value in params.items()
+                              if name not in known or _canonical(known[name]) != _canonical(value)}
+            if device_changes:
+                changed[device] = device_changes
+        return changed
+
+    def _record(self, column: str, node_id: str, payload: dict, at: Optional[float]):
+        at = time.time() if at is None else at
+        rows = [(node_id, device, name, _canonical(value), at)
+                for device, params in payload.items() if isinstance(params, dict)
+                for name, value in params.items()]
+        with self._lock:
+            self._db.executemany(
+                f"INSERT INTO params (node_id, device, param, {column}, {column}_at) VALUES (?, ?, ?, ?, ?) "
+                f"ON CONFLICT (node_id, device, param) DO UPDATE SET "
+                f"{column} = excluded.{column}, {column}_at = excluded.{column}_at", rows)
+            self._db.commit()
+
+    def record_published(self, node_id: str, payload: dict, at: Optional[float] = None):
+        """Remember a payload this CLI published for the node."""
+        self._record('published', node_id, payload, at)
+
+    def record_reported(self, node_id: str, payload: dict, at: Optional[float] = None):
+        """Remember a payload received for the node on params/remote."""
+        self._record('reported', node_id, payload, at)
+
+    def clear(self, node_id: Optional[str] = None) -> int:
+        """Forget one node, or every node; returns the number of parameters removed."""
+        with self._lock:
+            if node_id is None:
+                removed = self._db.execute("DELETE FROM params").rowcount
+            else:
+                removed = self._db.execute("DELETE FROM params WHERE node_id = ?", (node_id,)).rowcount
+            self._db.commit()
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_shadow(ctx) -> ParamShadow:
+    """The parameter shadow in the CLI's configuration directory."""
+    return ParamShadow(Path(ctx.obj['CONFIG_DIR']) / SHADOW_DB_NAME)
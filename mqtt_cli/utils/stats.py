@@ -0,0 +1,243 @@
+"""
+Client-side latency statistics for MQTT CLI.
+
+LatencyHistogram is an HDR-style histogram: values are recorded in
+microseconds into log-linear buckets (exact below 64 us, then 32 buckets
+per power of two), so recording is O(1), memory stays small and any
+percentile is accurate to about 3% over the full range.
+
+Every MQTTOperations owns a ClientStats and registers it here;
+collect_stats() merges the registered clients for `rmnode stats` and the
+`--stats` exit dump. A closed client's stats are folded into a per-node
+total, so long-running processes that create many clients keep one entry
+per node rather than one per client.
+"""
+import json
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Dict, Optional
+
+STATS_FILE_NAME = 'stats.json'
+
+# Buckets per power of two are 2 ** (_SUB_BUCKET_BITS - 1)
+_SUB_BUCKET_BITS = 6
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+_HALF_SUB_BUCKETS = _SUB_BUCKETS // 2
+
+# Distinct publish topics tracked per client before they are pooled
+MAX_TOPICS = 64
+OTHER_TOPICS = '(other)'
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def _bucket_index(value: int) -> int:
+    if value < _SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - _SUB_BUCKET_BITS
+    return _SUB_BUCKETS + (shift - 1) * _HALF_SUB_BUCKETS + (value >> shift) - _HALF_SUB_BUCKETS
+
+
+def _bucket_range(index: int):
+    """Lowest and highest value that fall into a bucket."""
+    if index < _SUB_BUCKETS:
+        return index, index
+    shift = (index - _SUB_BUCKETS) // _HALF_SUB_BUCKETS + 1
+    mantissa = (index - _SUB_BUCKETS) % _HALF_SUB_BUCKETS + _HALF_SUB_BUCKETS
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Log-linear histogram of durations, stored in microseconds."""
+
+    def __init__(self):
+        self._buckets: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def record(self, seconds: float):
+        """Record one duration given in seconds."""
+        value = max(0, int(seconds * 1_000_000))
+        index = _bucket_index(value)
+        with self._lock:
+            self._buckets[index] = self._buckets.get(index, 0) + 1
+            self.count += 1
+            self.total_us += value
+            if self.min_us is None or value < self.min_us:
+                self.min_us = value
+            if value > self.max_us:
+                self.max_us = value
+
+    def merge(self, other: 'LatencyHistogram'):
+        """Add the samples of another histogram to this one."""
+        with other._lock:
+            buckets = dict(other._buckets)
+            count, total, low, high = other.count, other.total_us, other.min_us, other.max_us
+        if not count:
+            return
+        with self._lock:
+            for index, n in buckets.items():
+                self._buckets[index] = self._buckets.get(index, 0) + n
+            self.count += count
+            self.total_us += total
+            self.min_us = low if self.min_us is None else min(self.min_us, low)
+            self.max_us = max(self.max_us, high)
+
+    def percentile(self, p: float) -> float:
+        """Value at percentile p (0-100) in milliseconds."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            target = max(1, int(round(p / 100 * self.count)))
+            seen = 0
+            for index in sorted(self._buckets):
+                seen += self._buckets[index]
+                if seen >= target:
+                    low, high = _bucket_range(index)
+                    # Report the bucket midpoint, clamped to the observed range
+                    value = min(max((low + high) / 2, self.min_us), self.max_us)
+                    return value / 1000
+            return self.max_us / 1000
+
+    def to_dict(self) -> dict:
+        """Summary in milliseconds plus the raw buckets for merging."""
+        summary = {
+            'count': self.count,
+            'mean_ms': self.total_us / self.count / 1000 if self.count else 0.0,
+            'min_ms': (self.min_us or 0) / 1000,
+            'max_ms': self.max_us / 1000,
+        }
+        for p in PERCENTILES:
+            summary[f"p{p:g}_ms"] = self.percentile(p)
+        with self._lock:
+            summary['buckets'] = {str(index): n for index, n in sorted(self._buckets.items())}
+        return summary
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LatencyHistogram':
+        histogram = cls()
+        histogram._buckets = {int(index): n for index, n in data.get('buckets', {}).items()}
+        histogram.count = data.get('count', 0)
+        histogram.total_us = int(data.get('mean_ms', 0) * 1000 * histogram.count)
+        histogram.min_us = int(data.get('min_ms', 0) * 1000) if histogram.count else None
+        histogram.max_us = int(data.get('max_ms', 0) * 1000)
+        return histogram
+
+
+class ClientStats:
+    """Latency histograms and event counters for one MQTT connection."""
+
+    def __init__(self, node_id: str):
+        self.node_id = node_id
+        self.connect = LatencyHistogram()
+        self.subscribe = LatencyHistogram()
+        self.callback = LatencyHistogram()
+        self.keepalive = LatencyHistogram()  # PINGREQ to PINGRESP
+        self.publish: Dict[str, LatencyHistogram] = {}
+        self.counters = {'reconnects': 0, 'disconnects': 0, 'publish_errors': 0}
+        self._lock = threading.Lock()
+
+    def _topic_key(self, topic: str) -> str:
+        # Per-node topics aggregate across nodes with the node ID wildcarded
+        return topic.replace(self.node_id, '+') if self.node_id else topic
+
+    def record_publish(self, topic: str, seconds: float):
+        """Record publish-to-PUBACK time for a topic."""
+        key = self._topic_key(topic)
+        histogram = self.publish.get(key)
+        if histogram is None:
+            with self._lock:
+                if key not in self.publish and len(self.publish) >= MAX_TOPICS:
+                    key = OTHER_TOPICS
+                histogram = self.publish.setdefault(key, LatencyHistogram())
+        histogram.record(seconds)
+
+    def increment(self, counter: str, amount: int = 1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def merge(self, other: 'ClientStats'):
+        """Add another client's histograms and counters to these."""
+        self.connect.merge(other.connect)
+        self.subscribe.merge(other.subscribe)
+        self.callback.merge(other.callback)
+        self.keepalive.merge(other.keepalive)
+        for topic, histogram in list(other.publish.items()):
+            self.publish.setdefault(topic, LatencyHistogram()).merge(histogram)
+        for counter, value in dict(other.counters).items():
+            self.increment(counter, value)
+
+    def to_dict(self) -> dict:
+        return {
+            'connect': self.connect.to_dict(),
+            'subscribe': self.subscribe.to_dict(),
+            'callback': self.callback.to_dict(),
+            'keepalive': self.keepalive.to_dict(),
+            'publish': {topic: histogram.to_dict() for topic, histogram in sorted(self.publish.items())},
+            'counters': dict(self.counters),
+        }
+
+
+# Stats of live clients, and per-node totals of clients that are gone
+_registry = set()
+_retired: Dict[str, ClientStats] = {}
+_registry_lock = threading.Lock()
+
+
+def register_client_stats(stats: ClientStats, owner=None):
+    """Include a client's stats in collect_stats().
+
+    If an owner is given, the stats are retired when it is garbage
+    collected, in case it is dropped without unregister_client_stats().
+    """
+    with _registry_lock:
+        _registry.add(stats)
+    if owner is not None:
+        weakref.finalize(owner, unregister_client_stats, stats)
+
+
+def unregister_client_stats(stats: ClientStats):
+    """Fold a finished client's stats into its node's total; safe to call twice."""
+    with _registry_lock:
+        if stats not in _registry:
+            return
+        _registry.discard(stats)
+        retired = _retired.get(stats.node_id)
+        if retired is None:
+            retired = _retired[stats.node_id] = ClientStats(stats.node_id)
+        retired.merge(stats)
+
+
+def collect_stats() -> dict:
+    """Merge the stats of every client created in this process, per node."""
+    with _registry_lock:
+        registered = list(_retired.values()) + list(_registry)
+    nodes: Dict[str, ClientStats] = {}
+    for stats in registered:
+        nodes.setdefault(stats.node_id, ClientStats(stats.node_id)).merge(stats)
+    return {
+        'collected_at': time.time(),
+        'nodes': {node_id: stats.to_dict() for node_id, stats in sorted(nodes.items())},
+    }
+
+
+def save_stats(stats: dict, config_dir) -> Path:
+    """Write a stats dump to the configuration directory."""
+    path = Path(config_dir) / STATS_FILE_NAME
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2)
+    return path
+
+
+def load_stats(config_dir) -> Optional[dict]:
+    """Load the last stats dump, or None if there is none."""
+    try:
+        with open(Path(config_dir) / STATS_FILE_NAME) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
@@ -9,6 +9,10 @@ setup(
         "paho-mqtt>=1.5.0",
         "AWSIoTPythonSDK>=1.5.0"
     ],
+    extras_require={
+        # Faster value conversion for large tsdata batches
+        'fast': ["numpy>=1.20"],
+    },
     entry_points={
         'console_scripts': [
             'rmnode=mqtt_cli.cli:cli',